@@ -13,16 +13,67 @@ class AppSettings(BaseSettings):
         service_name (str): The name of the service.
         port (int): The port number the App is listening on.
         workers (int): The number of workers the App is using.
+        preload (bool): Whether gunicorn loads the App once in its master process before forking the workers,
+            which then share the model and the venue tables copy-on-write, see `gunicorn_conf.py`.
         folder (str): The folder location for the App.
         weights (str): The weights of the App.
+        download (bool): Whether to download the weights from the object storage, or to use the ones in the folder.
+        create_tables (bool): Whether to create the missing database tables on startup.
+        backend (str): The inference backend scoring the venues: "catboost", "evaluator" or "oblivious".
+        cache_size (int): The maximum number of venues kept in the in-process venue cache.
+        cache_ttl (Optional[float]): The time to live of a cached venue in seconds, no expiration if not set.
+        cache_preload (bool): Whether to load the whole `info` table into the venue cache on startup.
+        venues_csv (Optional[str]): The CSV dump of the `info` table to read instead of the database.
+        venues_snapshot (Optional[str]): The binary snapshot of the `info` table, see `src/snapshot.py`,
+            memory-mapped and looked up before the venue cache and the database.
+        async_mode (bool): Whether to serve the scoring endpoints from the event loop with an async database driver.
+        inference_workers (int): The number of threads running the ranker in the async mode.
+        batching (bool): Whether to coalesce concurrent calls of the ranker into micro-batches.
+        batch_wait_us (int): The longest time in microseconds a request waits for others to fill a micro-batch.
+        batch_max_rows (int): The number of rows after which a micro-batch is scored without waiting any longer.
+        coalescing (bool): Whether to merge the venue lookups of concurrent requests into shared database queries.
+        coalesce_wait_us (int): The time in microseconds a database query waits for the venue ids of other requests.
+        profiler (bool): Whether to expose the endpoints starting and stopping the sampling profiler.
+        fast_response (bool): Whether to serialize the rankings straight to JSON, skipping the response models.
+        latency_budget_ms (Optional[float]): The time in milliseconds a scoring request waits for the database and
+            the ranker before it is answered with fallback features or in the input order, no limit if not set.
+        score_cache (bool): Whether to memoize the predicted scores of each venue and combination of the flags.
+        score_cache_size (int): The maximum number of venues kept in the score cache.
+        score_table (bool): Whether to score the whole `info` table under every combination of the flags ahead of
+            the requests, the venues missing from it are scored live.
+        reload_interval (Optional[float]): The time in seconds between two checks of the published weights,
+            which are swapped in without a restart when they change, the weights are not watched if not set.
 
     """
 
     service_name: str = "app"
     port: int = 1111
     workers: int = 1
+    preload: bool = False
     folder: str
     weights: str
+    download: bool = True
+    create_tables: bool = True
+    backend: str = "catboost"
+    cache_size: int = 100_000
+    cache_ttl: Optional[float]
+    cache_preload: bool = False
+    venues_csv: Optional[str]
+    venues_snapshot: Optional[str]
+    async_mode: bool = False
+    inference_workers: int = 1
+    batching: bool = False
+    batch_wait_us: int = 1000
+    batch_max_rows: int = 4096
+    coalescing: bool = False
+    coalesce_wait_us: int = 500
+    profiler: bool = False
+    fast_response: bool = False
+    latency_budget_ms: Optional[float]
+    score_cache: bool = False
+    score_cache_size: int = 100_000
+    score_table: bool = False
+    reload_interval: Optional[float]
 
     class Config:
         env_prefix = "APP_"
@@ -34,21 +85,36 @@ class DatabaseSettings(BaseSettings):
     Attributes:
         service_name (str): The name of the service.
         driver (str): The driver for the database.
+        async_driver (str): The driver for the database used in the async mode of the App.
         database (str): The name of the database.
         password (str): The password for the database.
         user (str): The user for the database.
         host (str): The host of the database.
         port (int): The port number of the database.
+        url (Optional[str]): The full URL of the database, overriding the settings above, e.g. `sqlite:///venues.db`.
+        async_url (Optional[str]): The full URL of the database used in the async mode of the App.
+        pool_size (int): The number of connections kept open in the pool of each engine.
+        max_overflow (int): The number of connections opened beyond `pool_size` under load, closed when returned.
+        pool_pre_ping (bool): Whether to test a connection before handing it out, replacing the dropped ones.
+        pool_recycle (int): The age of a connection in seconds after which it is replaced, below the `wait_timeout`
+            of the MySQL server, -1 to never replace the connections.
 
     """
 
     service_name: str = "db"
     driver: str = "mysql"
+    async_driver: str = "mysql+aiomysql"
     database: str = "venues"
     password: str = "localpassword"
     user: str = "localuser"
     host: str = "localhost"
     port: int = 3306
+    url: Optional[str]
+    async_url: Optional[str]
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_pre_ping: bool = True
+    pool_recycle: int = 3600
 
     class Config:
         env_prefix = "MYSQL_"
@@ -0,0 +1,30 @@
+import gc
+import os
+
+from config import settings
+
+# Picked up by the start script of the `uvicorn-gunicorn-fastapi` image in place of its default configuration
+bind = os.environ.get("BIND", f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '80')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", settings.app.workers))
+worker_class = "uvicorn.workers.UvicornWorker"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+keepalive = 120
+
+# In the preload mode the App, with its model, venue tables and caches, is imported once by the master process,
+# and the forked workers share its memory pages copy-on-write instead of loading their own copy
+preload_app = settings.app.preload
+
+
+def when_ready(server):
+    # move the objects of the loaded App out of the garbage collector's reach, so the collections in the workers
+    # do not write to the shared pages, see https://docs.python.org/3/library/gc.html#gc.freeze
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # the connections opened by the master process must not be used by several workers
+    if preload_app:
+        from src.helpers import on_fork
+
+        on_fork()
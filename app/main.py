@@ -1,63 +1,407 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from catboost import CatBoostRanker
-from fastapi import Depends, FastAPI
+from config import settings
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import confloat, conint
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src import models
-from src.helpers import rows_to_dict, engine, get_db, get_ranker, get_venues, on_startup
-from src.schemas import InputVenue, PingResponse, PredictResponse
+from src.backends import RankerBackend
+from src.batching import MicroBatcher
+from src.budget import Budget
+from src.cache import ScoreCache, VenueCache
+from src.coalescing import VenueCoalescer
+from src.features import encode_groups, encode_venues
+from src.helpers import (
+    engine,
+    get_async_db,
+    get_budget,
+    get_cache,
+    get_coalescer,
+    get_db,
+    get_executor,
+    get_ranker,
+    get_score_cache,
+    get_score_table,
+    get_snapshot,
+    on_shutdown,
+    on_startup,
+    refresh_venues,
+    score_venues,
+    score_venues_async,
+    start_threads,
+)
+from src.metrics import REGISTRY, REQUEST_VENUES, startup_phase
+from src.profiler import SamplingProfiler
+from src.ranking import rank_groups, rank_groups_fast, rank_venues, rank_venues_fast
+from src.scores import ScoreTable
+from src.schemas import (
+    BatchingStatsResponse,
+    CacheStatsResponse,
+    InputVenue,
+    PingResponse,
+    PredictGroup,
+    PredictResponse,
+    RefreshResponse,
+)
+from src.snapshot import Snapshot
 
 __version__ = "0.0.0"
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("api")
 
-# create the database tables based on the models
-models.Base.metadata.create_all(bind=engine)
+# create the database tables based on the models, unless they are known to exist
+if settings.app.create_tables:
+    with startup_phase("create_tables").time():
+        models.Base.metadata.create_all(bind=engine)
 
 # create a FastAPI application
 app = FastAPI(title="venues-ranker", version=__version__)
 
 
-@app.post("/predict", response_model=PredictResponse)
+# the rankings are either validated by the response models or, on the fast path, serialized straight to JSON
+if settings.app.fast_response:
+    respond, respond_groups = rank_venues_fast, rank_groups_fast
+else:
+    respond, respond_groups = rank_venues, rank_groups
+
+
+@app.on_event("startup")
+async def startup():
+    """Start the background threads of the App in the worker process, see `start_threads`."""
+    start_threads(app)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release the resources of the App, see `on_shutdown`."""
+    await on_shutdown(app)
+
+
 def predict(
     is_new_user: bool,
     venues: list[InputVenue],
+    top_k: Optional[conint(ge=1)] = None,
     db: Session = Depends(get_db),  # get a database session using a dependency
-    ranker: CatBoostRanker = Depends(get_ranker),  # get a CatBoostRanker model using a dependency
+    ranker: RankerBackend = Depends(get_ranker),  # get the ranker inference backend using a dependency
+    cache: VenueCache = Depends(get_cache),  # get the in-process venue cache using a dependency
+    score_cache: Optional[ScoreCache] = Depends(get_score_cache),  # get the in-process score cache using a dependency
+    snapshot: Optional[Snapshot] = Depends(get_snapshot),  # get the memory-mapped venue snapshot using a dependency
+    coalescer: Optional[VenueCoalescer] = Depends(get_coalescer),  # get the venue lookup coalescer using a dependency
+    score_table: Optional[ScoreTable] = Depends(get_score_table),  # get the precomputed score table using a dependency
+    budget: Budget = Depends(get_budget),  # start the latency budget of the request using a dependency
 ):
     """Predict the ranking score of a list of venues.
 
     Arguments:
         is_new_user (bool): Whether the user is new or returning.
         venues (list[InputVenue]): A list of InputVenue objects.
+        top_k (Optional[int]): The number of best venues to return, all of them if not set (default: {None}).
 
     Keyword Arguments:
         db (Session): A database session (default: {Depends(get_db)}).
-        ranker (CatBoostRanker): A CatBoostRanker model (default: {Depends(get_ranker)}).
+        ranker (RankerBackend): The ranker inference backend (default: {Depends(get_ranker)}).
+        cache (VenueCache): The in-process venue cache (default: {Depends(get_cache)}).
+        score_cache (Optional[ScoreCache]): The in-process score cache (default: {Depends(get_score_cache)}).
+        snapshot (Optional[Snapshot]): The memory-mapped venue snapshot (default: {Depends(get_snapshot)}).
+        coalescer (Optional[VenueCoalescer]): The venue lookup coalescer (default: {Depends(get_coalescer)}).
+        score_table (Optional[ScoreTable]): The precomputed score table (default: {Depends(get_score_table)}).
+        budget (Budget): The latency budget of the request (default: {Depends(get_budget)}).
+
+    Returns:
+        PredictResponse: A response containing a list of venues sorted by their predicted score.
+    """
+    REQUEST_VENUES.observe(len(venues))
+    venue_ids, flags = encode_venues(venues)
+
+    # gather the precomputed scores of the venues, or retrieve data about the venues from the cache,
+    # going to the database only for cache misses, and predict their score using the ranker model
+    predictions, degraded = score_venues(
+        db, ranker, cache, snapshot, coalescer, score_cache, score_table, venue_ids, is_new_user, flags, budget
+    )
+
+    # return the venues and their scores, sorted by score in descending order, only the best ones if top_k is set
+    return respond(venue_ids, predictions, top_k, degraded.any())
+
+
+async def predict_async(
+    is_new_user: bool,
+    venues: list[InputVenue],
+    top_k: Optional[conint(ge=1)] = None,
+    db: AsyncSession = Depends(get_async_db),  # get an async database session using a dependency
+    ranker: RankerBackend = Depends(get_ranker),  # get the ranker inference backend using a dependency
+    cache: VenueCache = Depends(get_cache),  # get the in-process venue cache using a dependency
+    score_cache: Optional[ScoreCache] = Depends(get_score_cache),  # get the in-process score cache using a dependency
+    snapshot: Optional[Snapshot] = Depends(get_snapshot),  # get the memory-mapped venue snapshot using a dependency
+    coalescer: Optional[VenueCoalescer] = Depends(get_coalescer),  # get the venue lookup coalescer using a dependency
+    score_table: Optional[ScoreTable] = Depends(get_score_table),  # get the precomputed score table using a dependency
+    budget: Budget = Depends(get_budget),  # start the latency budget of the request using a dependency
+    executor: ThreadPoolExecutor = Depends(get_executor),  # get the ranker thread pool using a dependency
+):
+    """Predict the ranking score of a list of venues from the event loop.
+
+    The database is queried with the async driver and the ranker runs in the bounded thread pool,
+    so the event loop keeps serving other requests while this one waits for either of them.
+
+    Arguments:
+        is_new_user (bool): Whether the user is new or returning.
+        venues (list[InputVenue]): A list of InputVenue objects.
+        top_k (Optional[int]): The number of best venues to return, all of them if not set (default: {None}).
+
+    Keyword Arguments:
+        db (AsyncSession): An async database session (default: {Depends(get_async_db)}).
+        ranker (RankerBackend): The ranker inference backend (default: {Depends(get_ranker)}).
+        cache (VenueCache): The in-process venue cache (default: {Depends(get_cache)}).
+        score_cache (Optional[ScoreCache]): The in-process score cache (default: {Depends(get_score_cache)}).
+        snapshot (Optional[Snapshot]): The memory-mapped venue snapshot (default: {Depends(get_snapshot)}).
+        coalescer (Optional[VenueCoalescer]): The venue lookup coalescer (default: {Depends(get_coalescer)}).
+        score_table (Optional[ScoreTable]): The precomputed score table (default: {Depends(get_score_table)}).
+        budget (Budget): The latency budget of the request (default: {Depends(get_budget)}).
+        executor (ThreadPoolExecutor): The thread pool running the ranker (default: {Depends(get_executor)}).
 
     Returns:
         PredictResponse: A response containing a list of venues sorted by their predicted score.
     """
-    # retrieve data about the venues from the database
-    sql_rows = get_venues(db, [venue.venue_id for venue in venues])
-    sql_dict = rows_to_dict(sql_rows)
-
-    # create input data for the ranker model
-    data = [
-        [is_new_user, venue.is_from_order_again, venue.is_recommended] + sql_dict[venue.venue_id] for venue in venues
-    ]
-
-    # predict the score for each venue using the ranker model
-    predictions = ranker.predict(data).tolist()
-
-    # return the venues and their scores, sorted by score in descending order
-    venues_and_scores = [
-        {"venue_id": venue.venue_id, "score": prediction} for venue, prediction in zip(venues, predictions)
-    ]
-    venues_and_scores.sort(key=lambda x: x["score"], reverse=True)
-    return PredictResponse(venues_and_scores=venues_and_scores)
+    REQUEST_VENUES.observe(len(venues))
+    venue_ids, flags = encode_venues(venues)
+    predictions, degraded = await score_venues_async(
+        db,
+        ranker,
+        executor,
+        cache,
+        snapshot,
+        coalescer,
+        score_cache,
+        score_table,
+        venue_ids,
+        is_new_user,
+        flags,
+        budget,
+    )
+    return respond(venue_ids, predictions, top_k, degraded.any())
+
+
+def predict_batch(
+    groups: list[PredictGroup],
+    top_k: Optional[conint(ge=1)] = None,
+    db: Session = Depends(get_db),  # get a database session using a dependency
+    ranker: RankerBackend = Depends(get_ranker),  # get the ranker inference backend using a dependency
+    cache: VenueCache = Depends(get_cache),  # get the in-process venue cache using a dependency
+    score_cache: Optional[ScoreCache] = Depends(get_score_cache),  # get the in-process score cache using a dependency
+    snapshot: Optional[Snapshot] = Depends(get_snapshot),  # get the memory-mapped venue snapshot using a dependency
+    coalescer: Optional[VenueCoalescer] = Depends(get_coalescer),  # get the venue lookup coalescer using a dependency
+    score_table: Optional[ScoreTable] = Depends(get_score_table),  # get the precomputed score table using a dependency
+    budget: Budget = Depends(get_budget),  # start the latency budget of the request using a dependency
+):
+    """Predict the ranking score of the venues of several user sessions with one call of the ranker.
+
+    Arguments:
+        groups (list[PredictGroup]): A list of PredictGroup objects, one per user session.
+        top_k (Optional[int]): The number of best venues to return per group, all of them if not set (default: {None}).
+
+    Keyword Arguments:
+        db (Session): A database session (default: {Depends(get_db)}).
+        ranker (RankerBackend): The ranker inference backend (default: {Depends(get_ranker)}).
+        cache (VenueCache): The in-process venue cache (default: {Depends(get_cache)}).
+        score_cache (Optional[ScoreCache]): The in-process score cache (default: {Depends(get_score_cache)}).
+        snapshot (Optional[Snapshot]): The memory-mapped venue snapshot (default: {Depends(get_snapshot)}).
+        coalescer (Optional[VenueCoalescer]): The venue lookup coalescer (default: {Depends(get_coalescer)}).
+        score_table (Optional[ScoreTable]): The precomputed score table (default: {Depends(get_score_table)}).
+        budget (Budget): The latency budget of the request (default: {Depends(get_budget)}).
+
+    Returns:
+        list[PredictResponse]: One response per group, containing its venues sorted by their predicted score.
+    """
+    venue_ids, flags, is_new_user, sizes = encode_groups(groups)
+    REQUEST_VENUES.observe(len(venue_ids))
+    if len(venue_ids) == 0:
+        return [PredictResponse(venues_and_scores=[]) for _ in groups]
+
+    # score all the groups at once, retrieving data about each distinct venue only once and calling the ranker once
+    predictions, degraded = score_venues(
+        db, ranker, cache, snapshot, coalescer, score_cache, score_table, venue_ids, is_new_user, flags, budget
+    )
+
+    # split the scores back into the groups and sort each group by score in descending order
+    return respond_groups(venue_ids, predictions, sizes, top_k, degraded)
+
+
+async def predict_batch_async(
+    groups: list[PredictGroup],
+    top_k: Optional[conint(ge=1)] = None,
+    db: AsyncSession = Depends(get_async_db),  # get an async database session using a dependency
+    ranker: RankerBackend = Depends(get_ranker),  # get the ranker inference backend using a dependency
+    cache: VenueCache = Depends(get_cache),  # get the in-process venue cache using a dependency
+    score_cache: Optional[ScoreCache] = Depends(get_score_cache),  # get the in-process score cache using a dependency
+    snapshot: Optional[Snapshot] = Depends(get_snapshot),  # get the memory-mapped venue snapshot using a dependency
+    coalescer: Optional[VenueCoalescer] = Depends(get_coalescer),  # get the venue lookup coalescer using a dependency
+    score_table: Optional[ScoreTable] = Depends(get_score_table),  # get the precomputed score table using a dependency
+    budget: Budget = Depends(get_budget),  # start the latency budget of the request using a dependency
+    executor: ThreadPoolExecutor = Depends(get_executor),  # get the ranker thread pool using a dependency
+):
+    """Predict the ranking score of the venues of several user sessions from the event loop.
+
+    Arguments:
+        groups (list[PredictGroup]): A list of PredictGroup objects, one per user session.
+        top_k (Optional[int]): The number of best venues to return per group, all of them if not set (default: {None}).
+
+    Keyword Arguments:
+        db (AsyncSession): An async database session (default: {Depends(get_async_db)}).
+        ranker (RankerBackend): The ranker inference backend (default: {Depends(get_ranker)}).
+        cache (VenueCache): The in-process venue cache (default: {Depends(get_cache)}).
+        score_cache (Optional[ScoreCache]): The in-process score cache (default: {Depends(get_score_cache)}).
+        snapshot (Optional[Snapshot]): The memory-mapped venue snapshot (default: {Depends(get_snapshot)}).
+        coalescer (Optional[VenueCoalescer]): The venue lookup coalescer (default: {Depends(get_coalescer)}).
+        score_table (Optional[ScoreTable]): The precomputed score table (default: {Depends(get_score_table)}).
+        budget (Budget): The latency budget of the request (default: {Depends(get_budget)}).
+        executor (ThreadPoolExecutor): The thread pool running the ranker (default: {Depends(get_executor)}).
+
+    Returns:
+        list[PredictResponse]: One response per group, containing its venues sorted by their predicted score.
+    """
+    venue_ids, flags, is_new_user, sizes = encode_groups(groups)
+    REQUEST_VENUES.observe(len(venue_ids))
+    if len(venue_ids) == 0:
+        return [PredictResponse(venues_and_scores=[]) for _ in groups]
+    predictions, degraded = await score_venues_async(
+        db,
+        ranker,
+        executor,
+        cache,
+        snapshot,
+        coalescer,
+        score_cache,
+        score_table,
+        venue_ids,
+        is_new_user,
+        flags,
+        budget,
+    )
+    return respond_groups(venue_ids, predictions, sizes, top_k, degraded)
+
+
+# serve the scoring endpoints either from the thread pool of the server or, in the async mode, from the event loop
+if settings.app.async_mode:
+    app.post("/predict", response_model=PredictResponse)(predict_async)
+    app.post("/predict_batch", response_model=list[PredictResponse])(predict_batch_async)
+else:
+    app.post("/predict", response_model=PredictResponse)(predict)
+    app.post("/predict_batch", response_model=list[PredictResponse])(predict_batch)
+
+
+@app.post("/venues/refresh", response_model=RefreshResponse)
+def venues_refresh():
+    """Reload the `info` table, dropping the cached venues and scores, mapping the venue snapshot again if it is enabled
+    and rebuilding the score table if it is enabled.
+
+    Returns:
+        RefreshResponse: A response containing the number of reloaded venues.
+    """
+    return {"venues": refresh_venues(app)}
+
+
+@app.get("/cache/stats", response_model=CacheStatsResponse)
+def cache_stats(cache: VenueCache = Depends(get_cache)):
+    """Report the counters of the in-process venue cache.
+
+    Keyword Arguments:
+        cache (VenueCache): The in-process venue cache (default: {Depends(get_cache)}).
+
+    Returns:
+        CacheStatsResponse: A response containing the size, hits, misses and evictions of the cache.
+    """
+    return cache.stats()
+
+
+@app.get("/cache/scores/stats", response_model=CacheStatsResponse)
+def score_cache_stats(score_cache: Optional[ScoreCache] = Depends(get_score_cache)):
+    """Report the counters of the in-process score cache.
+
+    Keyword Arguments:
+        score_cache (Optional[ScoreCache]): The in-process score cache (default: {Depends(get_score_cache)}).
+
+    Raises:
+        HTTPException: If the score cache is not enabled.
+
+    Returns:
+        CacheStatsResponse: A response containing the size, hits, misses and evictions of the cache.
+    """
+    if score_cache is None:
+        raise HTTPException(status_code=404, detail="Score cache is not enabled")
+    return score_cache.stats()
+
+
+@app.get("/batching/stats", response_model=BatchingStatsResponse)
+def batching_stats(ranker: RankerBackend = Depends(get_ranker)):
+    """Report the histograms of the micro-batcher.
+
+    Keyword Arguments:
+        ranker (RankerBackend): The ranker, wrapped into a MicroBatcher if batching is enabled
+            (default: {Depends(get_ranker)}).
+
+    Raises:
+        HTTPException: If batching is not enabled.
+
+    Returns:
+        BatchingStatsResponse: A response containing the batch size and queue wait histograms.
+    """
+    if not isinstance(ranker, MicroBatcher):
+        raise HTTPException(status_code=404, detail="Batching is not enabled")
+    return ranker.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Expose the metrics of the App.
+
+    Returns:
+        PlainTextResponse: The stage durations, request sizes, cache and batching metrics in the Prometheus format.
+    """
+    return REGISTRY.render()
+
+
+# the sampling profiler can be started and stopped at runtime, if its endpoints are enabled
+if settings.app.profiler:
+    profiler = SamplingProfiler()
+
+    @app.post("/profiler/start")
+    def start_profiler(interval_ms: confloat(gt=0) = 5.0):
+        """Start sampling the stacks of all the threads of the App.
+
+        Arguments:
+            interval_ms (float): The time between two samples in milliseconds, positive (default: {5.0}).
+
+        Raises:
+            HTTPException: If the profiler is already running.
+
+        Returns:
+            dict: A confirmation that the profiler is running.
+        """
+        try:
+            profiler.start(interval_ms / 1e3)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return {"profiler": "started"}
+
+    @app.post("/profiler/stop", response_class=PlainTextResponse)
+    def stop_profiler():
+        """Stop the sampling profiler.
+
+        Raises:
+            HTTPException: If the profiler is not running.
+
+        Returns:
+            PlainTextResponse: The sampled stacks in the collapsed format, ready for flame graph tools.
+        """
+        try:
+            return profiler.stop()
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
 
 
 @app.get("/ping", response_model=PingResponse)
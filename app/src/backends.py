@@ -0,0 +1,192 @@
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from catboost import CatBoostRanker, Pool
+
+
+class RankerBackend:
+    """The interface of the inference backends scoring the input matrix of the ranker.
+
+    Attributes:
+        name (str): The name of the backend, as set in `AppSettings.backend`.
+        version (str): The version of the loaded model, the MD5 hash of its weights file.
+
+    """
+
+    name = ""
+    version = ""
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Score the input matrix.
+
+        Args:
+            data (np.ndarray): Float32 matrix with the columns in the order the ranker was trained on.
+
+        Returns:
+            np.ndarray: The array of predicted scores, one per row.
+        """
+        raise NotImplementedError
+
+
+class CatBoostBackend(RankerBackend):
+    """The generic `CatBoostRanker.predict` path, with its input validation and Pool conversion."""
+
+    name = "catboost"
+
+    def __init__(self, ranker: CatBoostRanker) -> None:
+        self.ranker = ranker
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        return self.ranker.predict(data)
+
+
+class EvaluatorBackend(RankerBackend):
+    """CatBoost's low-level evaluator fed with a Pool built straight from the float32 matrix.
+
+    It skips the input processing of `CatBoostRanker.predict` and evaluates the model single-threaded,
+    since the request matrices are too small to benefit from more threads.
+    """
+
+    name = "evaluator"
+
+    def __init__(self, ranker: CatBoostRanker, thread_count: int = 1) -> None:
+        self.ranker = ranker
+        self.thread_count = thread_count
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        pool = Pool(np.ascontiguousarray(data, dtype=np.float32))
+        return self.ranker._base_predict(pool, "RawFormulaVal", 0, 0, self.thread_count, False, "CPU")
+
+
+class ObliviousTreesBackend(RankerBackend):
+    """A pure NumPy evaluator of the oblivious trees exported from the model to JSON.
+
+    Every row is binarized once against all the borders used by the splits, then the leaf index of each tree
+    is assembled from the bits of its splits, and the leaf values are summed tree by tree.
+    """
+
+    name = "oblivious"
+
+    def __init__(self, model: dict, chunk_size: int = 1024) -> None:
+        """Initialize the evaluator.
+
+        Args:
+            model (dict): The model exported by `CatBoostRanker.save_model(..., format="json")`.
+            chunk_size (int): The number of rows evaluated at once, bounding the temporary memory (default: 1024).
+
+        Raises:
+            ValueError: If the model has non-float features or non-oblivious trees.
+        """
+        # the Depthwise and Lossguide grow policies export their trees under another key
+        if "oblivious_trees" not in model or {"trees", "non_symmetric_trees"} & set(model):
+            raise ValueError(f"Only oblivious trees are supported, got the model keys {sorted(model)}")
+        features_info = model["features_info"]
+        if set(features_info) - {"float_features"}:
+            raise ValueError(f"Only float features are supported, got {sorted(features_info)}")
+        float_features = features_info["float_features"]
+        self.chunk_size = chunk_size
+        self.num_features = max(feature["flat_feature_index"] for feature in float_features) + 1
+
+        # the value replacing a missing value, so it is binarized to the bits CatBoost would use
+        self._nan_values = np.full(self.num_features, -np.inf, dtype=np.float32)
+        for feature in float_features:
+            if feature.get("nan_value_treatment") == "AsTrue":
+                self._nan_values[feature["flat_feature_index"]] = np.inf
+
+        # the distinct splits used by the trees and, for each tree, the positions of its splits among them
+        splits = dict()
+        trees = []
+        for tree in model["oblivious_trees"]:
+            positions = []
+            for split in tree["splits"]:
+                if split["split_type"] != "FloatFeature":
+                    raise ValueError(f"Only float feature splits are supported, got {split['split_type']}")
+                feature = float_features[split["float_feature_index"]]["flat_feature_index"]
+                positions.append(splits.setdefault((feature, split["border"]), len(splits)))
+            trees.append((positions, tree["leaf_values"]))
+        self._split_features = np.array([feature for feature, _ in splits], dtype=np.int64)
+        self._split_borders = np.array([border for _, border in splits], dtype=np.float32)
+
+        # the trees are evaluated in groups of the same depth, keeping their order within each group
+        self._groups = []
+        for depth in sorted({len(positions) for positions, _ in trees}):
+            group = [(positions, leaf_values) for positions, leaf_values in trees if len(positions) == depth]
+            self._groups.append(
+                (
+                    np.array([positions for positions, _ in group], dtype=np.int64).reshape(len(group), depth),
+                    np.array([leaf_values for _, leaf_values in group], dtype=np.float64),
+                    np.left_shift(1, np.arange(depth, dtype=np.int64)),
+                )
+            )
+        scale, bias = model.get("scale_and_bias", [1.0, [0.0]])
+        self.scale = scale
+        self.bias = bias[0] if isinstance(bias, list) else bias
+
+    @classmethod
+    def from_ranker(cls, ranker: CatBoostRanker) -> "ObliviousTreesBackend":
+        """Build the evaluator from a loaded model, exporting it to JSON.
+
+        Args:
+            ranker (CatBoostRanker): The loaded model.
+
+        Returns:
+            ObliviousTreesBackend: The evaluator of the model.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder).joinpath("model.json")
+            ranker.save_model(str(path), format="json")
+            with open(path) as file:
+                return cls(json.load(file))
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        data = np.asarray(data, dtype=np.float32)
+        return np.concatenate(
+            [np.empty(0)]
+            + [
+                self._predict_chunk(data[start : start + self.chunk_size])
+                for start in range(0, len(data), self.chunk_size)
+            ]
+        )
+
+    def _predict_chunk(self, data: np.ndarray) -> np.ndarray:
+        data = np.where(np.isnan(data), self._nan_values[: data.shape[1]], data)
+        bits = data[:, self._split_features] > self._split_borders
+        rows = len(data)
+        total = np.zeros(rows)
+        for positions, leaf_values, weights in self._groups:
+            leaves = (bits[:, positions] * weights).sum(axis=2)
+            values = leaf_values[np.arange(len(positions)), leaves]
+            # summing tree by tree, like CatBoost does, rather than pairwise
+            for tree in range(values.shape[1]):
+                total += values[:, tree]
+        return self.scale * total + self.bias
+
+
+BACKENDS = {backend.name: backend for backend in (CatBoostBackend, EvaluatorBackend, ObliviousTreesBackend)}
+
+
+def load_backend(name: str, path: str) -> RankerBackend:
+    """Load the model weights into the inference backend picked by name.
+
+    Args:
+        name (str): The name of the backend, one of `BACKENDS`.
+        path (str): The path to the `.cbm` weights file.
+
+    Raises:
+        ValueError: If the backend name is unknown.
+
+    Returns:
+        RankerBackend: The backend scoring with the loaded model.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ranker backend '{name}', expected one of {sorted(BACKENDS)}")
+    ranker = CatBoostRanker().load_model(str(path))
+    if name == ObliviousTreesBackend.name:
+        backend = ObliviousTreesBackend.from_ranker(ranker)
+    else:
+        backend = BACKENDS[name](ranker)
+    backend.version = hashlib.md5(Path(path).read_bytes()).hexdigest()
+    return backend
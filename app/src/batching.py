@@ -0,0 +1,207 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from src.metrics import Histogram
+
+log = logging.getLogger("api")
+
+# bucket bounds of the batching histograms
+ROWS_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+REQUESTS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+WAIT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+
+
+class _Request:
+    """A matrix waiting to be scored together with the ranker it was submitted to."""
+
+    __slots__ = ("ranker", "data", "future", "enqueued")
+
+    def __init__(self, ranker, data: np.ndarray) -> None:
+        self.ranker = ranker
+        self.data = data
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class PinnedBatcher:
+    """A view of a micro-batcher which submits every matrix to the same ranker, whatever ranker is swapped in later.
+
+    Attributes:
+        batcher (MicroBatcher): The micro-batcher scoring the matrices.
+        ranker (RankerBackend): The ranker the matrices are scored by.
+
+    """
+
+    __slots__ = ("batcher", "ranker")
+
+    def __init__(self, batcher: "MicroBatcher", ranker) -> None:
+        self.batcher = batcher
+        self.ranker = ranker
+
+    @property
+    def version(self) -> str:
+        """The version of the model of the pinned ranker."""
+        return self.ranker.version
+
+    def submit(self, data: np.ndarray) -> Future:
+        """Queue a matrix to be scored by the pinned ranker with the next batch, see `MicroBatcher.submit`."""
+        return self.batcher.submit(data, self.ranker)
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Score a matrix by the pinned ranker with the next batch, see `MicroBatcher.predict`."""
+        return self.submit(data).result()
+
+
+class MicroBatcher:
+    """A dynamic batching layer around the ranker.
+
+    Concurrent requests are queued, and a background thread scores everything queued within `max_wait` seconds
+    of the first request, or up to `max_rows` rows, with one call of the ranker, then scatters the scores back
+    to the waiting requests. It exposes the same `predict` method as the ranker it wraps.
+
+    Attributes:
+        ranker (RankerBackend): The wrapped ranker, new requests are scored by the ranker set at their submission.
+        max_wait (float): The longest time in seconds the first request of a batch waits for other requests.
+        max_rows (int): The number of rows after which a batch is scored without waiting any longer.
+        batch_rows (Histogram): The number of rows per batch.
+        batch_requests (Histogram): The number of requests per batch.
+        queue_wait (Histogram): The time in seconds the requests spent in the queue.
+
+    """
+
+    def __init__(self, ranker, max_wait: float, max_rows: int) -> None:
+        """Initialize the batcher, its thread is started by the first submitted request.
+
+        Args:
+            ranker (RankerBackend): The ranker to wrap.
+            max_wait (float): The longest time in seconds the first request of a batch waits for other requests.
+            max_rows (int): The number of rows after which a batch is scored without waiting any longer.
+        """
+        self.ranker = ranker
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self.batch_rows = Histogram(ROWS_BUCKETS)
+        self.batch_requests = Histogram(REQUESTS_BUCKETS)
+        self.queue_wait = Histogram(WAIT_BUCKETS)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, data: np.ndarray, ranker=None) -> Future:
+        """Queue a matrix to be scored with the next batch.
+
+        Args:
+            data (np.ndarray): The input matrix of the ranker.
+            ranker (RankerBackend, optional): The ranker scoring the matrix, the wrapped one if None.
+
+        Returns:
+            Future: A future resolved with the array of predicted scores.
+        """
+        request = _Request(self.ranker if ranker is None else ranker, data)
+        if len(data) == 0:
+            request.future.set_result(np.empty(0))
+            return request.future
+        self._ensure_started()
+        self._queue.put(request)
+        return request.future
+
+    @property
+    def version(self) -> str:
+        """The version of the model of the wrapped ranker."""
+        return self.ranker.version
+
+    def pin(self) -> PinnedBatcher:
+        """Bind the wrapped ranker, so all the matrices of a request are scored by the same model.
+
+        Returns:
+            PinnedBatcher: A view of the batcher submitting every matrix to the ranker wrapped now.
+        """
+        return PinnedBatcher(self, self.ranker)
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Score a matrix with the next batch, blocking until the scores are ready.
+
+        Args:
+            data (np.ndarray): The input matrix of the ranker.
+
+        Returns:
+            np.ndarray: The array of predicted scores.
+        """
+        return self.submit(data).result()
+
+    def stats(self) -> dict:
+        """Collect the histograms of the batcher.
+
+        Returns:
+            dict: The snapshots of the rows per batch, requests per batch and queue wait histograms.
+        """
+        return {
+            "batch_rows": self.batch_rows.snapshot(),
+            "batch_requests": self.batch_requests.snapshot(),
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+    def close(self) -> None:
+        """Stop the background thread once the requests queued so far are scored."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self) -> None:
+        # the thread is started lazily, so a batcher created before a fork works in the child process too
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            rows = len(first.data)
+            deadline = first.enqueued + self.max_wait
+            while rows < self.max_rows:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._score(batch, rows)
+                    return
+                batch.append(request)
+                rows += len(request.data)
+            self._score(batch, rows)
+
+    def _score(self, batch: list[_Request], rows: int) -> None:
+        started = time.perf_counter()
+        for request in batch:
+            self.queue_wait.observe(started - request.enqueued)
+        self.batch_rows.observe(rows)
+        self.batch_requests.observe(len(batch))
+
+        # the ranker may be swapped while requests wait, each request is scored by the ranker it was submitted to
+        by_ranker = dict()
+        for request in batch:
+            by_ranker.setdefault(id(request.ranker), []).append(request)
+        for requests in by_ranker.values():
+            try:
+                predictions = requests[0].ranker.predict(np.concatenate([request.data for request in requests]))
+            except Exception as e:
+                log.exception("Micro-batch scoring failed")
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            offsets = np.cumsum([len(request.data) for request in requests])[:-1]
+            for request, scores in zip(requests, np.split(predictions, offsets)):
+                request.future.set_result(scores)
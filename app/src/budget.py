@@ -0,0 +1,99 @@
+import asyncio
+import concurrent.futures
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BudgetExceeded(Exception):
+    """A step of a request did not finish within the latency budget of the request."""
+
+
+class Budget:
+    """The latency budget of one request, shared by its slow steps: the venue query and the ranker.
+
+    A step run within the budget is abandoned, not interrupted, when the budget is exceeded: it keeps running
+    in the background, so for example the venues it fetches still fill the venue cache for the next requests.
+
+    Attributes:
+        deadline (Optional[float]): The `time.perf_counter` time the request should be answered by,
+            `None` if the budget is not limited.
+        executor (Optional[ThreadPoolExecutor]): The thread pool running the steps of the sync endpoints.
+
+    """
+
+    def __init__(self, seconds: Optional[float] = None, executor: Optional[ThreadPoolExecutor] = None) -> None:
+        """Start the budget.
+
+        Args:
+            seconds (Optional[float]): The budget in seconds from now, not limited if not set (default: None).
+            executor (Optional[ThreadPoolExecutor]): The thread pool running the steps of the sync endpoints,
+                required if the budget is limited and `run` is used (default: None).
+        """
+        self.deadline = None if seconds is None else time.perf_counter() + seconds
+        self.executor = executor
+
+    @property
+    def limited(self) -> bool:
+        """Whether the budget is limited."""
+        return self.deadline is not None
+
+    def remaining(self) -> Optional[float]:
+        """The time left in seconds, `None` if the budget is not limited."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.perf_counter(), 0.0)
+
+    def share(self, fraction: float) -> "Budget":
+        """Set aside a part of the remaining budget for a step, so the next steps keep the rest.
+
+        Args:
+            fraction (float): The part of the remaining budget given to the step.
+
+        Returns:
+            Budget: The budget of the step, sharing the thread pool of this budget.
+        """
+        remaining = self.remaining()
+        return Budget(None if remaining is None else remaining * fraction, self.executor)
+
+    def run(self, function: Callable[..., T], *args) -> T:
+        """Call a function within the budget, in the thread pool if the budget is limited.
+
+        Args:
+            function (Callable[..., T]): The function to call.
+            *args: The arguments of the function.
+
+        Raises:
+            BudgetExceeded: If the function did not return within the remaining budget.
+
+        Returns:
+            T: The return value of the function.
+        """
+        if self.deadline is None:
+            return function(*args)
+        future = self.executor.submit(function, *args)
+        try:
+            return future.result(timeout=self.remaining())
+        except concurrent.futures.TimeoutError:
+            raise BudgetExceeded from None
+
+    async def run_async(self, awaitable: Awaitable[T]) -> T:
+        """Await a coroutine or a future within the budget, without cancelling it if the budget is exceeded.
+
+        Args:
+            awaitable (Awaitable[T]): The coroutine or future to await.
+
+        Raises:
+            BudgetExceeded: If the awaitable was not done within the remaining budget.
+
+        Returns:
+            T: The result of the awaitable.
+        """
+        if self.deadline is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(asyncio.shield(awaitable), self.remaining())
+        except asyncio.TimeoutError:
+            raise BudgetExceeded from None
@@ -0,0 +1,296 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import numpy as np
+
+from src.features import FEATURES
+from src.scores import COMBINATIONS, flag_combinations
+
+
+class VenueCache:
+    """A bounded in-process store of venue features with LRU and TTL eviction.
+
+    The `info` table is static between reloads, so the features of a venue are read from this store first
+    and fetched from the database only on a miss. The features are kept in a preallocated float32 matrix,
+    one slot per venue, with a venue id -> slot index ordered from the least to the most recently used venue.
+    An expired entry is a miss, but it is kept until it is refreshed or evicted, as a stale fallback
+    for the times the database is too slow.
+
+    Attributes:
+        capacity (int): The maximum number of venues kept in the store.
+        ttl (Optional[float]): The time to live of an entry in seconds, `None` means entries never expire.
+        hits (int): The number of venue lookups served from the store.
+        misses (int): The number of venue lookups which were not found in the store or were expired.
+        evictions (int): The number of entries dropped because of the capacity.
+        version (int): The number of times the store was cleared, the scores computed from older entries are stale.
+
+    """
+
+    def __init__(self, capacity: int, ttl: Optional[float] = None) -> None:
+        """Initialize an empty store.
+
+        Args:
+            capacity (int): The maximum number of venues kept in the store.
+            ttl (Optional[float]): The time to live of an entry in seconds (default: None).
+        """
+        if capacity <= 0:
+            raise ValueError(f"Capacity of the venue cache should be positive, got {capacity}")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.version = 0
+        self._features = np.zeros((capacity, len(FEATURES)), dtype=np.float32)
+        self._expires = np.full(capacity, np.inf)
+        # venue id -> slot in the feature matrix, ordered from the least to the most recently used
+        self._slots: OrderedDict[int, int] = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        # sync endpoints are served from a thread pool, so the store is shared between threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def lookup(self, venue_ids: np.ndarray, stale: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """Look up the features of several venues.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+            stale (bool): Whether to also return the expired entries, without counting the lookup (default: False).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Float32 matrix with the features of each venue and a mask
+                of the venues found in the store, the rows of the venues which are not found are zeros.
+        """
+        ids = venue_ids.tolist()
+        with self._lock:
+            slots = np.fromiter((self._slots.get(venue_id, -1) for venue_id in ids), dtype=np.int64, count=len(ids))
+            found = slots >= 0
+            if stale:
+                features = self._features[np.where(found, slots, 0)]
+                features[~found] = 0
+                return features, found
+            if self.ttl is not None:
+                found &= self._expires[slots] >= time.monotonic()
+            for venue_id in venue_ids[found].tolist():
+                self._slots.move_to_end(venue_id)
+            features = self._features[np.where(found, slots, 0)]
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(ids) - hits
+        features[~found] = 0
+        return features, found
+
+    def put(self, venue_ids: np.ndarray, features: np.ndarray) -> None:
+        """Store the features of several venues, evicting the least recently used ones if the store is full.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+            features (np.ndarray): Matrix with the features of each venue.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else np.inf
+        with self._lock:
+            slots = np.empty(len(venue_ids), dtype=np.int64)
+            for i, venue_id in enumerate(venue_ids.tolist()):
+                slot = self._slots.get(venue_id)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    else:
+                        _, slot = self._slots.popitem(last=False)
+                        self.evictions += 1
+                    self._slots[venue_id] = slot
+                else:
+                    self._slots.move_to_end(venue_id)
+                slots[i] = slot
+            # a slot reused within one call keeps the features of the venue written last, like the index does
+            self._features[slots] = features
+            self._expires[slots] = expires
+
+    def clear(self) -> None:
+        """Drop all the entries, for example after the `info` table was reloaded."""
+        with self._lock:
+            self._slots.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+            self.version += 1
+
+    def stats(self) -> dict:
+        """Collect the counters of the store.
+
+        Returns:
+            dict: The size and capacity of the store with its hit, miss and eviction counters.
+        """
+        with self._lock:
+            return {
+                "size": len(self._slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ScoreCache:
+    """A bounded in-process store of the predicted scores of venues, with LRU eviction.
+
+    Besides the venue features, the ranker only sees three boolean flags: is_new_user, is_from_order_again
+    and is_recommended. So a venue has at most 8 distinct scores, which are kept in one slot per venue,
+    next to the venue features they were computed from. A score is a hit only if the venue features
+    of the request are the ones stored in the slot, so a venue reloaded with new features is scored again.
+
+    Every lookup and put carries the version of the scores, the version of the model and of the venue store,
+    and the whole store is dropped as soon as a new version is seen. Scores put with an older version,
+    by a request which started before the model was swapped, are ignored.
+
+    Attributes:
+        capacity (int): The maximum number of venues kept in the store.
+        version (Hashable): The version of the stored scores.
+        hits (int): The number of scores served from the store.
+        misses (int): The number of scores which had to be predicted.
+        evictions (int): The number of venues dropped because of the capacity.
+
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """Initialize an empty store.
+
+        Args:
+            capacity (int): The maximum number of venues kept in the store.
+        """
+        if capacity <= 0:
+            raise ValueError(f"Capacity of the score cache should be positive, got {capacity}")
+        self.capacity = capacity
+        self.version: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._features = np.zeros((capacity, len(FEATURES)), dtype=np.float32)
+        self._scores = np.zeros((capacity, COMBINATIONS))
+        self._known = np.zeros((capacity, COMBINATIONS), dtype=bool)
+        # venue id -> slot in the matrices, ordered from the least to the most recently used
+        self._slots: OrderedDict[int, int] = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def lookup(self, venue_ids: np.ndarray, data: np.ndarray, version: Hashable) -> tuple[np.ndarray, np.ndarray]:
+        """Look up the scores of the rows of an input matrix of the ranker.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids, one per row.
+            data (np.ndarray): The input matrix of the ranker, see `build_features`.
+            version (Hashable): The version of the model and of the venue features the matrix was built with.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The array of scores and a mask of the rows found in the store,
+                the scores of the rows which are not found are zeros.
+        """
+        combinations = _combinations(data)
+        ids = venue_ids.tolist()
+        with self._lock:
+            self._check(version)
+            slots = np.fromiter((self._slots.get(venue_id, -1) for venue_id in ids), dtype=np.int64, count=len(ids))
+            rows = np.where(slots >= 0, slots, 0)
+            found = (
+                (slots >= 0)
+                & self._known[rows, combinations]
+                & _same(self._features[rows], data[:, -len(FEATURES) :]).all(axis=1)
+            )
+            for venue_id in venue_ids[found].tolist():
+                self._slots.move_to_end(venue_id)
+            scores = self._scores[rows, combinations]
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(ids) - hits
+        scores[~found] = 0
+        return scores, found
+
+    def put(self, venue_ids: np.ndarray, data: np.ndarray, scores: np.ndarray, version: Hashable) -> None:
+        """Store the scores of the rows of an input matrix of the ranker, evicting the least recently used venues.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids, one per row.
+            data (np.ndarray): The input matrix of the ranker, see `build_features`.
+            scores (np.ndarray): Array of predicted scores, one per row.
+            version (Hashable): The version of the model and of the venue features the scores were computed with.
+        """
+        combinations = _combinations(data)
+        features = data[:, -len(FEATURES) :]
+        with self._lock:
+            if version != self.version:
+                return
+            slots = np.empty(len(venue_ids), dtype=np.int64)
+            fresh = np.zeros(len(venue_ids), dtype=bool)
+            for i, venue_id in enumerate(venue_ids.tolist()):
+                slot = self._slots.get(venue_id)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    else:
+                        _, slot = self._slots.popitem(last=False)
+                        self.evictions += 1
+                    self._slots[venue_id] = slot
+                    fresh[i] = True
+                else:
+                    self._slots.move_to_end(venue_id)
+                slots[i] = slot
+            # a slot reused within one call keeps only the scores of the venue which owns it at the end
+            owned = np.fromiter(
+                (self._slots.get(venue_id) == slot for venue_id, slot in zip(venue_ids.tolist(), slots.tolist())),
+                dtype=bool,
+                count=len(slots),
+            )
+            slots, fresh, features, combinations, scores = (
+                array[owned] for array in (slots, fresh, features, combinations, scores)
+            )
+            # the scores of a venue which features changed are dropped along with the ones of an evicted venue
+            fresh |= ~_same(self._features[slots], features).all(axis=1)
+            self._known[slots[fresh]] = False
+            self._features[slots] = features
+            self._scores[slots, combinations] = scores
+            self._known[slots, combinations] = True
+
+    def clear(self) -> None:
+        """Drop all the entries."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        """Collect the counters of the store.
+
+        Returns:
+            dict: The size and capacity of the store with its hit, miss and eviction counters.
+        """
+        with self._lock:
+            return {
+                "size": len(self._slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _check(self, version: Hashable) -> None:
+        if version != self.version:
+            self._clear()
+            self.version = version
+
+    def _clear(self) -> None:
+        self._slots.clear()
+        self._free = list(range(self.capacity - 1, -1, -1))
+
+
+def _combinations(data: np.ndarray) -> np.ndarray:
+    # the index of the combination of the is_new_user, is_from_order_again and is_recommended columns,
+    # the same one as the columns of the score table
+    return flag_combinations(data[:, 0] > 0, data[:, 1:3] > 0)
+
+
+def _same(stored: np.ndarray, features: np.ndarray) -> np.ndarray:
+    # compare the bit patterns, so the missing values are equal to each other
+    return np.ascontiguousarray(stored).view(np.uint32) == np.ascontiguousarray(features).view(np.uint32)
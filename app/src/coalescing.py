@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from src.features import FEATURES, VenueTable
+
+
+class _Aborted(Exception):
+    """The leader of a flight was interrupted before querying the venues, the other requests query them again."""
+
+
+class _Flight:
+    """The venue ids of one database query, shared by the requests which need them."""
+
+    __slots__ = ("venue_ids", "future")
+
+    def __init__(self) -> None:
+        self.venue_ids: list[int] = []
+        self.future = Future()
+
+
+class VenueCoalescer:
+    """A single-flight layer merging the venue lookups of concurrent requests into fewer database queries.
+
+    The first request missing some venues opens a flight and leads it: it waits `max_wait` seconds, while
+    the concurrent requests add the venue ids they miss to the open flight, then fetches all of them with
+    one query of its own database session and shares the result. A venue id is fetched by one flight at a time,
+    a request missing a venue which is already being fetched waits for that flight instead of querying it again.
+
+    Attributes:
+        max_wait (float): The time in seconds a flight stays open to the venue ids of other requests.
+        requests (int): The number of lookups.
+        queries (int): The number of database queries of the flights.
+        fetched (int): The number of venue ids queried from the database.
+        shared (int): The number of venue ids of a lookup which were queried by a flight led by another request.
+
+    """
+
+    def __init__(self, max_wait: float) -> None:
+        """Initialize the coalescer.
+
+        Args:
+            max_wait (float): The time in seconds a flight stays open to the venue ids of other requests.
+        """
+        self.max_wait = max_wait
+        self.requests = 0
+        self.queries = 0
+        self.fetched = 0
+        self.shared = 0
+        # venue id -> the future of the flight fetching it
+        self._inflight: dict[int, Future] = {}
+        self._open: Optional[_Flight] = None
+        self._lock = threading.Lock()
+
+    def fetch(self, venue_ids: list[int], query: Callable[[list[int]], VenueTable]) -> VenueTable:
+        """Fetch the venues, sharing the database queries with the concurrent requests.
+
+        Args:
+            venue_ids (list[int]): List of distinct venue ids to retrieve.
+            query (Callable[[list[int]], VenueTable]): The function querying the database for a list of venue ids,
+                called by the leader of a flight.
+
+        Returns:
+            VenueTable: A table with the found venues, which may also hold venues of other requests.
+        """
+        flight, futures = self._join(venue_ids)
+        if flight is not None:
+            try:
+                time.sleep(self.max_wait)
+                table = query(self._close(flight))
+            except BaseException as e:
+                self._land(flight, exception=e)
+                raise
+            self._land(flight, table=table)
+        try:
+            return _merge([future.result() for future in futures])
+        except _Aborted:
+            return self.fetch(venue_ids, query)
+
+    async def fetch_async(
+        self, venue_ids: list[int], query: Callable[[list[int]], Awaitable[VenueTable]]
+    ) -> VenueTable:
+        """Fetch the venues without blocking the event loop, see `fetch`.
+
+        Args:
+            venue_ids (list[int]): List of distinct venue ids to retrieve.
+            query (Callable[[list[int]], Awaitable[VenueTable]]): The coroutine function querying the database
+                for a list of venue ids, called by the leader of a flight.
+
+        Returns:
+            VenueTable: A table with the found venues, which may also hold venues of other requests.
+        """
+        flight, futures = self._join(venue_ids)
+        if flight is not None:
+            try:
+                await asyncio.sleep(self.max_wait)
+                table = await query(self._close(flight))
+            except BaseException as e:
+                self._land(flight, exception=e)
+                raise
+            self._land(flight, table=table)
+        try:
+            return _merge([await asyncio.wrap_future(future) for future in futures])
+        except _Aborted:
+            return await self.fetch_async(venue_ids, query)
+
+    def stats(self) -> dict:
+        """Collect the counters of the coalescer.
+
+        Returns:
+            dict: The lookup, query, fetched and shared venue counters.
+        """
+        with self._lock:
+            return {"requests": self.requests, "queries": self.queries, "fetched": self.fetched, "shared": self.shared}
+
+    def _join(self, venue_ids: list[int]) -> tuple[Optional[_Flight], set[Future]]:
+        # find the flights fetching the venues, adding the other venues to the open flight, or to a new one
+        # which the caller leads
+        futures = set()
+        missing = []
+        with self._lock:
+            self.requests += 1
+            for venue_id in venue_ids:
+                future = self._inflight.get(venue_id)
+                if future is None:
+                    missing.append(venue_id)
+                else:
+                    futures.add(future)
+            self.shared += len(venue_ids) - len(missing)
+            lead = None
+            if missing:
+                if self._open is None:
+                    self._open = lead = _Flight()
+                self._open.venue_ids += missing
+                for venue_id in missing:
+                    self._inflight[venue_id] = self._open.future
+                futures.add(self._open.future)
+        return lead, futures
+
+    def _close(self, flight: _Flight) -> list[int]:
+        # stop adding venue ids to the flight, the venues missed afterwards open the next flight
+        with self._lock:
+            if self._open is flight:
+                self._open = None
+                self.queries += 1
+                self.fetched += len(flight.venue_ids)
+            return flight.venue_ids
+
+    def _land(
+        self, flight: _Flight, table: Optional[VenueTable] = None, exception: Optional[BaseException] = None
+    ) -> None:
+        # share the result of the flight, then let the next lookups of its venues query them again
+        self._close(flight)
+        if isinstance(exception, Exception):
+            flight.future.set_exception(exception)
+        elif exception is not None:
+            # the leader was cancelled, e.g. its client disconnected, which must not fail the other requests
+            flight.future.set_exception(_Aborted())
+        else:
+            flight.future.set_result(table)
+        with self._lock:
+            for venue_id in flight.venue_ids:
+                if self._inflight.get(venue_id) is flight.future:
+                    del self._inflight[venue_id]
+
+
+def _merge(tables: list[VenueTable]) -> VenueTable:
+    # the venues fetched by several flights, in one table
+    if len(tables) == 1:
+        return tables[0]
+    return VenueTable(
+        np.concatenate([np.empty(0, dtype=np.int64)] + [table.venue_ids for table in tables]),
+        np.concatenate([np.empty((0, len(FEATURES)), dtype=np.float32)] + [table.features for table in tables]),
+    )
@@ -0,0 +1,195 @@
+from typing import Sequence, Union
+
+import numpy as np
+
+from src.schemas import InputVenue, PredictGroup
+
+# The static venue columns of the `info` table, in the order the ranker expects them
+FEATURES = ("conversions_per_impression", "price_range", "rating", "popularity", "retention_rate")
+
+
+class VenueTable:
+    """A columnar table of venue features.
+
+    The features are kept in one contiguous float32 matrix, the rows of which are sorted by venue id,
+    so the row of a venue is found with a binary search over the `venue_ids` array.
+
+    Attributes:
+        venue_ids (np.ndarray): Sorted int64 array of venue ids.
+        features (np.ndarray): C-contiguous float32 matrix of shape (len(venue_ids), len(FEATURES)).
+
+    """
+
+    def __init__(self, venue_ids: np.ndarray, features: np.ndarray) -> None:
+        """Initialize the table, sorting the rows by venue id.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+            features (np.ndarray): Matrix of venue features, one row per venue id.
+        """
+        venue_ids = np.asarray(venue_ids, dtype=np.int64)
+        features = np.asarray(features, dtype=np.float32).reshape(len(venue_ids), len(FEATURES))
+        order = np.argsort(venue_ids, kind="stable")
+        self.venue_ids = np.ascontiguousarray(venue_ids[order])
+        self.features = np.ascontiguousarray(features[order])
+
+    def __len__(self) -> int:
+        return len(self.venue_ids)
+
+    @classmethod
+    def from_sorted(cls, venue_ids: np.ndarray, features: np.ndarray) -> "VenueTable":
+        """Wrap arrays which are already sorted by venue id, without copying them, e.g. the arrays of a snapshot.
+
+        Args:
+            venue_ids (np.ndarray): Sorted int64 array of venue ids.
+            features (np.ndarray): C-contiguous float32 matrix of venue features, one row per venue id.
+
+        Returns:
+            VenueTable: The table of venue features sharing the memory of the arrays.
+        """
+        table = cls.__new__(cls)
+        table.venue_ids = venue_ids
+        table.features = features
+        return table
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence]) -> "VenueTable":
+        """Build a table from rows of the `info` table.
+
+        Args:
+            rows (Sequence[Sequence]): Rows of (venue_id, *FEATURES) values, `None` stands for a missing value.
+
+        Returns:
+            VenueTable: The table of venue features.
+        """
+        if len(rows) == 0:
+            return cls(np.empty(0, dtype=np.int64), np.empty((0, len(FEATURES)), dtype=np.float32))
+        venue_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        # the missing values are converted to NaN
+        features = np.array([row[1:] for row in rows], dtype=np.float32)
+        return cls(venue_ids, features)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "VenueTable":
+        """Build a table from a CSV dump of the `info` table, like `cache/venues.csv`.
+
+        Args:
+            path (str): The path to the CSV file with a header row.
+
+        Returns:
+            VenueTable: The table of venue features.
+        """
+        with open(path) as file:
+            header = file.readline().strip().split(",")
+        columns = ("venue_id",) + FEATURES
+        values = np.genfromtxt(
+            path,
+            delimiter=",",
+            skip_header=1,
+            usecols=[header.index(column) for column in columns],
+            dtype=[("venue_id", np.int64)] + [(feature, np.float32) for feature in FEATURES],
+            ndmin=1,
+        )
+        features = np.column_stack([values[feature] for feature in FEATURES])
+        return cls(values["venue_id"], features)
+
+    def lookup(self, venue_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Find the rows of the venues.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The row of each venue and a mask of the venues found in the table,
+                the row of a venue which is not found is meaningless.
+        """
+        rows = np.searchsorted(self.venue_ids, venue_ids)
+        rows[rows == len(self.venue_ids)] = 0
+        found = self.venue_ids[rows] == venue_ids if len(self.venue_ids) else np.zeros(len(rows), dtype=bool)
+        return rows, found
+
+    def get(self, venue_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Gather the features of the venues, the features of the venues which are not found being missing values.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Float32 matrix with the features of each venue and a mask of the venues
+                found in the table, the features of the venues which are not found are NaN.
+        """
+        rows, found = self.lookup(venue_ids)
+        features = np.full((len(venue_ids), len(FEATURES)), np.nan, dtype=np.float32)
+        features[found] = self.features[rows[found]]
+        return features, found
+
+    def gather(self, venue_ids: np.ndarray) -> np.ndarray:
+        """Gather the features of the venues.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+
+        Raises:
+            KeyError: If a venue is not found in the table.
+
+        Returns:
+            np.ndarray: Float32 matrix with the features of each venue.
+        """
+        rows, found = self.lookup(venue_ids)
+        if not found.all():
+            raise KeyError(int(venue_ids[~found][0]))
+        return self.features[rows]
+
+
+def encode_venues(venues: list[InputVenue]) -> tuple[np.ndarray, np.ndarray]:
+    """Convert the input venues to arrays.
+
+    Args:
+        venues (list[InputVenue]): A list of InputVenue objects.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The int64 array of venue ids and the boolean matrix
+            of (is_from_order_again, is_recommended) flags.
+    """
+    count = len(venues)
+    venue_ids = np.fromiter((venue.venue_id for venue in venues), dtype=np.int64, count=count)
+    flags = np.empty((count, 2), dtype=bool)
+    flags[:, 0] = np.fromiter((venue.is_from_order_again for venue in venues), dtype=bool, count=count)
+    flags[:, 1] = np.fromiter((venue.is_recommended for venue in venues), dtype=bool, count=count)
+    return venue_ids, flags
+
+
+def encode_groups(groups: list[PredictGroup]) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[int]]:
+    """Convert the groups of input venues to arrays concatenated over all the groups.
+
+    Args:
+        groups (list[PredictGroup]): A list of PredictGroup objects.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, list[int]]: The int64 array of venue ids, the boolean matrix
+            of (is_from_order_again, is_recommended) flags, the is_new_user value of each row and the size of each group.
+    """
+    encoded = [encode_venues(group.venues) for group in groups]
+    sizes = [len(group.venues) for group in groups]
+    venue_ids = np.concatenate([np.empty(0, dtype=np.int64)] + [group_ids for group_ids, _ in encoded])
+    flags = np.concatenate([np.empty((0, 2), dtype=bool)] + [group_flags for _, group_flags in encoded])
+    is_new_user = np.repeat(np.array([group.is_new_user for group in groups], dtype=bool), sizes)
+    return venue_ids, flags, is_new_user, sizes
+
+
+def build_features(is_new_user: Union[bool, np.ndarray], flags: np.ndarray, venue_features: np.ndarray) -> np.ndarray:
+    """Stack the request flags and the venue features into the input matrix of the ranker.
+
+    Args:
+        is_new_user (Union[bool, np.ndarray]): Whether the user is new, one value or one value per row.
+        flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+        venue_features (np.ndarray): Float32 matrix with the features of each venue.
+
+    Returns:
+        np.ndarray: Float32 matrix with the columns in the order the ranker was trained on.
+    """
+    data = np.empty((len(flags), 3 + len(FEATURES)), dtype=np.float32)
+    data[:, 0] = is_new_user
+    data[:, 1:3] = flags
+    data[:, 3:] = venue_features
+    return data
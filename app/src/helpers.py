@@ -1,37 +1,335 @@
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Awaitable, Callable, Optional, Union
 
-import boto3
-from catboost import CatBoostRanker
+import numpy as np
 from config import settings
 from fastapi import FastAPI, Request
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from src import models
+from src.backends import load_backend
+from src.batching import MicroBatcher, PinnedBatcher
+from src.budget import Budget, BudgetExceeded
+from src.cache import ScoreCache, VenueCache
+from src.coalescing import VenueCoalescer
+from src.features import FEATURES, VenueTable, build_features
+from src.metrics import DB_ROWS, FALLBACKS, MODEL_RELOADS, REGISTRY, STAGES, startup_phase, startup_phases
+from src.reload import FileWeightsSource, S3WeightsSource, WeightsWatcher, cached_download
+from src.scores import COMBINATIONS, ScoreTable
+from src.snapshot import Snapshot
 
 log = logging.getLogger("api")
 logging.basicConfig(level=logging.INFO)
 
 db = settings.db
-url = f"{db.driver}://{db.user}:{db.password}@{db.host}:{db.port}/{db.database}"
-engine = create_engine(url)
+
+
+def pool_options(url: str) -> dict:
+    """
+    Build the connection pool arguments of an engine from the database settings.
+
+    Args:
+        url (str): The URL of the database.
+
+    Returns:
+        dict: The keyword arguments of `create_engine` configuring the pool.
+    """
+    options = {"pool_pre_ping": db.pool_pre_ping, "pool_recycle": db.pool_recycle}
+    # SQLite connects to a file, its engines do not keep a sized pool of connections
+    if not url.startswith("sqlite"):
+        options.update(pool_size=db.pool_size, max_overflow=db.max_overflow)
+    return options
+
+
+url = db.url or f"{db.driver}://{db.user}:{db.password}@{db.host}:{db.port}/{db.database}"
+engine = create_engine(url, **pool_options(url))
 log.info(f"Connected to database: {db.host}:{db.port}/{db.database}")
 SessionLocal = sessionmaker(autocommit=True, autoflush=False, bind=engine)
 
+# the async engine is only created in the async mode, so the async driver is not required otherwise
+if settings.app.async_mode:
+    async_url = db.async_url or f"{db.async_driver}://{db.user}:{db.password}@{db.host}:{db.port}/{db.database}"
+    async_engine = create_async_engine(async_url, **pool_options(async_url))
+    AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# the columns of the `info` table which are read as plain tuples, skipping the ORM objects hydration
+columns = [models.Venue.venue_id] + [getattr(models.Venue, feature) for feature in FEATURES]
+# the query of the venues by id, a plain SQL statement which skips the ORM query compilation, the list of ids
+# is expanded into the `IN` clause when the statement is executed
+venues_query = text(
+    f"SELECT venue_id, {', '.join(FEATURES)} FROM {models.Venue.__tablename__} WHERE venue_id IN :venue_ids"
+).bindparams(bindparam("venue_ids", expanding=True))
+# the part of the latency budget of a request the venue query may use, the rest is left to the ranker,
+# so the venues with fallback features are still ranked by the model
+VENUES_BUDGET = 0.5
+
+
+def get_venues(db: Session, venue_ids: list[int]) -> VenueTable:
+    """
+    Retrieve the features of venues from the database given their ids.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        venue_ids (list[int]): List of venue ids to retrieve.
+
+    Returns:
+        VenueTable: The table of the found venues.
+    """
+    with STAGES["get_venues"].time():
+        rows = db.execute(venues_query, {"venue_ids": venue_ids}).all()
+    DB_ROWS.observe(len(rows))
+    return VenueTable.from_rows(rows)
+
+
+def get_all_venues(db: Session) -> VenueTable:
+    """
+    Retrieve the features of all the venues from the database.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+
+    Returns:
+        VenueTable: The table of all the venues.
+    """
+    return VenueTable.from_rows(db.query(*columns).all())
+
+
+def get_venues_detached(venue_ids: list[int]) -> VenueTable:
+    """
+    Retrieve the features of venues from the database with a session of its own, see `get_venues`.
+
+    The query may outlive the request it was run for, if it exceeds the latency budget of the request,
+    so it does not use the session of the request.
+
+    Args:
+        venue_ids (list[int]): List of venue ids to retrieve.
+
+    Returns:
+        VenueTable: The table of the found venues.
+    """
+    db = SessionLocal()
+    try:
+        return get_venues(db, venue_ids)
+    finally:
+        db.close()
+
 
-def get_venues(db: Session, venue_ids: list[int]) -> list[models.Venue]:
+def fetch_venues(
+    query: Callable[[list[int]], VenueTable],
+    cache: VenueCache,
+    coalescer: Optional[VenueCoalescer],
+    venue_ids: np.ndarray,
+) -> VenueTable:
     """
-    Retrieve a list of venues from the database given their ids.
+    Query the venues from the database, sharing the query with the concurrent requests if the coalescer is set,
+    and put them into the cache.
+
+    Args:
+        query (Callable[[list[int]], VenueTable]): The function querying the database for a list of venue ids.
+        cache (VenueCache): In-process venue cache.
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled.
+        venue_ids (np.ndarray): Array of venue ids to retrieve.
+
+    Returns:
+        VenueTable: The table of the found venues.
+    """
+    venue_ids = np.unique(venue_ids).tolist()
+    fetched = query(venue_ids) if coalescer is None else coalescer.fetch(venue_ids, query)
+    cache.put(fetched.venue_ids, fetched.features)
+    return fetched
+
+
+def get_venue_features(
+    db: Session,
+    cache: VenueCache,
+    venue_ids: np.ndarray,
+    snapshot: Optional[Snapshot] = None,
+    coalescer: Optional[VenueCoalescer] = None,
+    budget: Optional[Budget] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieve the features of the venues from the snapshot and the cache, falling back to the database for misses.
+
+    The venues fetched from the database are put into the cache. If the coalescer is set, the database queries
+    are shared with the concurrent requests. The venues which are found nowhere get missing features. If the query
+    exceeds the latency budget, the expired features of the cache are used instead, or missing features.
 
     Args:
         db (Session): SQLAlchemy database session.
+        cache (VenueCache): In-process venue cache.
+        venue_ids (np.ndarray): Array of venue ids to retrieve.
+        snapshot (Optional[Snapshot]): Memory-mapped venue snapshot, if it is enabled (default: None).
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled (default: None).
+        budget (Optional[Budget]): The latency budget of the request, not limited if not set (default: None).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Float32 matrix with the features of each venue and a mask of the venues
+            which got fallback features.
+    """
+    fallback = np.zeros(len(venue_ids), dtype=bool)
+    if snapshot is not None and len(snapshot):
+        features, found = snapshot.get(venue_ids)
+        if not found.all():
+            # the venues added to the database after the snapshot was exported
+            features[~found], fallback[~found] = get_venue_features(
+                db, cache, venue_ids[~found], coalescer=coalescer, budget=budget
+            )
+        return features, fallback
+    features, found = cache.lookup(venue_ids)
+    if found.all():
+        return features, fallback
+    missing = venue_ids[~found]
+    try:
+        if budget is not None and budget.limited:
+            fetched = budget.share(VENUES_BUDGET).run(fetch_venues, get_venues_detached, cache, coalescer, missing)
+        else:
+            fetched = fetch_venues(lambda venue_ids: get_venues(db, venue_ids), cache, coalescer, missing)
+    except BudgetExceeded:
+        features[~found] = stale_features(cache, missing)
+        fallback[~found] = True
+    else:
+        features[~found], known = fetched.get(missing)
+        fallback[~found] = ~known
+        if not known.all():
+            FALLBACKS["unknown_venues"].inc()
+    return features, fallback
+
+
+def stale_features(cache: VenueCache, venue_ids: np.ndarray) -> np.ndarray:
+    """
+    Retrieve the features of the venues from the cache, including the expired ones, for the venues
+    which could not be queried within the latency budget.
+
+    Args:
+        cache (VenueCache): In-process venue cache.
+        venue_ids (np.ndarray): Array of venue ids to retrieve.
+
+    Returns:
+        np.ndarray: Float32 matrix with the features of each venue, missing for the venues which are not cached.
+    """
+    features, found = cache.lookup(venue_ids, stale=True)
+    features[~found] = np.nan
+    if found.any():
+        FALLBACKS["stale_features"].inc()
+    if not found.all():
+        FALLBACKS["default_features"].inc()
+    return features
+
+
+async def get_venues_async(db: AsyncSession, venue_ids: list[int]) -> VenueTable:
+    """
+    Retrieve the features of venues from the database given their ids, without blocking the event loop.
+
+    Args:
+        db (AsyncSession): SQLAlchemy async database session.
+        venue_ids (list[int]): List of venue ids to retrieve.
+
+    Returns:
+        VenueTable: The table of the found venues.
+    """
+    with STAGES["get_venues"].time():
+        rows = (await db.execute(venues_query, {"venue_ids": venue_ids})).all()
+    DB_ROWS.observe(len(rows))
+    return VenueTable.from_rows(rows)
+
+
+async def get_venues_detached_async(venue_ids: list[int]) -> VenueTable:
+    """
+    Retrieve the features of venues from the database with an async session of its own, see `get_venues_detached`.
+
+    Args:
         venue_ids (list[int]): List of venue ids to retrieve.
 
     Returns:
-        list[models.Venue]: List of Venue objects.
+        VenueTable: The table of the found venues.
+    """
+    async with AsyncSessionLocal() as db:
+        return await get_venues_async(db, venue_ids)
+
+
+async def fetch_venues_async(
+    query: Callable[[list[int]], Awaitable[VenueTable]],
+    cache: VenueCache,
+    coalescer: Optional[VenueCoalescer],
+    venue_ids: np.ndarray,
+) -> VenueTable:
+    """
+    Query the venues from the database without blocking the event loop, see `fetch_venues`.
+
+    Args:
+        query (Callable[[list[int]], Awaitable[VenueTable]]): The coroutine function querying the database
+            for a list of venue ids.
+        cache (VenueCache): In-process venue cache.
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled.
+        venue_ids (np.ndarray): Array of venue ids to retrieve.
+
+    Returns:
+        VenueTable: The table of the found venues.
+    """
+    venue_ids = np.unique(venue_ids).tolist()
+    fetched = await (query(venue_ids) if coalescer is None else coalescer.fetch_async(venue_ids, query))
+    cache.put(fetched.venue_ids, fetched.features)
+    return fetched
+
+
+async def get_venue_features_async(
+    db: AsyncSession,
+    cache: VenueCache,
+    venue_ids: np.ndarray,
+    snapshot: Optional[Snapshot] = None,
+    coalescer: Optional[VenueCoalescer] = None,
+    budget: Optional[Budget] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieve the features of the venues without blocking the event loop, see `get_venue_features`.
+
+    Args:
+        db (AsyncSession): SQLAlchemy async database session.
+        cache (VenueCache): In-process venue cache.
+        venue_ids (np.ndarray): Array of venue ids to retrieve.
+        snapshot (Optional[Snapshot]): Memory-mapped venue snapshot, if it is enabled (default: None).
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled (default: None).
+        budget (Optional[Budget]): The latency budget of the request, not limited if not set (default: None).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Float32 matrix with the features of each venue and a mask of the venues
+            which got fallback features.
     """
-    return db.query(models.Venue).filter(models.Venue.venue_id.in_(venue_ids)).all()
+    fallback = np.zeros(len(venue_ids), dtype=bool)
+    if snapshot is not None and len(snapshot):
+        features, found = snapshot.get(venue_ids)
+        if not found.all():
+            features[~found], fallback[~found] = await get_venue_features_async(
+                db, cache, venue_ids[~found], coalescer=coalescer, budget=budget
+            )
+        return features, fallback
+    features, found = cache.lookup(venue_ids)
+    if found.all():
+        return features, fallback
+    missing = venue_ids[~found]
+    try:
+        if budget is not None and budget.limited:
+            fetched = await budget.share(VENUES_BUDGET).run_async(
+                fetch_venues_async(get_venues_detached_async, cache, coalescer, missing)
+            )
+        else:
+            fetched = await fetch_venues_async(
+                lambda venue_ids: get_venues_async(db, venue_ids), cache, coalescer, missing
+            )
+    except BudgetExceeded:
+        features[~found] = stale_features(cache, missing)
+        fallback[~found] = True
+    else:
+        features[~found], known = fetched.get(missing)
+        fallback[~found] = ~known
+        if not known.all():
+            FALLBACKS["unknown_venues"].inc()
+    return features, fallback
 
 
 def get_db():
@@ -48,82 +346,726 @@ def get_db():
         db.close()
 
 
-def download_weigths():
+async def get_async_db():
     """
-    Download weights from S3 and store them in a local folder.
+    Get an async database session for the current request context.
+
+    Yields:
+        AsyncSession: SQLAlchemy async database session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_s3_client():
+    """
+    Create a client of the object storage.
+
+    boto3 is imported only here, as it is slow to import and only needed when the weights are downloaded.
 
     Returns:
-        str: Absolute path to the downloaded weights file.
+        S3.Client: The boto3 S3 client.
     """
+    import boto3
+
     s3_settings = settings.s3
-    s3_client = boto3.client(
+    return boto3.client(
         service_name=s3_settings.service_name,
         endpoint_url=s3_settings.url,
         aws_access_key_id=s3_settings.access_key,
         aws_secret_access_key=s3_settings.secret_key,
     )
 
+
+def get_weights_source() -> S3WeightsSource:
+    """
+    Get the weights object in the S3 bucket.
+
+    Returns:
+        S3WeightsSource: The weights object.
+    """
+    s3_settings = settings.s3
+    return S3WeightsSource(get_s3_client(), s3_settings.bucket, f"{s3_settings.folder}/{s3_settings.weights}")
+
+
+def download_weigths():
+    """
+    Download weights from S3 and store them in a local folder, reusing the weights downloaded before
+    if their ETag still matches, see `cached_download`.
+
+    Returns:
+        str: Absolute path to the downloaded weights file.
+    """
     app_settings = settings.app
-    folder = Path(f"{app_settings.folder}")
-    folder.mkdir(parents=True, exist_ok=True)
-    local_path = folder.joinpath(app_settings.weights)
-
-    log.info(f"Downloading weights from S3: {s3_settings.bucket}/{s3_settings.folder}/{s3_settings.weights}")
-    s3_client.download_file(
-        s3_settings.bucket,
-        f"{s3_settings.folder}/{s3_settings.weights}",
-        str(local_path.absolute()),
-    )
-    log.info(f"Downloaded weights into: {local_path.absolute()}")
-    return local_path.absolute()
+    local_path = Path(f"{app_settings.folder}").joinpath(app_settings.weights).absolute()
+    return cached_download(get_weights_source(), local_path)
+
+
+def get_ranker(request: Request):
+    """
+    Retrieve the ranker from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        RankerBackend: The inference backend, or the MicroBatcher wrapping it if batching is enabled.
+    """
+    return request.app.state.ranker
+
+
+async def score_async(ranker, executor: ThreadPoolExecutor, data: np.ndarray) -> np.ndarray:
+    """
+    Score the input matrix without blocking the event loop.
+
+    A micro-batcher scores the matrix in its own thread, any other ranker is run in the bounded thread pool.
+
+    Args:
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        executor (ThreadPoolExecutor): The bounded thread pool for the ranker.
+        data (np.ndarray): The input matrix of the ranker.
+
+    Returns:
+        np.ndarray: The array of predicted scores.
+    """
+    if isinstance(ranker, (MicroBatcher, PinnedBatcher)):
+        return await asyncio.wrap_future(ranker.submit(data))
+    return await asyncio.get_running_loop().run_in_executor(executor, ranker.predict, data)
 
 
-def rows_to_dict(rows: list[models.Venue]) -> dict[int, list]:
+def get_scores(
+    ranker, venue_cache: VenueCache, score_cache: Optional[ScoreCache], venue_ids: np.ndarray, data: np.ndarray
+) -> np.ndarray:
     """
-    Convert a list of Venue objects to a dictionary with venue ids as keys and
-    a list of feature values as values.
+    Score the input matrix, serving the rows scored before from the score cache and predicting only the others.
 
     Args:
-        rows (list[models.Venue]): List of Venue objects.
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        venue_cache (VenueCache): In-process venue cache the venue features were read from.
+        score_cache (Optional[ScoreCache]): In-process score cache, every row is predicted if it is not set.
+        venue_ids (np.ndarray): Array of venue ids, one per row.
+        data (np.ndarray): The input matrix of the ranker.
 
     Returns:
-        dict[int, list]: Dictionary with venue ids as keys and feature values as values.
+        np.ndarray: The array of predicted scores.
+    """
+    if score_cache is None:
+        return ranker.predict(data)
+    version = (ranker.version, venue_cache.version)
+    scores, found = score_cache.lookup(venue_ids, data, version)
+    if not found.all():
+        missing = ~found
+        predictions = ranker.predict(data[missing])
+        score_cache.put(venue_ids[missing], data[missing], predictions, version)
+        scores[missing] = predictions
+    return scores
+
+
+async def get_scores_async(
+    ranker,
+    executor: ThreadPoolExecutor,
+    venue_cache: VenueCache,
+    score_cache: Optional[ScoreCache],
+    venue_ids: np.ndarray,
+    data: np.ndarray,
+) -> np.ndarray:
+    """
+    Score the input matrix without blocking the event loop, see `get_scores` and `score_async`.
+
+    Args:
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        executor (ThreadPoolExecutor): The bounded thread pool for the ranker.
+        venue_cache (VenueCache): In-process venue cache the venue features were read from.
+        score_cache (Optional[ScoreCache]): In-process score cache, every row is predicted if it is not set.
+        venue_ids (np.ndarray): Array of venue ids, one per row.
+        data (np.ndarray): The input matrix of the ranker.
+
+    Returns:
+        np.ndarray: The array of predicted scores.
+    """
+    if score_cache is None:
+        return await score_async(ranker, executor, data)
+    version = (ranker.version, venue_cache.version)
+    scores, found = score_cache.lookup(venue_ids, data, version)
+    if not found.all():
+        missing = ~found
+        predictions = await score_async(ranker, executor, data[missing])
+        score_cache.put(venue_ids[missing], data[missing], predictions, version)
+        scores[missing] = predictions
+    return scores
+
+
+def score_venues(
+    db: Session,
+    ranker,
+    cache: VenueCache,
+    snapshot: Optional[Snapshot],
+    coalescer: Optional[VenueCoalescer],
+    score_cache: Optional[ScoreCache],
+    score_table: Optional[ScoreTable],
+    venue_ids: np.ndarray,
+    is_new_user: Union[bool, np.ndarray],
+    flags: np.ndarray,
+    budget: Budget,
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    return dict(
-        [
-            (
-                row.venue_id,
-                [
-                    row.conversions_per_impression,
-                    row.price_range,
-                    row.rating,
-                    row.popularity,
-                    row.retention_rate,
-                ],
+    Score the venues, gathering the scores of the precomputed score table and scoring the other venues live.
+
+    The venues which are not found get missing features, as do the venues which could not be queried
+    within the latency budget and have no stale features in the cache. If the ranker exceeds the budget,
+    the venues scored live are ranked after the venues of the score table, in the input order.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        cache (VenueCache): In-process venue cache.
+        snapshot (Optional[Snapshot]): Memory-mapped venue snapshot, if it is enabled.
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled.
+        score_cache (Optional[ScoreCache]): In-process score cache, if it is enabled.
+        score_table (Optional[ScoreTable]): Precomputed score table, if it is enabled.
+        venue_ids (np.ndarray): Array of venue ids.
+        is_new_user (Union[bool, np.ndarray]): Whether the user is new, one value or one value per venue.
+        flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+        budget (Budget): The latency budget of the request.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The array of predicted scores and a mask of the venues scored
+            with a fallback.
+    """
+    is_new_user = np.broadcast_to(is_new_user, venue_ids.shape)
+    degraded = np.zeros(len(venue_ids), dtype=bool)
+    ranker = pinned_ranker(ranker)
+    score_table = matching_table(score_table, ranker)
+    with STAGES["score_table"].time():
+        scores, found = lookup_scores(score_table, venue_ids, is_new_user, flags)
+    if found.all():
+        return scores, degraded
+    missing = ~found
+    venue_ids, is_new_user, flags = venue_ids[missing], is_new_user[missing], flags[missing]
+
+    # retrieve data about each distinct venue only once, whatever the number of times it appears in the request
+    with STAGES["venues"].time():
+        unique_ids, inverse = np.unique(venue_ids, return_inverse=True)
+        venue_features, fallback = get_venue_features(db, cache, unique_ids, snapshot, coalescer, budget)
+        venue_features = venue_features[inverse]
+        degraded[missing] = fallback[inverse]
+    with STAGES["features"].time():
+        data = build_features(is_new_user, flags, venue_features)
+    with STAGES["model"].time():
+        try:
+            predictions = budget.run(get_scores, ranker, cache, score_cache, venue_ids, data)
+        except BudgetExceeded:
+            return input_order(scores, missing)
+        scores[missing] = _round_like(score_table, predictions)
+    return scores, degraded
+
+
+async def score_venues_async(
+    db: AsyncSession,
+    ranker,
+    executor: ThreadPoolExecutor,
+    cache: VenueCache,
+    snapshot: Optional[Snapshot],
+    coalescer: Optional[VenueCoalescer],
+    score_cache: Optional[ScoreCache],
+    score_table: Optional[ScoreTable],
+    venue_ids: np.ndarray,
+    is_new_user: Union[bool, np.ndarray],
+    flags: np.ndarray,
+    budget: Budget,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Score the venues without blocking the event loop, see `score_venues`.
+
+    Args:
+        db (AsyncSession): SQLAlchemy async database session.
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        executor (ThreadPoolExecutor): The bounded thread pool for the ranker.
+        cache (VenueCache): In-process venue cache.
+        snapshot (Optional[Snapshot]): Memory-mapped venue snapshot, if it is enabled.
+        coalescer (Optional[VenueCoalescer]): Venue lookup coalescer, if it is enabled.
+        score_cache (Optional[ScoreCache]): In-process score cache, if it is enabled.
+        score_table (Optional[ScoreTable]): Precomputed score table, if it is enabled.
+        venue_ids (np.ndarray): Array of venue ids.
+        is_new_user (Union[bool, np.ndarray]): Whether the user is new, one value or one value per venue.
+        flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+        budget (Budget): The latency budget of the request.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The array of predicted scores and a mask of the venues scored
+            with a fallback.
+    """
+    is_new_user = np.broadcast_to(is_new_user, venue_ids.shape)
+    degraded = np.zeros(len(venue_ids), dtype=bool)
+    ranker = pinned_ranker(ranker)
+    score_table = matching_table(score_table, ranker)
+    with STAGES["score_table"].time():
+        scores, found = lookup_scores(score_table, venue_ids, is_new_user, flags)
+    if found.all():
+        return scores, degraded
+    missing = ~found
+    venue_ids, is_new_user, flags = venue_ids[missing], is_new_user[missing], flags[missing]
+    with STAGES["venues"].time():
+        unique_ids, inverse = np.unique(venue_ids, return_inverse=True)
+        venue_features, fallback = await get_venue_features_async(db, cache, unique_ids, snapshot, coalescer, budget)
+        venue_features = venue_features[inverse]
+        degraded[missing] = fallback[inverse]
+    with STAGES["features"].time():
+        data = build_features(is_new_user, flags, venue_features)
+    with STAGES["model"].time():
+        try:
+            predictions = await budget.run_async(
+                get_scores_async(ranker, executor, cache, score_cache, venue_ids, data)
             )
-            for row in rows
-        ]
-    )
+        except BudgetExceeded:
+            return input_order(scores, missing)
+        scores[missing] = _round_like(score_table, predictions)
+    return scores, degraded
 
 
-def get_ranker(request: Request):
+def input_order(scores: np.ndarray, missing: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     """
-    Retrieve the CatBoostRanker model from the application state.
+    Give a fallback score to the venues which could not be scored within the latency budget.
+
+    The venues found in the score table keep their scores, the missing ones get one score below all of them,
+    which the stable sort keeps in the input order, after the venues of the score table.
+
+    Args:
+        scores (np.ndarray): Array of the scores of the venues, only meaningful for the venues found in the table.
+        missing (np.ndarray): Boolean mask of the venues which are not found in the score table.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The array of scores and a mask of the venues scored with a fallback,
+            the missing ones.
+    """
+    FALLBACKS["input_order"].inc()
+    found = scores[~missing]
+    scores[missing] = found.min() - 1 if len(found) else 0
+    return scores, missing.copy()
+
+
+def pinned_ranker(ranker):
+    """
+    Resolve the ranker of a request once, so the ranker swapped into the micro-batcher meanwhile is not used.
+
+    Args:
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+
+    Returns:
+        RankerBackend: The inference backend, or a view of the MicroBatcher pinned to the backend it wraps now.
+    """
+    if isinstance(ranker, MicroBatcher):
+        return ranker.pin()
+    return ranker
+
+
+def matching_table(score_table: Optional[ScoreTable], ranker) -> Optional[ScoreTable]:
+    """
+    Check that the score table was computed with the model of the ranker.
+
+    The ranker and the score table are swapped one after the other, see `swap_ranker`, so a request may get
+    the new ranker with the previous table, or the other way round. The table is then ignored and all the venues
+    are scored live, so that the scores of one ranking always come from the same model.
+
+    Args:
+        score_table (Optional[ScoreTable]): Precomputed score table, if it is enabled.
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+
+    Returns:
+        Optional[ScoreTable]: The score table if it matches the model of the ranker, None otherwise.
+    """
+    if score_table is None or score_table.version != ranker.version:
+        return None
+    return score_table
+
+
+def lookup_scores(
+    score_table: Optional[ScoreTable], venue_ids: np.ndarray, is_new_user: np.ndarray, flags: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gather the scores of the venues from the precomputed score table, see `ScoreTable.lookup`.
+
+    Args:
+        score_table (Optional[ScoreTable]): Precomputed score table, no venue is found if it is not set.
+        venue_ids (np.ndarray): Array of venue ids.
+        is_new_user (np.ndarray): Boolean array, whether the user is new, one value per venue.
+        flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The array of scores and a mask of the venues found in the table.
+    """
+    if score_table is None:
+        return np.zeros(len(venue_ids)), np.zeros(len(venue_ids), dtype=bool)
+    return score_table.lookup(venue_ids, is_new_user, flags)
+
+
+def _round_like(score_table: Optional[ScoreTable], scores: np.ndarray) -> np.ndarray:
+    # the live scores are rounded to the precision of the score table, so they are ranked alike
+    return scores.astype(np.float32) if score_table is not None else scores
+
+
+def get_cache(request: Request):
+    """
+    Retrieve the venue cache from the application state.
 
     Args:
         request (Request): FastAPI request object.
 
     Returns:
-        CatBoostRanker: CatBoostRanker model.
+        VenueCache: In-process venue cache.
     """
-    return request.app.state.ranker
+    return request.app.state.cache
+
+
+def get_score_cache(request: Request):
+    """
+    Retrieve the score cache from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        Optional[ScoreCache]: In-process score cache, `None` if it is not enabled.
+    """
+    return request.app.state.score_cache
+
+
+def get_score_table(request: Request):
+    """
+    Retrieve the precomputed score table from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        Optional[ScoreTable]: Precomputed score table, `None` if it is not enabled.
+    """
+    return request.app.state.score_table
+
+
+def get_snapshot(request: Request):
+    """
+    Retrieve the memory-mapped venue snapshot from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        Optional[Snapshot]: Memory-mapped venue snapshot, `None` if it is not enabled.
+    """
+    return request.app.state.snapshot
+
+
+def get_coalescer(request: Request):
+    """
+    Retrieve the venue lookup coalescer from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        Optional[VenueCoalescer]: Venue lookup coalescer, `None` if it is not enabled.
+    """
+    return request.app.state.coalescer
+
+
+def get_budget(request: Request) -> Budget:
+    """
+    Start the latency budget of a request.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        Budget: The latency budget of the request, not limited if it is not configured.
+    """
+    budget_ms = settings.app.latency_budget_ms
+    return Budget(None if budget_ms is None else budget_ms / 1e3, request.app.state.budget_executor)
+
+
+def get_executor(request: Request):
+    """
+    Retrieve the thread pool running the ranker in the async mode from the application state.
+
+    Args:
+        request (Request): FastAPI request object.
+
+    Returns:
+        ThreadPoolExecutor: The bounded thread pool for the ranker.
+    """
+    return request.app.state.executor
+
+
+def collect_metrics(app: FastAPI):
+    """
+    Collect the metrics owned by the objects in the application state.
+
+    Args:
+        app (FastAPI): FastAPI application object.
+
+    Yields:
+        tuple: Samples of (name, type, help, labels, value) for the venue cache and the micro-batcher.
+    """
+    stats = app.state.cache.stats()
+    yield "ranker_venue_cache_size", "gauge", "Number of venues in the venue cache", {}, stats["size"]
+    for name in ("hits", "misses", "evictions"):
+        yield f"ranker_venue_cache_{name}_total", "counter", f"Number of venue cache {name}", {}, stats[name]
+    if app.state.score_cache is not None:
+        stats = app.state.score_cache.stats()
+        yield "ranker_score_cache_size", "gauge", "Number of venues in the score cache", {}, stats["size"]
+        for name in ("hits", "misses", "evictions"):
+            yield f"ranker_score_cache_{name}_total", "counter", f"Number of score cache {name}", {}, stats[name]
+    if app.state.coalescer is not None:
+        stats = app.state.coalescer.stats()
+        yield "ranker_coalesced_lookups_total", "counter", "Number of coalesced venue lookups", {}, stats["requests"]
+        yield "ranker_coalesced_queries_total", "counter", "Number of coalesced venue queries", {}, stats["queries"]
+        for name in ("fetched", "shared"):
+            yield f"ranker_coalesced_{name}_venues_total", "counter", f"Number of {name} venues", {}, stats[name]
+    if app.state.snapshot is not None:
+        snapshot = app.state.snapshot
+        yield "ranker_venue_snapshot_venues", "gauge", "Number of venues in the venue snapshot", {}, len(snapshot)
+        yield "ranker_venue_snapshot_version", "gauge", "Version of the venue snapshot", {}, snapshot.version
+    if app.state.score_table is not None:
+        score_table = app.state.score_table
+        yield "ranker_score_table_venues", "gauge", "Number of venues in the score table", {}, len(score_table)
+        yield "ranker_score_table_bytes", "gauge", "Memory footprint of the score table", {}, score_table.nbytes
+    ranker = app.state.ranker
+    if isinstance(ranker, MicroBatcher):
+        yield "ranker_batch_rows", "histogram", "Number of rows per micro-batch", {}, ranker.batch_rows
+        yield "ranker_batch_requests", "histogram", "Number of requests per micro-batch", {}, ranker.batch_requests
+        yield "ranker_batch_queue_wait_seconds", "histogram", "Time spent waiting for a micro-batch", {}, ranker.queue_wait
+
+
+def read_venues() -> VenueTable:
+    """
+    Read the whole `info` table, from its binary snapshot or its CSV dump if one is set, or from the database.
+
+    Returns:
+        VenueTable: The table of all the venues.
+    """
+    if settings.app.venues_snapshot:
+        return Snapshot.open(settings.app.venues_snapshot)
+    if settings.app.venues_csv:
+        return VenueTable.from_csv(settings.app.venues_csv)
+    db = SessionLocal()
+    try:
+        return get_all_venues(db)
+    finally:
+        db.close()
+
+
+def build_score_table(ranker, venues: VenueTable) -> ScoreTable:
+    """
+    Score every venue under every combination of the flags, logging the memory footprint of the score table.
+
+    Args:
+        ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+        venues (VenueTable): The table of all the venues.
+
+    Returns:
+        ScoreTable: The table of scores.
+    """
+    with startup_phase("score_table").time():
+        score_table = ScoreTable.build(ranker, venues)
+    log.info(
+        f"Score table: {len(score_table)} venues x {COMBINATIONS} combinations, "
+        f"{score_table.nbytes / 2**20:.1f} MiB ({score_table.nbytes / max(len(score_table), 1):.0f} bytes per venue)"
+    )
+    return score_table
+
+
+def refresh_venues(app: FastAPI) -> int:
+    """
+    Reload the whole `info` table, dropping the venue cache and the scores computed from the previous venues.
+
+    The venue snapshot, if it is enabled, is mapped again, so a snapshot exported over the previous one
+    is swapped in. The venue cache is filled with the reloaded venues if it is preloaded, and the score table
+    is rebuilt if it is enabled.
+
+    Args:
+        app (FastAPI): FastAPI application object.
+
+    Returns:
+        int: The number of reloaded venues.
+    """
+    venues = read_venues()
+    if settings.app.venues_snapshot:
+        log.info(f"Venue snapshot: mapped {len(venues)} venues of the version {venues.version}")
+        app.state.snapshot = venues
+    app.state.cache.clear()
+    if settings.app.cache_preload:
+        app.state.cache.put(venues.venue_ids, venues.features)
+        log.info(f"Venue cache preloaded with {len(app.state.cache)} venues")
+    if settings.app.score_table:
+        app.state.score_table = build_score_table(app.state.ranker, venues)
+    return len(venues)
+
+
+def swap_ranker(app: FastAPI, path: Path) -> None:
+    """
+    Load new weights into a new inference backend, warm it up and swap it in.
+
+    The requests in flight keep scoring with the ranker they got, including the ones queued in the micro-batcher,
+    which each request pins once, see `pinned_ranker`, while the new requests get the new ranker. The score table,
+    if it is enabled, is rebuilt with the new ranker before the swap, and the score cache drops the previous scores
+    on the first lookup with the new ranker.
+    A request which gets the ranker and the score table of different models between the two assignments ignores
+    the table, see `matching_table`.
+
+    Args:
+        app (FastAPI): FastAPI application object.
+        path (Path): The path to the new `.cbm` weights file.
+
+    Returns:
+        None
+    """
+    ranker = load_backend(settings.app.backend, path)
+    ranker.predict(np.zeros((1, 3 + len(FEATURES)), dtype=np.float32))
+    score_table = build_score_table(ranker, read_venues()) if settings.app.score_table else None
+    if isinstance(app.state.ranker, MicroBatcher):
+        app.state.ranker.ranker = ranker
+    else:
+        app.state.ranker = ranker
+    if score_table is not None:
+        app.state.score_table = score_table
+    MODEL_RELOADS.inc()
+    log.info(f"Ranker dependency: swapped in the model version {ranker.version}")
 
 
 def on_startup(app: FastAPI) -> None:
     """
     Function to be called on application startup.
 
-    Downloads the CatBoostRanker model from S3 and initializes it.
+    Downloads the CatBoostRanker model from S3, unless the local weights are used, and loads it into
+    the configured inference backend, wrapping it into a micro-batcher if batching is enabled.
+    Then creates the venue cache and the score cache if it is enabled, and optionally maps the venue snapshot
+    and reads the whole `info` table into the venue cache and the precomputed score table, see `refresh_venues`.
+    In the async mode, also creates the bounded thread pool running the ranker off the event loop.
+
+    No thread is started here, as the App may be loaded by the gunicorn master process before it forks
+    the workers, see `start_threads`.
+
+    Args:
+        app (FastAPI): FastAPI application object.
+
+    Returns:
+        None
+    """
+    app_settings = settings.app
+    local_path = Path(app_settings.folder).joinpath(app_settings.weights).absolute()
+    if app_settings.reload_interval is not None:
+        # the version is read before the download, so weights published meanwhile are reloaded on the first poll
+        if app_settings.download:
+            source = get_weights_source()
+        else:
+            source = FileWeightsSource(local_path)
+        app.state.watcher = WeightsWatcher(
+            source,
+            load=lambda path: swap_ranker(app, path),
+            interval=app_settings.reload_interval,
+            folder=local_path.parent,
+            path=local_path if app_settings.download else None,
+            version=source.version(),
+        )
+
+    with startup_phase("download").time():
+        if app_settings.download:
+            path = download_weigths()
+        else:
+            path = local_path
+            log.info(f"Using local weights: {path}")
+
+    log.info(f"Ranker dependency: initializing the '{app_settings.backend}' backend")
+    with startup_phase("load_model").time():
+        app.state.ranker = load_backend(app_settings.backend, path)
+    if app_settings.batching:
+        log.info(
+            f"Ranker dependency: batching up to {app_settings.batch_max_rows} rows or {app_settings.batch_wait_us} us"
+        )
+        app.state.ranker = MicroBatcher(
+            app.state.ranker, max_wait=app_settings.batch_wait_us / 1e6, max_rows=app_settings.batch_max_rows
+        )
+
+    app.state.coalescer = None
+    if app_settings.coalescing:
+        log.info(f"Venue coalescer dependency: sharing the venue queries for {app_settings.coalesce_wait_us} us")
+        app.state.coalescer = VenueCoalescer(max_wait=app_settings.coalesce_wait_us / 1e6)
+
+    log.info("Venue cache dependency: initializing")
+    app.state.cache = VenueCache(capacity=app_settings.cache_size, ttl=app_settings.cache_ttl)
+
+    app.state.score_cache = None
+    if app_settings.score_cache:
+        log.info(f"Score cache dependency: initializing for {app_settings.score_cache_size} venues")
+        app.state.score_cache = ScoreCache(capacity=app_settings.score_cache_size)
+
+    app.state.snapshot = None
+    app.state.score_table = None
+    if app_settings.venues_snapshot or app_settings.cache_preload or app_settings.score_table:
+        with startup_phase("preload_venues").time():
+            refresh_venues(app)
+
+    if app_settings.async_mode:
+        log.info(f"Ranker executor: initializing with {app_settings.inference_workers} workers")
+        app.state.executor = ThreadPoolExecutor(max_workers=app_settings.inference_workers, thread_name_prefix="ranker")
+
+    app.state.budget_executor = None
+    if app_settings.latency_budget_ms is not None:
+        log.info(f"Latency budget: answering within {app_settings.latency_budget_ms} ms")
+        if not app_settings.async_mode:
+            # the threads waiting for the database connections and the ranker, the requests exceeding the budget
+            # leave their steps running there
+            workers = db.pool_size + db.max_overflow + app_settings.inference_workers
+            app.state.budget_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="budget")
+
+    REGISTRY.register_collector(lambda: collect_metrics(app))
+
+    phases = startup_phases()
+    log.info(
+        f"Started in {sum(phases.values()):.3f} s: "
+        + ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in phases.items())
+    )
+
+
+def start_threads(app: FastAPI) -> None:
+    """
+    Start the background threads of the App, in the worker process serving it.
+
+    Starts the weights watcher swapping in the new weights as soon as they are published, if it is enabled.
+    The micro-batcher and the ranker thread pool start their threads on their first use.
+
+    Args:
+        app (FastAPI): FastAPI application object.
+
+    Returns:
+        None
+    """
+    if settings.app.reload_interval is not None:
+        log.info(f"Weights watcher: checking the published weights every {settings.app.reload_interval} s")
+        app.state.watcher.start()
+
+
+def on_fork() -> None:
+    """
+    Function to be called in a worker process forked from the process which loaded the App.
+
+    Drops the database connections inherited from the parent process without closing them,
+    so the parent and the other workers keep using theirs, and the worker opens its own connections.
+
+    Returns:
+        None
+    """
+    engine.dispose(close=False)
+    if settings.app.async_mode:
+        async_engine.sync_engine.dispose(close=False)
+
+
+async def on_shutdown(app: FastAPI) -> None:
+    """
+    Function to be called on application shutdown.
+
+    Stops the weights watcher, the micro-batcher, the thread pool of the latency budget and, if the App runs
+    in the async mode, the ranker thread pool and the connections of the async engine.
 
     Args:
         app (FastAPI): FastAPI application object.
@@ -131,6 +1073,12 @@ def on_startup(app: FastAPI) -> None:
     Returns:
         None
     """
-    path = download_weigths()
-    log.info("Ranker dependency: initializing")
-    app.state.ranker = CatBoostRanker().load_model(path)
+    if settings.app.reload_interval is not None:
+        app.state.watcher.stop()
+    if isinstance(app.state.ranker, MicroBatcher):
+        app.state.ranker.close()
+    if app.state.budget_executor is not None:
+        app.state.budget_executor.shutdown(wait=False)
+    if settings.app.async_mode:
+        app.state.executor.shutdown(wait=False)
+        await async_engine.dispose()
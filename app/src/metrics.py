@@ -0,0 +1,262 @@
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Iterable, Optional, Sequence
+
+# bucket bounds of the latency histograms in seconds and of the size histograms in items
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class _Timer:
+    """A context manager passing the duration of its block to a callback."""
+
+    __slots__ = ("_callback", "_started")
+
+    def __init__(self, callback: Callable[[float], None]) -> None:
+        self._callback = callback
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._callback(time.perf_counter() - self._started)
+
+
+class Counter:
+    """A monotonically increasing count."""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the count.
+
+        Args:
+            amount (float): The increment (default: 1.0).
+        """
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value which can go up and down, like the duration of the last startup phase."""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        """Set the value.
+
+        Args:
+            value (float): The new value.
+        """
+        self.value = value
+
+    def time(self) -> _Timer:
+        """Set the value to the duration of a block of code.
+
+        Returns:
+            _Timer: A context manager timing its block.
+        """
+        return _Timer(self.set)
+
+
+class Histogram:
+    """A histogram with fixed bucket bounds, cheap enough to be observed on the hot path.
+
+    Attributes:
+        buckets (tuple[float, ...]): The sorted upper bounds of the buckets.
+
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        """Initialize an empty histogram.
+
+        Args:
+            buckets (Sequence[float]): The upper bounds of the buckets.
+        """
+        self.buckets = tuple(sorted(buckets))
+        # one more counter for the values above the last bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Count a value in the bucket with the smallest upper bound which is not below it.
+
+        Args:
+            value (float): The observed value.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        """Observe the duration of a block of code in seconds.
+
+        Returns:
+            _Timer: A context manager timing its block.
+        """
+        return _Timer(self.observe)
+
+    def snapshot(self) -> dict:
+        """Collect the state of the histogram.
+
+        Returns:
+            dict: The bucket bounds, the count of values in each bucket, the last count being the values above
+                the last bound, with the total count and sum of the observed values.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        return {"buckets": list(self.buckets), "counts": counts, "count": sum(counts), "sum": total}
+
+
+# a sample of a collector: name, type, help, labels and either a number or a Histogram
+Sample = tuple[str, str, str, dict, object]
+
+
+class Registry:
+    """A registry of the metrics of the process, rendered in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._metrics = dict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        """Get or create a counter.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            **labels (str): The labels of this series of the metric.
+
+        Returns:
+            Counter: The counter of the series.
+        """
+        return self._get(name, "counter", help, labels, Counter)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        """Get or create a gauge, see `counter`."""
+        return self._get(name, "gauge", help, labels, Gauge)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float], **labels: str) -> Histogram:
+        """Get or create a histogram, see `counter`."""
+        return self._get(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register a function yielding samples of metrics owned by other objects, called on every rendering.
+
+        Args:
+            collector (Callable[[], Iterable[Sample]]): A function yielding (name, type, help, labels, value) samples.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all the metrics.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            samples = [
+                (name, kind, help, labels, metric) for (name, labels), (kind, help, metric) in self._metrics.items()
+            ]
+            collectors = list(self._collectors)
+        for collector in collectors:
+            samples.extend(
+                (name, kind, help, tuple(sorted(labels.items())), value)
+                for name, kind, help, labels, value in collector()
+            )
+
+        lines, described = [], set()
+        for name, kind, help, labels, metric in sorted(samples, key=lambda sample: sample[0]):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            if isinstance(metric, Histogram):
+                snapshot = metric.snapshot()
+                cumulative = 0
+                for bound, count in zip(snapshot["buckets"] + [math.inf], snapshot["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+            else:
+                value = metric.value if isinstance(metric, (Counter, Gauge)) else metric
+                lines.append(f"{name}{_labels(labels)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _get(self, name: str, kind: str, help: str, labels: dict, factory: Callable):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._metrics:
+                self._metrics[key] = (kind, help, factory())
+            return self._metrics[key][2]
+
+
+def _labels(labels: Optional[tuple]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# the registry of the process, served on `/metrics`
+REGISTRY = Registry()
+
+# the duration of each stage of the scoring endpoints
+STAGES = {
+    stage: REGISTRY.histogram(
+        "ranker_stage_seconds", "Duration of a stage of the scoring endpoints", LATENCY_BUCKETS, stage=stage
+    )
+    for stage in ("score_table", "venues", "get_venues", "features", "model", "sort", "response")
+}
+# the size of the requests and of the database responses
+REQUEST_VENUES = REGISTRY.histogram("ranker_request_venues", "Number of venues per scoring request", SIZE_BUCKETS)
+DB_ROWS = REGISTRY.histogram("ranker_db_rows", "Number of rows returned by a venues query", SIZE_BUCKETS)
+# the number of model weights swapped in while the App is running
+MODEL_RELOADS = REGISTRY.counter("ranker_model_reloads_total", "Number of new model weights swapped in")
+# the fallbacks of the scoring endpoints, counted once per request which used them:
+# - unknown_venues: venues missing from the `info` table, scored with missing features,
+# - stale_features: the venue query exceeded the budget, the expired features of the venue cache were used,
+# - default_features: the venue query exceeded the budget, venues without stale features got missing features,
+# - input_order: the ranker exceeded the budget, the venues were returned in the input order.
+FALLBACKS = {
+    reason: REGISTRY.counter("ranker_fallbacks_total", "Number of requests answered with a fallback", reason=reason)
+    for reason in ("unknown_venues", "stale_features", "default_features", "input_order")
+}
+
+# the gauges of the startup phases, in the order the phases started
+_STARTUP_PHASES = dict()
+
+
+def startup_phase(phase: str) -> Gauge:
+    """Get the gauge of the duration of a startup phase.
+
+    Args:
+        phase (str): The name of the startup phase.
+
+    Returns:
+        Gauge: The gauge holding the duration of the phase in seconds.
+    """
+    gauge = REGISTRY.gauge("ranker_startup_phase_seconds", "Duration of a phase of the service startup", phase=phase)
+    _STARTUP_PHASES.setdefault(phase, gauge)
+    return gauge
+
+
+def startup_phases() -> dict:
+    """Collect the durations of the startup phases.
+
+    Returns:
+        dict: The duration in seconds of each startup phase, in the order the phases started.
+    """
+    return {phase: gauge.value for phase, gauge in _STARTUP_PHASES.items()}
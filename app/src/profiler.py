@@ -0,0 +1,79 @@
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """A low-overhead sampling profiler of all the threads of the process.
+
+    A background thread periodically records the stack of every other thread. The stacks are aggregated
+    in the collapsed format, one `frame;frame;frame count` line per distinct stack, ready for flame graph tools.
+
+    Attributes:
+        interval (float): The time between two samples in seconds.
+        samples (int): The number of samples taken since the profiler was started.
+
+    """
+
+    def __init__(self) -> None:
+        self.interval = 0.005
+        self.samples = 0
+        self._stacks = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float) -> None:
+        """Start sampling, dropping the stacks of the previous run.
+
+        Args:
+            interval (float): The time between two samples in seconds.
+
+        Raises:
+            RuntimeError: If the profiler is already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("The profiler is already running")
+            self.interval = interval
+            self.samples = 0
+            self._stacks = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling.
+
+        Raises:
+            RuntimeError: If the profiler is not running.
+
+        Returns:
+            str: The sampled stacks in the collapsed format, the most frequent first.
+        """
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("The profiler is not running")
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename}:{code.co_name}")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
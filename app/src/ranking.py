@@ -0,0 +1,156 @@
+from typing import Optional
+
+import numpy as np
+import orjson
+from fastapi import Response
+
+from src.metrics import STAGES
+from src.schemas import PredictResponse
+
+
+def top_order(scores: np.ndarray, top_k: Optional[int] = None) -> np.ndarray:
+    """Find the positions of the best scores, in descending order of the score.
+
+    Ties keep the input order, like a stable sort of all the scores would. If only the `top_k` best scores are
+    requested, they are first selected with a partial partition and then only them are sorted.
+
+    Args:
+        scores (np.ndarray): Array of predicted scores.
+        top_k (Optional[int]): The number of best scores to keep, all of them if not set (default: None).
+
+    Returns:
+        np.ndarray: The positions of the kept scores, sorted by score in descending order.
+    """
+    if top_k is None or top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    # the k-th best score, then all the scores at least as good, so the ties at the boundary are kept in input order
+    threshold = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+    candidates = np.flatnonzero(scores >= threshold)
+    return candidates[np.argsort(-scores[candidates], kind="stable")[:top_k]]
+
+
+def rank_venues(
+    venue_ids: np.ndarray, scores: np.ndarray, top_k: Optional[int] = None, degraded: bool = False
+) -> PredictResponse:
+    """Sort the venues by their predicted score.
+
+    Args:
+        venue_ids (np.ndarray): Array of venue ids.
+        scores (np.ndarray): Array of predicted scores, one per venue id.
+        top_k (Optional[int]): The number of best venues to return, all of them if not set (default: None).
+        degraded (bool): Whether some venues were scored with a fallback (default: False).
+
+    Returns:
+        PredictResponse: A response containing the venues sorted by their score in descending order.
+    """
+    with STAGES["sort"].time():
+        order = top_order(scores, top_k)
+    with STAGES["response"].time():
+        return PredictResponse(**_dump_ranking(venue_ids[order], scores[order], degraded))
+
+
+def rank_groups(
+    venue_ids: np.ndarray,
+    scores: np.ndarray,
+    sizes: list[int],
+    top_k: Optional[int] = None,
+    degraded: Optional[np.ndarray] = None,
+) -> list[PredictResponse]:
+    """Split the venues into their groups and sort each group by the predicted score.
+
+    Args:
+        venue_ids (np.ndarray): Array of venue ids concatenated over all the groups.
+        scores (np.ndarray): Array of predicted scores, one per venue id.
+        sizes (list[int]): The number of venues in each group.
+        top_k (Optional[int]): The number of best venues to return per group, all of them if not set (default: None).
+        degraded (Optional[np.ndarray]): The mask of the venues scored with a fallback, none if not set
+            (default: None).
+
+    Returns:
+        list[PredictResponse]: One response per group, containing its venues sorted by score in descending order.
+    """
+    offsets = np.cumsum(sizes)[:-1]
+    return [
+        rank_venues(group_ids, group_scores, top_k, group_degraded)
+        for group_ids, group_scores, group_degraded in zip(
+            np.split(venue_ids, offsets), np.split(scores, offsets), _degraded_groups(degraded, sizes)
+        )
+    ]
+
+
+def _degraded_groups(degraded: Optional[np.ndarray], sizes: list[int]) -> list[bool]:
+    # whether each group has a venue scored with a fallback
+    if degraded is None:
+        return [False] * len(sizes)
+    return [bool(group.any()) for group in np.split(degraded, np.cumsum(sizes)[:-1])]
+
+
+def _dump_ranking(venue_ids: np.ndarray, scores: np.ndarray, degraded: bool = False) -> dict:
+    # the same shape as `PredictResponse`, built from plain Python ints and floats
+    return {
+        "venues_and_scores": [
+            {"venue_id": venue_id, "score": score} for venue_id, score in zip(venue_ids.tolist(), scores.tolist())
+        ],
+        "degraded": bool(degraded),
+    }
+
+
+def rank_venues_fast(
+    venue_ids: np.ndarray, scores: np.ndarray, top_k: Optional[int] = None, degraded: bool = False
+) -> Response:
+    """Sort the venues by their predicted score and serialize them straight to JSON.
+
+    The response has the shape of `PredictResponse` and the same order as `rank_venues`, ties keeping the input
+    order, but it skips the validation of the response models, as the ids and scores come from the App itself.
+
+    Args:
+        venue_ids (np.ndarray): Array of venue ids.
+        scores (np.ndarray): Array of predicted scores, one per venue id.
+        top_k (Optional[int]): The number of best venues to return, all of them if not set (default: None).
+        degraded (bool): Whether some venues were scored with a fallback (default: False).
+
+    Returns:
+        Response: A JSON response containing the venues sorted by their score in descending order.
+    """
+    with STAGES["sort"].time():
+        order = top_order(scores, top_k)
+    with STAGES["response"].time():
+        content = orjson.dumps(_dump_ranking(venue_ids[order], scores[order], degraded))
+    return Response(content=content, media_type="application/json")
+
+
+def rank_groups_fast(
+    venue_ids: np.ndarray,
+    scores: np.ndarray,
+    sizes: list[int],
+    top_k: Optional[int] = None,
+    degraded: Optional[np.ndarray] = None,
+) -> Response:
+    """Sort each group of venues by the predicted score and serialize them straight to JSON, see `rank_venues_fast`.
+
+    Args:
+        venue_ids (np.ndarray): Array of venue ids concatenated over all the groups.
+        scores (np.ndarray): Array of predicted scores, one per venue id.
+        sizes (list[int]): The number of venues in each group.
+        top_k (Optional[int]): The number of best venues to return per group, all of them if not set (default: None).
+        degraded (Optional[np.ndarray]): The mask of the venues scored with a fallback, none if not set
+            (default: None).
+
+    Returns:
+        Response: A JSON response containing one ranking per group, shaped as a list of `PredictResponse`.
+    """
+    with STAGES["sort"].time():
+        # split the groups first, then keep the best venues of each group, as `rank_groups` does
+        offsets = np.cumsum(sizes)[:-1]
+        groups = [
+            (group_ids, group_scores, top_order(group_scores, top_k))
+            for group_ids, group_scores in zip(np.split(venue_ids, offsets), np.split(scores, offsets))
+        ]
+    with STAGES["response"].time():
+        content = orjson.dumps(
+            [
+                _dump_ranking(group_ids[order], group_scores[order], group_degraded)
+                for (group_ids, group_scores, order), group_degraded in zip(groups, _degraded_groups(degraded, sizes))
+            ]
+        )
+    return Response(content=content, media_type="application/json")
@@ -0,0 +1,262 @@
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+log = logging.getLogger("api")
+
+
+class WeightsSource:
+    """The interface of the places the model weights are published to."""
+
+    def version(self) -> str:
+        """Find the current version of the published weights, without downloading them.
+
+        Returns:
+            str: An identifier which changes whenever new weights are published.
+        """
+        raise NotImplementedError
+
+    def download(self, path: Path) -> None:
+        """Download the published weights.
+
+        Args:
+            path (Path): The local path to write the weights to.
+        """
+        raise NotImplementedError
+
+
+class S3WeightsSource(WeightsSource):
+    """The weights object in the S3 bucket, versioned by its ETag and its version id if the bucket is versioned."""
+
+    def __init__(self, client, bucket: str, key: str) -> None:
+        """Initialize the source.
+
+        Args:
+            client: The boto3 S3 client.
+            bucket (str): The bucket of the weights object.
+            key (str): The key of the weights object.
+        """
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+
+    def version(self) -> str:
+        head = self.client.head_object(Bucket=self.bucket, Key=self.key)
+        etag = head["ETag"].strip('"')
+        return f"{etag}:{head.get('VersionId', '')}"
+
+    def etag(self) -> str:
+        """Find the ETag of the weights object, the MD5 hash of its content unless it was uploaded in parts.
+
+        Returns:
+            str: The ETag without its quotes.
+        """
+        return self.client.head_object(Bucket=self.bucket, Key=self.key)["ETag"].strip('"')
+
+    def download(self, path: Path) -> None:
+        self.client.download_file(self.bucket, self.key, str(path))
+
+
+class FileWeightsSource(WeightsSource):
+    """A weights file on the local filesystem, versioned by its modification time and size."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialize the source.
+
+        Args:
+            path (Path): The path to the weights file.
+        """
+        self.path = Path(path)
+
+    def version(self) -> str:
+        stat = self.path.stat()
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def download(self, path: Path) -> None:
+        shutil.copyfile(self.path, path)
+
+
+class WeightsWatcher:
+    """A background thread polling the weights source and handing every new version of the weights over.
+
+    A new version is downloaded to a temporary file, passed to the `load` callback, which loads it and swaps it in,
+    and then optionally moved over the local weights. If any step fails, the current model is kept and the new
+    version is tried again on the next poll.
+
+    Attributes:
+        source (WeightsSource): The place the weights are published to.
+        load (Callable[[Path], None]): The function loading the weights at the given path and swapping them in.
+        interval (float): The time between two polls in seconds.
+        folder (Path): The folder of the temporary files.
+        path (Optional[Path]): The local weights replaced by the new weights once they are loaded.
+        version (Optional[str]): The version of the loaded weights.
+
+    """
+
+    def __init__(
+        self,
+        source: WeightsSource,
+        load: Callable[[Path], None],
+        interval: float,
+        folder: Path,
+        path: Optional[Path] = None,
+        version: Optional[str] = None,
+    ) -> None:
+        """Initialize the watcher, its thread is started by `start`.
+
+        Args:
+            source (WeightsSource): The place the weights are published to.
+            load (Callable[[Path], None]): A function loading the weights at the given path and swapping them in.
+            interval (float): The time between two polls in seconds.
+            folder (Path): The folder of the temporary files, on the same filesystem as the local weights.
+            path (Optional[Path]): The local weights to replace with the new weights once they are loaded,
+                so a restarted App starts with them, left untouched if not set (default: None).
+            version (Optional[str]): The version of the loaded weights (default: None).
+        """
+        self.source = source
+        self.load = load
+        self.interval = interval
+        self.folder = Path(folder)
+        self.path = Path(path) if path is not None else None
+        self.version = version
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start polling the source."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="weights-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling the source, waiting for a reload in progress to finish."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> bool:
+        """Check the source once, and load the new weights if they were published since the last check.
+
+        Returns:
+            bool: Whether new weights were loaded.
+        """
+        version = self.source.version()
+        if version == self.version:
+            return False
+        log.info(f"Weights watcher: loading the weights version {version}")
+        descriptor, name = tempfile.mkstemp(dir=self.folder, prefix=".weights-", suffix=".download")
+        os.close(descriptor)
+        temporary = Path(name)
+        try:
+            self.source.download(temporary)
+            self.load(temporary)
+            if self.path is not None:
+                os.replace(temporary, self.path)
+        finally:
+            temporary.unlink(missing_ok=True)
+        self.version = version
+        log.info(f"Weights watcher: swapped in the weights version {version}")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                log.exception("Weights watcher: failed to reload the weights, keeping the current model")
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on a file, shared with the other processes of the host.
+
+    Args:
+        path (Path): The path to the lock file, created if it does not exist.
+
+    Yields:
+        None: The lock is held within the `with` block.
+    """
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def checksum_matches(path: Path, etag: str) -> bool:
+    """Check a downloaded file against the ETag of its S3 object.
+
+    Args:
+        path (Path): The path to the downloaded file.
+        etag (str): The ETag of the S3 object.
+
+    Returns:
+        bool: Whether the MD5 hash of the file is the ETag, always true for the ETag of a multipart upload,
+            which is not the hash of the content.
+    """
+    if "-" in etag:
+        return True
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest() == etag
+
+
+def cached_download(source: S3WeightsSource, path: Path) -> Path:
+    """Download the weights object, unless the same object was already downloaded.
+
+    The weights are kept next to `path` under a name made of the ETag of the object, so they are reused
+    as long as the ETag matches and the checksum of the file is valid. The processes downloading the weights
+    at the same time, like the workers of one host, share a single download through a file lock.
+    `path` itself is pointed to the cached weights, and the weights of the other ETags are removed.
+
+    Args:
+        source (S3WeightsSource): The weights object in the S3 bucket.
+        path (Path): The local path of the weights, e.g. `/opt/ranker/weights.cbm`.
+
+    Raises:
+        ValueError: If the checksum of the downloaded file does not match the ETag.
+
+    Returns:
+        Path: The path to the cached weights, e.g. `/opt/ranker/weights.<etag>.cbm`.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path.with_name(f".{path.name}.lock")):
+        etag = source.etag()
+        cached = path.with_name(f"{path.stem}.{etag}{path.suffix}")
+        if cached.exists() and checksum_matches(cached, etag):
+            log.info(f"Using the cached weights: {cached}")
+        else:
+            log.info(f"Downloading weights from S3: {source.bucket}/{source.key}")
+            temporary = cached.with_name(f".{cached.name}.download")
+            source.download(temporary)
+            if not checksum_matches(temporary, etag):
+                temporary.unlink()
+                raise ValueError(f"The checksum of the downloaded weights does not match the ETag {etag}")
+            os.replace(temporary, cached)
+            log.info(f"Downloaded weights into: {cached}")
+
+        # the weights are also found under their configured name, for the App started without downloading them
+        if not (path.exists() and os.path.samefile(path, cached)):
+            link = path.with_name(f".{path.name}.link")
+            link.unlink(missing_ok=True)
+            try:
+                os.link(cached, link)
+            except OSError:
+                shutil.copyfile(cached, link)
+            os.replace(link, path)
+        for stale in path.parent.glob(f"{path.stem}.*{path.suffix}"):
+            if stale != cached:
+                stale.unlink(missing_ok=True)
+    return cached
@@ -12,6 +12,7 @@ class PredictResponse(BaseModel):
     """A response containing a list of venues and their scores."""
 
     venues_and_scores: list[SingleResponse]  # A list of SingleResponse objects
+    degraded: bool = False  # Whether fallback features or the input order were used, see `src/budget.py`
 
 
 class PingResponse(BaseModel):
@@ -20,6 +21,39 @@ class PingResponse(BaseModel):
     ping: str  # A string message indicating that the server is alive
 
 
+class RefreshResponse(BaseModel):
+    """A response confirming that the venues were reloaded."""
+
+    venues: int  # The number of venues in the reloaded `info` table
+
+
+class CacheStatsResponse(BaseModel):
+    """A response containing the counters of the in-process venue cache."""
+
+    size: int  # The number of venues currently kept in the cache
+    capacity: int  # The maximum number of venues kept in the cache
+    hits: int  # The number of venue lookups served from the cache
+    misses: int  # The number of venue lookups which went to the database
+    evictions: int  # The number of venues dropped because of the capacity
+
+
+class HistogramSnapshot(BaseModel):
+    """The state of a histogram with fixed bucket bounds."""
+
+    buckets: list[float]  # The upper bounds of the buckets
+    counts: list[int]  # The count of values in each bucket, the last one counts the values above the last bound
+    count: int  # The total count of the observed values
+    sum: float  # The sum of the observed values
+
+
+class BatchingStatsResponse(BaseModel):
+    """A response containing the histograms of the micro-batcher."""
+
+    batch_rows: HistogramSnapshot  # The number of rows per batch
+    batch_requests: HistogramSnapshot  # The number of requests per batch
+    queue_wait: HistogramSnapshot  # The time in seconds the requests spent in the queue
+
+
 class InputVenue(BaseModel):
     """An input venue with its corresponding attributes."""
 
@@ -28,6 +62,13 @@ class InputVenue(BaseModel):
     is_recommended: bool  # A boolean indicating whether the venue is recommended
 
 
+class PredictGroup(BaseModel):
+    """A group of venues to rank for a single user session."""
+
+    is_new_user: bool  # Whether the user is new or returning
+    venues: list[InputVenue]  # A list of InputVenue objects
+
+
 class Venue(BaseModel):
     """A venue with its attributes."""
 
@@ -0,0 +1,96 @@
+import numpy as np
+
+from src.features import VenueTable, build_features
+
+# the number of combinations of the three boolean flags: is_new_user, is_from_order_again and is_recommended
+COMBINATIONS = 8
+
+
+def flag_combinations(is_new_user: np.ndarray, flags: np.ndarray) -> np.ndarray:
+    """Index the combination of the three boolean flags of each row.
+
+    Args:
+        is_new_user (np.ndarray): Boolean array, whether the user is new, one value per row.
+        flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+
+    Returns:
+        np.ndarray: The index of the combination of each row, in [0, COMBINATIONS).
+    """
+    return is_new_user.astype(np.int64) * 4 + flags[:, 0] * 2 + flags[:, 1]
+
+
+class ScoreTable:
+    """The scores of all the venues under every combination of the flags, computed ahead of the requests.
+
+    The ranker only sees the three boolean flags besides the static venue features, so each venue has
+    8 possible scores. They are kept in one float32 matrix, the rows of which are sorted by venue id,
+    and a request is scored with a binary search and a gather.
+
+    Attributes:
+        venue_ids (np.ndarray): Sorted int64 array of venue ids.
+        scores (np.ndarray): C-contiguous float32 matrix of shape (len(venue_ids), COMBINATIONS).
+        version (str): The version of the model the scores were computed with.
+
+    """
+
+    def __init__(self, venue_ids: np.ndarray, scores: np.ndarray, version: str = "") -> None:
+        """Initialize the table.
+
+        Args:
+            venue_ids (np.ndarray): Sorted int64 array of venue ids.
+            scores (np.ndarray): Matrix of scores, one row per venue id and one column per combination.
+            version (str): The version of the model the scores were computed with (default: "").
+        """
+        self.venue_ids = np.ascontiguousarray(venue_ids, dtype=np.int64)
+        self.scores = np.ascontiguousarray(scores, dtype=np.float32)
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.venue_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory footprint of the table in bytes."""
+        return self.venue_ids.nbytes + self.scores.nbytes
+
+    @classmethod
+    def build(cls, ranker, venues: VenueTable) -> "ScoreTable":
+        """Score every venue under every combination of the flags, one call of the ranker per combination.
+
+        Args:
+            ranker (RankerBackend): The inference backend, or the MicroBatcher wrapping it.
+            venues (VenueTable): The table of venue features.
+
+        Returns:
+            ScoreTable: The table of scores.
+        """
+        scores = np.empty((len(venues), COMBINATIONS), dtype=np.float32)
+        flags = np.empty((len(venues), 2), dtype=bool)
+        for combination in range(COMBINATIONS):
+            flags[:, 0] = combination & 2
+            flags[:, 1] = combination & 1
+            scores[:, combination] = ranker.predict(build_features(bool(combination & 4), flags, venues.features))
+        return cls(venues.venue_ids, scores, version=ranker.version)
+
+    def lookup(
+        self, venue_ids: np.ndarray, is_new_user: np.ndarray, flags: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Gather the scores of the venues.
+
+        Args:
+            venue_ids (np.ndarray): Array of venue ids.
+            is_new_user (np.ndarray): Boolean array, whether the user is new, one value per venue.
+            flags (np.ndarray): Boolean matrix of (is_from_order_again, is_recommended) flags.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The array of scores and a mask of the venues found in the table,
+                the scores of the venues which are not found are zeros.
+        """
+        if len(self.venue_ids) == 0:
+            return np.zeros(len(venue_ids)), np.zeros(len(venue_ids), dtype=bool)
+        rows = np.searchsorted(self.venue_ids, venue_ids)
+        rows[rows == len(self.venue_ids)] = 0
+        found = self.venue_ids[rows] == venue_ids
+        scores = self.scores[rows, flag_combinations(is_new_user, flags)].astype(np.float64)
+        scores[~found] = 0
+        return scores, found
@@ -0,0 +1,138 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.features import FEATURES, VenueTable
+
+# The binary snapshot of the `info` table is laid out as:
+# - a header of HEADER_SIZE bytes: magic, format, number of features, number of venues, version and checksum,
+# - the sorted int64 array of venue ids,
+# - the C-contiguous float32 matrix of venue features, one row per venue id, in the order of FEATURES.
+# All the numbers are little-endian, and the checksum is the CRC32 of everything after the header.
+MAGIC = b"VENUESNP"
+FORMAT = 1
+HEADER = struct.Struct("<8sIIQQI")
+# the header is padded so the arrays following it are aligned
+HEADER_SIZE = 64
+
+
+class Snapshot(VenueTable):
+    """A table of venue features read from a memory-mapped binary snapshot file.
+
+    The arrays of the table are views of the file mapping, so opening a snapshot copies nothing, the pages
+    are read on the first access and are shared with every process mapping the same file. Replacing the file
+    with a new snapshot does not affect the tables which already mapped the previous one.
+
+    Attributes:
+        venue_ids (np.ndarray): Sorted int64 array of venue ids.
+        features (np.ndarray): C-contiguous float32 matrix of shape (len(venue_ids), len(FEATURES)).
+        path (Path): The path to the snapshot file.
+        version (int): The version of the snapshot, the time it was written at in nanoseconds by default.
+
+    """
+
+    @classmethod
+    def open(cls, path: Path, verify: bool = True) -> "Snapshot":
+        """Map a snapshot file into memory.
+
+        Args:
+            path (Path): The path to the snapshot file.
+            verify (bool): Whether to check the checksum and the order of the venue ids,
+                which reads the whole file (default: True).
+
+        Raises:
+            ValueError: If the file is not a snapshot of the current format or is corrupted.
+
+        Returns:
+            Snapshot: The table of venue features backed by the file.
+        """
+        path = Path(path)
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < HEADER_SIZE:
+            raise ValueError(f"{path} is not a venue snapshot: the file is too short")
+        magic, version_format, features, count, version, checksum = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a venue snapshot: unexpected magic {magic!r}")
+        if version_format != FORMAT or features != len(FEATURES):
+            raise ValueError(
+                f"{path} has the format {version_format} with {features} features, "
+                f"expected the format {FORMAT} with {len(FEATURES)} features"
+            )
+        if len(buffer) != HEADER_SIZE + count * (8 + 4 * len(FEATURES)):
+            raise ValueError(f"{path} is truncated: {len(buffer)} bytes for {count} venues")
+
+        venue_ids = np.frombuffer(buffer, dtype="<i8", count=count, offset=HEADER_SIZE)
+        features = np.frombuffer(
+            buffer, dtype="<f4", count=count * len(FEATURES), offset=HEADER_SIZE + venue_ids.nbytes
+        ).reshape(count, len(FEATURES))
+        if verify:
+            if zlib.crc32(memoryview(buffer)[HEADER_SIZE:]) != checksum:
+                raise ValueError(f"{path} is corrupted: the checksum does not match")
+            if count > 1 and not (venue_ids[1:] > venue_ids[:-1]).all():
+                raise ValueError(f"{path} is corrupted: the venue ids are not sorted")
+
+        snapshot = cls.from_sorted(venue_ids, features)
+        snapshot.path = path
+        snapshot.version = version
+        return snapshot
+
+
+def write_snapshot(venues: VenueTable, path: Path, version: Optional[int] = None) -> int:
+    """Write a table of venue features as a binary snapshot, replacing the previous snapshot atomically.
+
+    The snapshot is written to a temporary file next to `path`, which is then renamed over `path`,
+    so a reader opens either the previous or the new snapshot, never a partial one.
+
+    Args:
+        venues (VenueTable): The table of venue features.
+        path (Path): The path to the snapshot file.
+        version (int): The version of the snapshot, the current time in nanoseconds if not set (default: None).
+
+    Returns:
+        int: The version of the written snapshot.
+    """
+    path = Path(path)
+    version = time.time_ns() if version is None else version
+    venue_ids = np.ascontiguousarray(venues.venue_ids, dtype="<i8")
+    features = np.ascontiguousarray(venues.features, dtype="<f4")
+    checksum = zlib.crc32(features, zlib.crc32(venue_ids))
+    header = HEADER.pack(MAGIC, FORMAT, len(FEATURES), len(venue_ids), version, checksum).ljust(HEADER_SIZE, b"\0")
+
+    temporary = path.with_name(f".{path.name}.tmp")
+    with open(temporary, "wb") as file:
+        file.write(header)
+        file.write(venue_ids.tobytes())
+        file.write(features.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return version
+
+
+if __name__ == "__main__":
+    # Export the `info` table, from its CSV dump or from the database, e.g. `python -m src.snapshot venues.snapshot`
+    parser = argparse.ArgumentParser(description="Export the `info` table as a binary venue snapshot")
+    parser.add_argument("path", help="path to the snapshot file to write")
+    parser.add_argument("--csv", help="path to the CSV dump of the `info` table, the database is read if not set")
+    args = parser.parse_args()
+
+    if args.csv:
+        venues = VenueTable.from_csv(args.csv)
+    else:
+        from src.helpers import SessionLocal, get_all_venues
+
+        db = SessionLocal()
+        try:
+            venues = get_all_venues(db)
+        finally:
+            db.close()
+    version = write_snapshot(venues, Path(args.path))
+    print(f"Wrote {len(venues)} venues into {args.path}, version {version}")
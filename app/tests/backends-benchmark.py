@@ -0,0 +1,57 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# make the `src` package importable when the script is run from the repository root
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
+
+from src.backends import BACKENDS, load_backend  # noqa: E402
+from src.features import FEATURES, VenueTable, build_features  # noqa: E402
+
+# Parse the weights file, the optional venues dump and the benchmark sizes from the command line
+parser = argparse.ArgumentParser(description="Benchmark the ranker inference backends against each other")
+parser.add_argument("weights", help="path to the .cbm weights file")
+parser.add_argument("--venues", help="path to the venues CSV dump, random venue features are used if not set")
+parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="number of venues per request")
+parser.add_argument("--repeats", type=int, default=200, help="number of timed calls per backend and size")
+args = parser.parse_args()
+
+# Prepare the venue features the request matrices are gathered from
+rng = np.random.default_rng(21)
+if args.venues:
+    table = VenueTable.from_csv(args.venues)
+else:
+    table = VenueTable(np.arange(10_000), rng.random((10_000, len(FEATURES)), dtype=np.float32))
+
+# Load the same weights into every backend, the generic CatBoost path being the reference
+backends = [load_backend(name, args.weights) for name in BACKENDS]
+reference = backends[0]
+
+for size in args.sizes:
+    venue_ids = rng.choice(table.venue_ids, size=size)
+    flags = rng.random((size, 2)) < 0.2
+    data = build_features(bool(rng.random() < 0.5), flags, table.gather(venue_ids))
+    expected = reference.predict(data)
+
+    print(f"\n{size} venues per request")
+    for backend in backends:
+        # Check the scores and the resulting order against the reference backend
+        scores = backend.predict(data)
+        identical = np.array_equal(scores, expected)
+        max_diff = float(np.abs(scores - expected).max())
+        same_order = np.array_equal(np.argsort(-scores, kind="stable"), np.argsort(-expected, kind="stable"))
+
+        # Time the calls of the backend
+        timings = np.empty(args.repeats)
+        for i in range(args.repeats):
+            started = time.perf_counter()
+            backend.predict(data)
+            timings[i] = time.perf_counter() - started
+        p50, p99 = np.percentile(timings, [50, 99]) * 1e3
+        print(
+            f"{backend.name:>10}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, "
+            f"bit-for-bit {identical}, max abs diff {max_diff:.3g}, same order {same_order}"
+        )
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Point the service to a throwaway SQLite database and dummy weights before it is imported
+os.environ.setdefault("MYSQL_URL", f"sqlite:///{Path(tempfile.mkdtemp(prefix='ranker-tests-')).joinpath('venues.db')}")
+os.environ.setdefault("APP_FOLDER", "unused")
+os.environ.setdefault("APP_WEIGHTS", "unused")
+for name in ["ACCESS_KEY", "SECRET_KEY", "BUCKET", "URL", "FOLDER", "WEIGHTS"]:
+    os.environ.setdefault(f"MINIO_{name}", "unused")
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from catboost import CatBoostRanker, Pool
+
+# Parse the shape of the synthetic data and of the generated load from the command line
+parser = argparse.ArgumentParser(
+    description="Benchmark the inference service in-process, against a SQLite stand-in for the `info` table"
+)
+parser.add_argument("--venues", type=int, default=5_000, help="number of venues in the `info` table")
+parser.add_argument("--sessions", type=int, default=1_000, help="number of generated sessions")
+parser.add_argument("--min-list", type=int, default=10, help="minimal number of venues in a session")
+parser.add_argument("--max-list", type=int, default=500, help="maximal number of venues in a session")
+parser.add_argument("--iterations", type=int, default=200, help="number of boosting iterations of the local model")
+parser.add_argument("--mode", choices=["closed", "open", "both"], default="both", help="load generation mode")
+parser.add_argument("--concurrency", type=int, default=8, help="number of clients of the closed-loop load")
+parser.add_argument("--rate", type=float, default=200.0, help="requests per second of the open-loop load")
+parser.add_argument("--duration", type=float, default=10.0, help="duration of each load in seconds")
+parser.add_argument("--seed", type=int, default=21, help="seed of the random generator")
+parser.add_argument("--json", help="path to write the report to as JSON")
+args = parser.parse_args()
+rng = np.random.default_rng(args.seed)
+folder = Path(tempfile.mkdtemp(prefix="ranker-benchmark-"))
+
+# Generate the venues of the `info` table, with missing ratings like in `cache/venues.csv`
+venue_ids = rng.choice(np.iinfo(np.int64).max, size=args.venues, replace=False) - np.iinfo(np.int64).max // 2
+venues = np.column_stack(
+    [
+        rng.beta(2, 6, args.venues),  # conversions_per_impression
+        rng.integers(1, 5, args.venues),  # price_range
+        np.where(rng.random(args.venues) < 0.1, np.nan, rng.uniform(7.0, 10.0, args.venues).round(1)),  # rating
+        rng.exponential(5.0, args.venues),  # popularity
+        rng.beta(3, 6, args.venues),  # retention_rate
+    ]
+)
+
+# Generate sessions shaped like `s3/sessions.csv`: a list of venues per session, one purchase per session
+sessions = []
+for _ in range(args.sessions):
+    size = int(rng.integers(args.min_list, args.max_list + 1))
+    sessions.append(
+        {
+            "session_id": str(uuid.UUID(bytes=rng.bytes(16))),
+            "is_new_user": bool(rng.random() < 0.3),
+            "venue_id": rng.choice(venue_ids, size=min(size, args.venues), replace=False),
+            "is_from_order_again": rng.random(min(size, args.venues)) < 0.1,
+            "is_recommended": rng.random(min(size, args.venues)) < 0.05,
+        }
+    )
+
+# Train a small local model on the generated sessions, with the features in the order the service builds them
+rows = {venue_id: row for venue_id, row in zip(venue_ids.tolist(), venues)}
+data, labels, groups = [], [], []
+for group, session in enumerate(sessions):
+    features = np.array([rows[venue_id] for venue_id in session["venue_id"].tolist()])
+    popularity = features[:, 3] + 5 * session["is_from_order_again"]
+    labels.append((np.arange(len(features)) == np.argmax(popularity + rng.normal(0, 2, len(features)))).astype(int))
+    flags = np.column_stack(
+        [np.full(len(features), session["is_new_user"]), session["is_from_order_again"], session["is_recommended"]]
+    )
+    data.append(np.column_stack([flags, features]))
+    groups.append(np.full(len(features), group))
+ranker = CatBoostRanker(loss_function="YetiRank", iterations=args.iterations, logging_level="Silent")
+ranker.fit(Pool(np.concatenate(data), label=np.concatenate(labels), group_id=np.concatenate(groups)))
+ranker.save_model(str(folder.joinpath("weights.cbm")))
+
+# Point the service to the SQLite database and the local weights before it is imported
+os.environ.update(
+    {
+        "MYSQL_URL": f"sqlite:///{folder.joinpath('venues.db')}",
+        "MYSQL_ASYNC_URL": f"sqlite+aiosqlite:///{folder.joinpath('venues.db')}",
+        "APP_FOLDER": str(folder),
+        "APP_WEIGHTS": "weights.cbm",
+        "APP_DOWNLOAD": "false",
+    }
+)
+for name in ["ACCESS_KEY", "SECRET_KEY", "BUCKET", "URL", "FOLDER", "WEIGHTS"]:
+    os.environ.setdefault(f"MINIO_{name}", "unused")
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from src import models  # noqa: E402
+
+engine = create_engine(os.environ["MYSQL_URL"])
+models.Base.metadata.create_all(bind=engine)
+with engine.begin() as connection:
+    connection.execute(
+        models.Venue.__table__.insert(),
+        [
+            dict(
+                venue_id=venue_id,
+                conversions_per_impression=row[0],
+                price_range=int(row[1]),
+                rating=None if np.isnan(row[2]) else row[2],
+                popularity=row[3],
+                retention_rate=row[4],
+            )
+            for venue_id, row in rows.items()
+        ],
+    )
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from src.features import build_features, encode_venues  # noqa: E402
+from src.helpers import SessionLocal, get_venues  # noqa: E402
+from src.ranking import rank_venues  # noqa: E402
+from src.schemas import InputVenue  # noqa: E402
+
+# Prepare the requests of the generated sessions
+requests = [
+    (
+        session["is_new_user"],
+        [
+            {"venue_id": venue_id, "is_from_order_again": order_again, "is_recommended": recommended}
+            for venue_id, order_again, recommended in zip(
+                session["venue_id"].tolist(),
+                session["is_from_order_again"].tolist(),
+                session["is_recommended"].tolist(),
+            )
+        ],
+    )
+    for session in sessions
+]
+
+
+def percentiles(timings: list[float]) -> dict:
+    """Summarize the timings in milliseconds.
+
+    Arguments:
+        timings -- a list of durations in seconds.
+
+    Returns:
+        A dictionary with the count and the p50, p95 and p99 of the durations in milliseconds.
+    """
+    p50, p95, p99 = np.percentile(np.array(timings) * 1e3, [50, 95, 99]) if timings else (np.nan,) * 3
+    return {"count": len(timings), "p50": p50, "p95": p95, "p99": p99}
+
+
+def send(client: TestClient, request: tuple) -> None:
+    """Send one request to `/predict` and check its status.
+
+    Arguments:
+        client -- the in-process client of the service.
+        request -- a tuple of the is_new_user flag and the list of venues.
+    """
+    is_new_user, venues = request
+    response = client.post(f"/predict?is_new_user={str(is_new_user).lower()}", json=venues)
+    response.raise_for_status()
+
+
+def closed_loop(client: TestClient) -> dict:
+    """Drive the service with clients sending their next request as soon as the previous one is answered.
+
+    Arguments:
+        client -- the in-process client of the service.
+
+    Returns:
+        A dictionary with the throughput and the latency percentiles.
+    """
+    timings, lock = [], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(seed: int) -> None:
+        local = np.random.default_rng(seed)
+        while time.perf_counter() < deadline:
+            request = requests[local.integers(len(requests))]
+            started = time.perf_counter()
+            send(client, request)
+            with lock:
+                timings.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    return {"throughput": len(timings) / args.duration, **percentiles(timings)}
+
+
+def open_loop(client: TestClient) -> dict:
+    """Drive the service with requests arriving at Poisson times, whatever the latency of the previous ones.
+
+    The latency is measured from the scheduled arrival, so a stalled service is not hidden by a stalled client.
+
+    Arguments:
+        client -- the in-process client of the service.
+
+    Returns:
+        A dictionary with the throughput and the latency percentiles.
+    """
+    timings, lock = [], threading.Lock()
+    arrivals = np.cumsum(rng.exponential(1.0 / args.rate, int(args.rate * args.duration * 1.5)))
+    arrivals = arrivals[arrivals < args.duration]
+    choices = rng.integers(len(requests), size=len(arrivals))
+    started = time.perf_counter()
+
+    def worker(arrival: float, choice: int) -> None:
+        scheduled = started + arrival
+        time.sleep(max(0.0, scheduled - time.perf_counter()))
+        send(client, requests[choice])
+        with lock:
+            timings.append(time.perf_counter() - scheduled)
+
+    with ThreadPoolExecutor(max(1, int(args.rate))) as executor:
+        list(executor.map(worker, arrivals, choices))
+    elapsed = time.perf_counter() - started
+    return {"throughput": len(timings) / elapsed, **percentiles(timings)}
+
+
+def stages() -> dict:
+    """Replay the hot path of `/predict` stage by stage, timing each stage separately.
+
+    Returns:
+        A dictionary with the latency percentiles of the database, feature build, model and serialization stages.
+    """
+    timings = {"db": [], "features": [], "model": [], "serialization": []}
+    ranker = main.app.state.ranker
+    db = SessionLocal()
+    try:
+        for is_new_user, venues in requests:
+            venues = [InputVenue(**venue) for venue in venues]
+
+            started = time.perf_counter()
+            ids, flags = encode_venues(venues)
+            table = get_venues(db, np.unique(ids).tolist())
+            timings["db"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            data = build_features(is_new_user, flags, table.gather(ids))
+            timings["features"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            predictions = ranker.predict(data)
+            timings["model"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            rank_venues(ids, predictions).json()
+            timings["serialization"].append(time.perf_counter() - started)
+    finally:
+        db.close()
+    return {stage: percentiles(values) for stage, values in timings.items()}
+
+
+with TestClient(main.app) as client:
+    # Warm the venue cache and the model up before measuring
+    for request in requests[:50]:
+        send(client, request)
+    report = {"stages": stages()}
+    if args.mode in ("closed", "both"):
+        report["closed_loop"] = closed_loop(client)
+    if args.mode in ("open", "both"):
+        report["open_loop"] = open_loop(client)
+
+# Print the report and optionally store it, to compare runs against each other
+for name, section in report.items():
+    print(f"\n{name}")
+    for key, value in (section.items() if name != "stages" else []):
+        print(f"  {key}: {value:.2f}")
+    for stage, value in (section.items() if name == "stages" else []):
+        print(f"  {stage:>13}: p50 {value['p50']:.3f} ms, p95 {value['p95']:.3f} ms, p99 {value['p99']:.3f} ms")
+if args.json:
+    Path(args.json).write_text(json.dumps(report, indent=2, default=float))
@@ -0,0 +1,50 @@
+import argparse
+from pathlib import Path
+
+# the memory fields of /proc/<pid>/smaps_rollup which are reported, in kB
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def children(pid: int) -> list[int]:
+    """List the child processes of a process, e.g. the gunicorn workers of its master process."""
+    pids = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        pids += [int(child) for child in (task / "children").read_text().split()]
+    return sorted(pids)
+
+
+def memory(pid: int) -> dict:
+    """Read the memory fields of a process, the proportional set size splits each shared page between its owners."""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in FIELDS:
+            values[name] = int(value.split()[0])
+    return values
+
+
+# Parse the pid of the gunicorn master process from the command line
+parser = argparse.ArgumentParser(
+    description="Report the memory of the gunicorn master process and of its workers, "
+    "to compare the App started with and without APP_PRELOAD"
+)
+parser.add_argument("pid", type=int, help="pid of the gunicorn master process")
+args = parser.parse_args()
+
+# Print one row per process, then the totals, in MB
+print(f"{'process':>16}" + "".join(f"{name:>15}" for name in FIELDS))
+totals = dict.fromkeys(FIELDS, 0)
+for role, pid in [("master", args.pid)] + [("worker", child) for child in children(args.pid)]:
+    values = memory(pid)
+    if role == "worker":
+        for name in FIELDS:
+            totals[name] += values[name]
+    print(f"{role:>8} {pid:>7}" + "".join(f"{values[name] / 1024:>15.1f}" for name in FIELDS))
+print(f"{'workers total':>16}" + "".join(f"{totals[name] / 1024:>15.1f}" for name in FIELDS))
+
+# Without the sharing the sum of the RSS is close to the sum of the PSS, with it the PSS is the actual footprint
+print(
+    f"\nsum of the RSS of the workers: {totals['Rss'] / 1024:.1f} MB, "
+    f"sum of the PSS: {totals['Pss'] / 1024:.1f} MB, "
+    f"shared: {(totals['Shared_Clean'] + totals['Shared_Dirty']) / 1024:.1f} MB"
+)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from catboost import CatBoostRanker
+
+from src.backends import CatBoostBackend, EvaluatorBackend, ObliviousTreesBackend
+
+rng = np.random.default_rng(21)
+data = rng.random((400, 5)).astype(np.float32)
+# missing values in every column, which each backend must binarize like CatBoost does
+data[rng.random(data.shape) < 0.1] = np.nan
+labels = (data[:, 0] > 0.5).astype(int)
+groups = np.repeat(np.arange(40), 10)
+
+
+def train(grow_policy: str) -> CatBoostRanker:
+    return CatBoostRanker(
+        iterations=30, depth=4, grow_policy=grow_policy, random_seed=21, verbose=False, allow_writing_files=False
+    ).fit(data, labels, group_id=groups)
+
+
+@pytest.mark.parametrize("backend", [EvaluatorBackend, ObliviousTreesBackend.from_ranker])
+def test_backend_matches_catboost(backend):
+    ranker = train("SymmetricTree")
+    expected = CatBoostBackend(ranker).predict(data)
+    np.testing.assert_allclose(backend(ranker).predict(data), expected, rtol=1e-6, atol=1e-9)
+
+
+def test_oblivious_backend_scores_an_empty_matrix():
+    assert ObliviousTreesBackend.from_ranker(train("SymmetricTree")).predict(data[:0]).shape == (0,)
+
+
+@pytest.mark.parametrize("grow_policy", ["Depthwise", "Lossguide"])
+def test_oblivious_backend_rejects_non_symmetric_trees(grow_policy):
+    with pytest.raises(ValueError, match="Only oblivious trees"):
+        ObliviousTreesBackend.from_ranker(train(grow_policy))
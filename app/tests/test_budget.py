@@ -0,0 +1,69 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.budget import Budget
+from src.cache import VenueCache
+from src.features import FEATURES, VenueTable
+from src.helpers import score_venues, score_venues_async
+from src.scores import COMBINATIONS, ScoreTable
+
+
+class SlowRanker:
+    """A ranker which answers after the latency budget of the tests."""
+
+    version = "slow"
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        time.sleep(0.2)
+        return np.ones(len(data))
+
+
+# venues 1 and 3 are in the score table, venues 2 and 4 are scored live by the slow ranker
+venues = VenueTable(np.array([1, 2, 3, 4], dtype=np.int64), np.zeros((4, len(FEATURES)), dtype=np.float32))
+score_table = ScoreTable(
+    np.array([1, 3], dtype=np.int64), np.array([[0.2] * COMBINATIONS, [0.7] * COMBINATIONS]), version="slow"
+)
+venue_ids = np.array([2, 1, 4, 3], dtype=np.int64)
+flags = np.zeros((len(venue_ids), 2), dtype=bool)
+
+
+def check(scores: np.ndarray, degraded: np.ndarray) -> None:
+    # the scores of the table are kept, the live venues are ranked after them in the input order
+    np.testing.assert_allclose(scores[[1, 3]], [0.2, 0.7], rtol=1e-6)
+    assert (scores[[0, 2]] < 0.2).all() and scores[0] == scores[2]
+    assert degraded.tolist() == [True, False, True, False]
+    assert np.argsort(-scores, kind="stable").tolist() == [3, 1, 0, 2]
+
+
+def test_ranker_timeout_keeps_table_scores():
+    with ThreadPoolExecutor(2) as executor:
+        budget = Budget(0.05, executor)
+        check(
+            *score_venues(
+                None, SlowRanker(), VenueCache(100), venues, None, None, score_table, venue_ids, False, flags, budget
+            )
+        )
+
+
+def test_ranker_timeout_keeps_table_scores_async():
+    async def score():
+        with ThreadPoolExecutor(2) as executor:
+            return await score_venues_async(
+                None,
+                SlowRanker(),
+                executor,
+                VenueCache(100),
+                venues,
+                None,
+                None,
+                score_table,
+                venue_ids,
+                False,
+                flags,
+                Budget(0.05),
+            )
+
+    check(*asyncio.run(score()))
@@ -0,0 +1,191 @@
+import numpy as np
+import pytest
+
+from src import cache as cache_module
+from src.cache import ScoreCache, VenueCache
+from src.features import FEATURES, build_features
+from src.scores import COMBINATIONS, flag_combinations
+
+
+def features(*values: float) -> np.ndarray:
+    # one row of venue features per value
+    return np.repeat(np.array(values, dtype=np.float32)[:, None], len(FEATURES), axis=1)
+
+
+def ids(*venue_ids: int) -> np.ndarray:
+    return np.array(venue_ids, dtype=np.int64)
+
+
+def rows(venue_features: np.ndarray, is_new_user: bool = False, flags: tuple = (False, False)) -> np.ndarray:
+    # the input matrix of the ranker, with the same flags on every row
+    return build_features(is_new_user, np.tile(flags, (len(venue_features), 1)), venue_features)
+
+
+class Clock:
+    """A monotonic clock moved by hand."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_venue_cache_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        VenueCache(0)
+
+
+def test_venue_cache_lookup():
+    cache = VenueCache(10)
+    cache.put(ids(1, 2), features(0.1, 0.2))
+    found_features, found = cache.lookup(ids(2, 3, 1))
+    assert found.tolist() == [True, False, True]
+    np.testing.assert_array_equal(found_features, features(0.2, 0.0, 0.1))
+    assert cache.stats() == {"size": 2, "capacity": 10, "hits": 2, "misses": 1, "evictions": 0}
+
+
+def test_venue_cache_evicts_least_recently_used():
+    cache = VenueCache(2)
+    cache.put(ids(1, 2), features(0.1, 0.2))
+    # looking up venue 1 makes venue 2 the least recently used one
+    cache.lookup(ids(1))
+    cache.put(ids(3), features(0.3))
+    assert cache.lookup(ids(1, 2, 3))[1].tolist() == [True, False, True]
+    assert cache.evictions == 1 and len(cache) == 2
+
+
+def test_venue_cache_keeps_last_features_of_repeated_venue():
+    cache = VenueCache(2)
+    cache.put(ids(1, 1), features(0.1, 0.5))
+    np.testing.assert_array_equal(cache.lookup(ids(1))[0], features(0.5))
+    assert len(cache) == 1
+
+
+def test_venue_cache_expires_entries(clock):
+    cache = VenueCache(10, ttl=60)
+    cache.put(ids(1), features(0.1))
+    clock.now += 59
+    assert cache.lookup(ids(1))[1].tolist() == [True]
+    clock.now += 2
+    assert cache.lookup(ids(1))[1].tolist() == [False]
+    # the expired entry is still served as a stale fallback, without counting the lookup
+    stale_features, found = cache.lookup(ids(1, 2), stale=True)
+    assert found.tolist() == [True, False]
+    np.testing.assert_array_equal(stale_features, features(0.1, 0.0))
+    assert (cache.hits, cache.misses) == (1, 1)
+    # refreshing the entry makes it fresh again
+    cache.put(ids(1), features(0.2))
+    assert cache.lookup(ids(1))[1].tolist() == [True]
+
+
+def test_venue_cache_clear_bumps_version():
+    cache = VenueCache(2)
+    cache.put(ids(1, 2), features(0.1, 0.2))
+    cache.clear()
+    assert len(cache) == 0 and cache.version == 1
+    assert not cache.lookup(ids(1, 2), stale=True)[1].any()
+    # all the slots are free again
+    cache.put(ids(3, 4), features(0.3, 0.4))
+    assert cache.evictions == 0
+
+
+def test_score_cache_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        ScoreCache(0)
+
+
+def test_score_cache_lookup_per_flag_combination():
+    cache = ScoreCache(10)
+    data = rows(features(0.1, 0.2))
+    # the first lookup with a version sets the version of the store, the puts of other versions are ignored
+    assert not cache.lookup(ids(1, 2), data, "v1")[1].any()
+    cache.put(ids(1, 2), data, np.array([0.5, 0.6]), "v1")
+    scores, found = cache.lookup(ids(2, 1), data[::-1], "v1")
+    assert found.tolist() == [True, True]
+    np.testing.assert_array_equal(scores, [0.6, 0.5])
+    # the same venues with other flags have other scores
+    for is_new_user, flags in [(True, (False, False)), (False, (True, False)), (False, (False, True))]:
+        assert not cache.lookup(ids(1, 2), rows(features(0.1, 0.2), is_new_user, flags), "v1")[1].any()
+    cache.put(ids(1), rows(features(0.1), True, (True, True)), np.array([0.9]), "v1")
+    scores, found = cache.lookup(ids(1, 1), np.concatenate([data[:1], rows(features(0.1), True, (True, True))]), "v1")
+    assert found.tolist() == [True, True]
+    np.testing.assert_array_equal(scores, [0.5, 0.9])
+
+
+def test_score_cache_misses_changed_features():
+    cache = ScoreCache(10)
+    cache.lookup(ids(1), rows(features(0.1)), "v1")
+    cache.put(ids(1), rows(features(0.1)), np.array([0.5]), "v1")
+    assert cache.lookup(ids(1), rows(features(0.2)), "v1")[1].tolist() == [False]
+    # the scores of the other combinations computed from the previous features are dropped too
+    cache.put(ids(1), rows(features(0.1), True), np.array([0.7]), "v1")
+    cache.put(ids(1), rows(features(0.2)), np.array([0.6]), "v1")
+    assert cache.lookup(ids(1), rows(features(0.2), True), "v1")[1].tolist() == [False]
+    assert cache.lookup(ids(1), rows(features(0.2)), "v1")[1].tolist() == [True]
+
+
+def test_score_cache_matches_missing_features():
+    # the bit patterns are compared, so a missing rating is equal to itself
+    cache = ScoreCache(10)
+    data = rows(features(np.nan))
+    cache.lookup(ids(1), data, "v1")
+    cache.put(ids(1), data, np.array([0.5]), "v1")
+    scores, found = cache.lookup(ids(1), data, "v1")
+    assert found.tolist() == [True]
+    np.testing.assert_array_equal(scores, [0.5])
+
+
+def test_score_cache_evicts_least_recently_used():
+    cache = ScoreCache(2)
+    cache.lookup(ids(1, 2), rows(features(0.1, 0.2)), "v1")
+    cache.put(ids(1, 2), rows(features(0.1, 0.2)), np.array([0.5, 0.6]), "v1")
+    cache.lookup(ids(1), rows(features(0.1)), "v1")
+    cache.put(ids(3), rows(features(0.3)), np.array([0.7]), "v1")
+    assert cache.lookup(ids(1, 2, 3), rows(features(0.1, 0.2, 0.3)), "v1")[1].tolist() == [True, False, True]
+    assert cache.evictions == 1
+    # the slot of the evicted venue does not leak its scores to the new one
+    cache.put(ids(4), rows(features(0.4), True), np.array([0.8]), "v1")
+    assert cache.lookup(ids(4), rows(features(0.4)), "v1")[1].tolist() == [False]
+
+
+def test_score_cache_drops_other_versions():
+    cache = ScoreCache(10)
+    data = rows(features(0.1))
+    cache.lookup(ids(1), data, "v1")
+    cache.put(ids(1), data, np.array([0.5]), "v1")
+    # a new model drops all the scores
+    assert cache.lookup(ids(1), data, "v2")[1].tolist() == [False]
+    assert len(cache) == 0 and cache.version == "v2"
+    # the scores of a request started with the previous model are ignored
+    cache.put(ids(1), data, np.array([0.5]), "v1")
+    assert cache.lookup(ids(1), data, "v2")[1].tolist() == [False]
+    cache.put(ids(1), data, np.array([0.6]), "v2")
+    np.testing.assert_array_equal(cache.lookup(ids(1), data, "v2")[0], [0.6])
+    assert cache.stats() == {"size": 1, "capacity": 10, "hits": 1, "misses": 3, "evictions": 0}
+
+
+def test_score_cache_follows_venue_cache_version():
+    # the venue cache version is part of the score version, so reloading the venues drops the scores
+    venue_cache, score_cache = VenueCache(10), ScoreCache(10)
+    data = rows(features(0.1))
+    score_cache.lookup(ids(1), data, ("model", venue_cache.version))
+    score_cache.put(ids(1), data, np.array([0.5]), ("model", venue_cache.version))
+    venue_cache.clear()
+    assert score_cache.lookup(ids(1), data, ("model", venue_cache.version))[1].tolist() == [False]
+
+
+def test_score_cache_indexes_flags_like_score_table():
+    # every combination of the three flags, each one put in the column the score table uses for it
+    is_new_user = np.repeat([False, True], 4)
+    flags = np.array([[order_again, recommended] for order_again in (False, True) for recommended in (False, True)] * 2)
+    data = build_features(is_new_user, flags, features(*[0.1] * COMBINATIONS))
+    np.testing.assert_array_equal(cache_module._combinations(data), flag_combinations(is_new_user, flags))
+    np.testing.assert_array_equal(np.sort(flag_combinations(is_new_user, flags)), np.arange(COMBINATIONS))
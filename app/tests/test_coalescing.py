@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.coalescing import VenueCoalescer
+from src.features import FEATURES, VenueTable
+
+
+class Database:
+    """A venue table queried slowly, recording the venue ids of each query."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def query(self, venue_ids: list[int]) -> VenueTable:
+        with self._lock:
+            self.queries.append(sorted(venue_ids))
+        time.sleep(self.delay)
+        return table(venue_ids)
+
+    async def query_async(self, venue_ids: list[int]) -> VenueTable:
+        self.queries.append(sorted(venue_ids))
+        await asyncio.sleep(self.delay)
+        return table(venue_ids)
+
+
+def table(venue_ids: list[int]) -> VenueTable:
+    # the features of a venue are its id
+    return VenueTable(
+        np.array(venue_ids, dtype=np.int64),
+        np.repeat(np.array(venue_ids, dtype=np.float32)[:, None], len(FEATURES), axis=1),
+    )
+
+
+def check(result: VenueTable, venue_ids: list[int]) -> None:
+    features, found = result.get(np.array(venue_ids, dtype=np.int64))
+    assert found.all()
+    np.testing.assert_array_equal(features[:, 0], venue_ids)
+
+
+def test_concurrent_lookups_share_one_query():
+    coalescer, database = VenueCoalescer(max_wait=0.1), Database()
+    lookups = [[1, 2], [2, 3], [3, 4, 5], [1]]
+    with ThreadPoolExecutor(len(lookups)) as executor:
+        results = list(executor.map(lambda venue_ids: coalescer.fetch(venue_ids, database.query), lookups))
+    for result, venue_ids in zip(results, lookups):
+        check(result, venue_ids)
+    # every venue id is queried once, by the first request opening the flight
+    assert database.queries == [[1, 2, 3, 4, 5]]
+    # the venue ids added to the flight by another request are shared, whatever the order of the requests
+    assert coalescer.stats() == {"requests": 4, "queries": 1, "fetched": 5, "shared": 3}
+
+
+def test_venues_in_flight_are_not_queried_again():
+    coalescer, database = VenueCoalescer(max_wait=0), Database(delay=0.2)
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(coalescer.fetch, [1, 2], database.query)
+        # the first flight is closed and querying when the second request misses one of its venues
+        time.sleep(0.1)
+        second = executor.submit(coalescer.fetch, [2, 3], database.query)
+        check(first.result(), [1, 2])
+        check(second.result(), [2, 3])
+    # the second request waits for venue 2 of the first flight, and queries only venue 3 itself
+    assert database.queries == [[1, 2], [3]]
+    assert coalescer.stats() == {"requests": 2, "queries": 2, "fetched": 3, "shared": 1}
+
+
+def test_landed_venues_are_queried_again():
+    coalescer, database = VenueCoalescer(max_wait=0), Database(delay=0)
+    coalescer.fetch([1], database.query)
+    coalescer.fetch([1], database.query)
+    assert database.queries == [[1], [1]]
+
+
+def test_query_error_fails_every_request_of_the_flight():
+    coalescer = VenueCoalescer(max_wait=0.1)
+
+    def query(venue_ids):
+        raise ConnectionError("database is down")
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(coalescer.fetch, venue_ids, query) for venue_ids in ([1], [1, 2])]
+        for future in futures:
+            with pytest.raises(ConnectionError):
+                future.result()
+    # the venues are not left in flight
+    database = Database(delay=0)
+    check(coalescer.fetch([1, 2], database.query), [1, 2])
+    assert database.queries == [[1, 2]]
+
+
+def test_async_lookups_share_one_query():
+    coalescer, database = VenueCoalescer(max_wait=0.05), Database()
+
+    async def lookups():
+        return await asyncio.gather(
+            *(coalescer.fetch_async(venue_ids, database.query_async) for venue_ids in ([1], [1, 2], [3]))
+        )
+
+    for result, venue_ids in zip(asyncio.run(lookups()), ([1], [1, 2], [3])):
+        check(result, venue_ids)
+    assert database.queries == [[1, 2, 3]]
+
+
+def test_cancelled_leader_does_not_fail_the_other_requests():
+    coalescer, database = VenueCoalescer(max_wait=0.05), Database()
+
+    async def lookups():
+        leader = asyncio.create_task(coalescer.fetch_async([1, 2], database.query_async))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(coalescer.fetch_async([2], database.query_async))
+        await asyncio.sleep(0)
+        # the client of the leader disconnects while its flight is open
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    check(asyncio.run(lookups()), [2])
+    # the follower queries its venue again itself
+    assert database.queries == [[2]]
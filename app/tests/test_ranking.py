@@ -0,0 +1,18 @@
+import numpy as np
+import orjson
+import pytest
+
+from src.ranking import rank_groups, rank_groups_fast
+
+
+@pytest.mark.parametrize("top_k", [None, 1, 3, 10])
+def test_fast_batch_matches_validated_batch(top_k):
+    rng = np.random.default_rng(21)
+    sizes = [5, 1, 8, 4]
+    venue_ids = rng.integers(-(2**62), 2**62, sum(sizes))
+    # few distinct scores, so the ties at the top-k boundary are kept in the input order by both paths
+    scores = rng.integers(0, 3, sum(sizes)).astype(np.float64)
+    degraded = np.zeros(sum(sizes), dtype=bool)
+    degraded[6] = True
+    validated = [orjson.loads(response.json()) for response in rank_groups(venue_ids, scores, sizes, top_k, degraded)]
+    assert orjson.loads(rank_groups_fast(venue_ids, scores, sizes, top_k, degraded).body) == validated
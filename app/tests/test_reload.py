@@ -0,0 +1,205 @@
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from src.reload import FileWeightsSource, S3WeightsSource, WeightsWatcher, cached_download, file_lock
+
+
+class StubS3Client:
+    """An S3 client serving one object from memory and counting its downloads."""
+
+    def __init__(self, content: bytes, etag: str = None) -> None:
+        self.publish(content, etag)
+        self.downloads = 0
+
+    def publish(self, content: bytes, etag: str = None) -> None:
+        self.content = content
+        self.etag = etag or hashlib.md5(content).hexdigest()
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {"ETag": f'"{self.etag}"'}
+
+    def download_file(self, bucket: str, key: str, path: str) -> None:
+        self.downloads += 1
+        with open(path, "wb") as file:
+            file.write(self.content)
+
+
+@pytest.fixture
+def published(tmp_path):
+    # the weights file the watcher polls, in a folder of its own
+    path = tmp_path.joinpath("published", "weights.cbm")
+    path.parent.mkdir()
+    path.write_bytes(b"first")
+    return path
+
+
+@pytest.fixture
+def local(tmp_path):
+    # the local weights the App was started with
+    path = tmp_path.joinpath("local", "weights.cbm")
+    path.parent.mkdir()
+    path.write_bytes(b"first")
+    return path
+
+
+def publish(path, content: bytes) -> None:
+    # the modification time is moved forward, as the file may be rewritten within the resolution of the clock
+    stat = path.stat()
+    path.write_bytes(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_watcher_loads_new_weights(published, local):
+    loaded = []
+    source = FileWeightsSource(published)
+    watcher = WeightsWatcher(
+        source, lambda path: loaded.append(path.read_bytes()), 1, local.parent, path=local, version=source.version()
+    )
+    assert not watcher.poll() and loaded == []
+    publish(published, b"second")
+    assert watcher.poll() and loaded == [b"second"]
+    assert watcher.version == source.version()
+    # the local weights are replaced and no temporary file is left behind
+    assert local.read_bytes() == b"second"
+    assert [file.name for file in local.parent.iterdir()] == [local.name]
+    assert not watcher.poll() and loaded == [b"second"]
+
+
+def test_watcher_keeps_local_weights_if_not_set(published, local):
+    source = FileWeightsSource(published)
+    watcher = WeightsWatcher(source, lambda path: None, 1, local.parent, version=source.version())
+    publish(published, b"second")
+    assert watcher.poll()
+    assert local.read_bytes() == b"first"
+    assert [file.name for file in local.parent.iterdir()] == [local.name]
+
+
+def test_watcher_retries_failed_load(published, local):
+    attempts = []
+
+    def load(path):
+        attempts.append(path.read_bytes())
+        if len(attempts) == 1:
+            raise ValueError("corrupted weights")
+
+    source = FileWeightsSource(published)
+    previous = source.version()
+    watcher = WeightsWatcher(source, load, 1, local.parent, path=local, version=previous)
+    publish(published, b"second")
+    with pytest.raises(ValueError):
+        watcher.poll()
+    # the current model and its weights are kept, and the new version is tried again on the next poll
+    assert watcher.version == previous and local.read_bytes() == b"first"
+    assert [file.name for file in local.parent.iterdir()] == [local.name]
+    assert watcher.poll() and attempts == [b"second", b"second"]
+    assert local.read_bytes() == b"second"
+
+
+def test_watcher_thread_polls_the_source(published, local):
+    loaded = threading.Event()
+    source = FileWeightsSource(published)
+    watcher = WeightsWatcher(source, lambda path: loaded.set(), 0.01, local.parent, version=source.version())
+    watcher.start()
+    try:
+        publish(published, b"second")
+        assert loaded.wait(5)
+    finally:
+        watcher.stop()
+    assert watcher._thread is None
+
+
+def test_watcher_thread_survives_errors(published, local):
+    calls = []
+
+    def load(path):
+        calls.append(path)
+        raise ValueError("corrupted weights")
+
+    source = FileWeightsSource(published)
+    watcher = WeightsWatcher(source, load, 0.01, local.parent, version=source.version())
+    watcher.start()
+    try:
+        publish(published, b"second")
+        deadline = time.monotonic() + 5
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+    assert len(calls) >= 2
+
+
+def test_cached_download_reuses_weights(tmp_path):
+    client = StubS3Client(b"first")
+    source = S3WeightsSource(client, "bucket", "latest/weights.cbm")
+    path = tmp_path.joinpath("ranker", "weights.cbm")
+    cached = cached_download(source, path)
+    assert cached.name == f"weights.{client.etag}.cbm" and cached.read_bytes() == b"first"
+    # the configured name is a hard link to the cached weights
+    assert os.path.samefile(path, cached)
+    assert cached_download(source, path) == cached and client.downloads == 1
+
+
+def test_cached_download_replaces_other_etags(tmp_path):
+    client = StubS3Client(b"first")
+    source = S3WeightsSource(client, "bucket", "latest/weights.cbm")
+    path = tmp_path.joinpath("weights.cbm")
+    first = cached_download(source, path)
+    client.publish(b"second")
+    second = cached_download(source, path)
+    assert client.downloads == 2 and second != first
+    assert path.read_bytes() == b"second" and os.path.samefile(path, second)
+    # the weights of the previous ETag are removed, the lock file is kept
+    assert sorted(file.name for file in tmp_path.iterdir()) == [".weights.cbm.lock", second.name, path.name]
+
+
+def test_cached_download_replaces_corrupted_weights(tmp_path):
+    client = StubS3Client(b"first")
+    source = S3WeightsSource(client, "bucket", "latest/weights.cbm")
+    path = tmp_path.joinpath("weights.cbm")
+    cached = cached_download(source, path)
+    cached.write_bytes(b"garbage")
+    assert cached_download(source, path).read_bytes() == b"first" and client.downloads == 2
+
+
+def test_cached_download_rejects_checksum_mismatch(tmp_path):
+    client = StubS3Client(b"first", etag=hashlib.md5(b"other").hexdigest())
+    source = S3WeightsSource(client, "bucket", "latest/weights.cbm")
+    path = tmp_path.joinpath("weights.cbm")
+    with pytest.raises(ValueError, match="checksum"):
+        cached_download(source, path)
+    assert [file.name for file in tmp_path.iterdir()] == [".weights.cbm.lock"]
+
+
+def test_cached_download_trusts_multipart_etag(tmp_path):
+    # the ETag of a multipart upload is not the hash of the content
+    client = StubS3Client(b"first", etag="0123456789abcdef-2")
+    source = S3WeightsSource(client, "bucket", "latest/weights.cbm")
+    path = tmp_path.joinpath("weights.cbm")
+    assert cached_download(source, path).read_bytes() == b"first"
+    cached_download(source, path)
+    assert client.downloads == 1
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    lock = tmp_path.joinpath(".lock")
+    events = []
+    held = threading.Event()
+
+    def hold():
+        with file_lock(lock):
+            held.set()
+            time.sleep(0.1)
+            events.append("released")
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+    # each `file_lock` opens the file anew, so the threads of a process exclude each other like processes do
+    with file_lock(lock):
+        events.append("acquired")
+    thread.join()
+    assert events == ["released", "acquired"]
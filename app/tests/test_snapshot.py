@@ -0,0 +1,103 @@
+import struct
+
+import numpy as np
+import pytest
+
+from src.features import FEATURES, VenueTable
+from src.snapshot import FORMAT, HEADER, HEADER_SIZE, MAGIC, Snapshot, write_snapshot
+
+venues = VenueTable(
+    np.array([3, 1, 2], dtype=np.int64),
+    np.array([[0.3] * len(FEATURES), [0.1] * len(FEATURES), [np.nan] * len(FEATURES)], dtype=np.float32),
+)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path.joinpath("venues.snapshot")
+    write_snapshot(venues, path, version=42)
+    return path
+
+
+def rewrite_header(path, **fields) -> None:
+    # replace some fields of the header, keeping the others
+    buffer = bytearray(path.read_bytes())
+    header = dict(zip(["magic", "format", "features", "count", "version", "checksum"], HEADER.unpack_from(buffer)))
+    header.update(fields)
+    HEADER.pack_into(buffer, 0, *header.values())
+    path.write_bytes(bytes(buffer))
+
+
+def test_round_trip(path):
+    snapshot = Snapshot.open(path)
+    assert snapshot.version == 42 and snapshot.path == path and len(snapshot) == 3
+    assert snapshot.venue_ids.tolist() == [1, 2, 3]
+    features, found = snapshot.get(np.array([3, 4, 2, 1], dtype=np.int64))
+    assert found.tolist() == [True, False, True, True]
+    np.testing.assert_array_equal(features[[0, 2, 3]], venues.get(np.array([3, 2, 1], dtype=np.int64))[0])
+
+
+def test_round_trip_of_an_empty_table(tmp_path):
+    path = tmp_path.joinpath("empty.snapshot")
+    write_snapshot(VenueTable(np.empty(0, dtype=np.int64), np.empty((0, len(FEATURES)), dtype=np.float32)), path)
+    assert len(Snapshot.open(path)) == 0
+
+
+def test_write_replaces_the_previous_snapshot(path):
+    previous = Snapshot.open(path)
+    write_snapshot(VenueTable(np.array([5], dtype=np.int64), np.zeros((1, len(FEATURES)), np.float32)), path, 43)
+    # the tables which mapped the previous snapshot keep reading it
+    assert previous.venue_ids.tolist() == [1, 2, 3]
+    assert Snapshot.open(path).venue_ids.tolist() == [5]
+    assert [file.name for file in path.parent.iterdir()] == [path.name]
+
+
+def test_too_short_file(path):
+    path.write_bytes(path.read_bytes()[: HEADER_SIZE - 1])
+    with pytest.raises(ValueError, match="too short"):
+        Snapshot.open(path)
+
+
+def test_truncated_file(path):
+    path.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError, match="truncated"):
+        Snapshot.open(path)
+
+
+def test_checksum_mismatch(path):
+    buffer = bytearray(path.read_bytes())
+    buffer[-1] ^= 0xFF
+    path.write_bytes(bytes(buffer))
+    with pytest.raises(ValueError, match="checksum"):
+        Snapshot.open(path)
+    # the check is skipped on request
+    assert len(Snapshot.open(path, verify=False)) == 3
+
+
+def test_unsorted_venue_ids(tmp_path):
+    # a table built around unsorted arrays, as a faulty exporter would write it
+    path = tmp_path.joinpath("unsorted.snapshot")
+    write_snapshot(
+        VenueTable.from_sorted(np.array([2, 1], dtype=np.int64), np.zeros((2, len(FEATURES)), np.float32)), path
+    )
+    with pytest.raises(ValueError, match="not sorted"):
+        Snapshot.open(path)
+
+
+def test_bad_magic(path):
+    rewrite_header(path, magic=b"NOTASNAP")
+    with pytest.raises(ValueError, match="magic"):
+        Snapshot.open(path)
+
+
+@pytest.mark.parametrize("fields", [{"format": FORMAT + 1}, {"features": len(FEATURES) + 1}])
+def test_other_format(path, fields):
+    rewrite_header(path, **fields)
+    with pytest.raises(ValueError, match="expected the format"):
+        Snapshot.open(path)
+
+
+def test_header_layout():
+    # the arrays following the header stay aligned
+    assert HEADER.size <= HEADER_SIZE and HEADER_SIZE % 8 == 0
+    assert struct.unpack_from("<8s", HEADER.pack(MAGIC, FORMAT, 0, 0, 0, 0))[0] == MAGIC
@@ -0,0 +1,70 @@
+import numpy as np
+
+from src.batching import MicroBatcher
+from src.budget import Budget
+from src.cache import VenueCache
+from src.features import FEATURES, VenueTable
+from src.helpers import score_venues
+from src.scores import COMBINATIONS, ScoreTable
+
+
+class ConstantRanker:
+    """A ranker of one model version, scoring every venue alike."""
+
+    def __init__(self, version: str, score: float) -> None:
+        self.version = version
+        self.score = score
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        return np.full(len(data), self.score)
+
+
+venues = VenueTable(np.array([1, 2], dtype=np.int64), np.zeros((2, len(FEATURES)), dtype=np.float32))
+score_table = ScoreTable(np.array([1], dtype=np.int64), np.full((1, COMBINATIONS), 0.9), version="old")
+venue_ids = np.array([1, 2], dtype=np.int64)
+flags = np.zeros((len(venue_ids), 2), dtype=bool)
+
+
+def score(ranker: ConstantRanker) -> np.ndarray:
+    return score_venues(
+        None, ranker, VenueCache(100), venues, None, None, score_table, venue_ids, False, flags, Budget()
+    )[0]
+
+
+def test_table_of_the_same_model_is_used():
+    np.testing.assert_allclose(score(ConstantRanker("old", 0.1)), [0.9, 0.1], rtol=1e-6)
+
+
+def test_table_of_another_model_is_ignored():
+    # between the two assignments of `swap_ranker`, the new ranker meets the previous table
+    np.testing.assert_allclose(score(ConstantRanker("new", 0.1)), [0.1, 0.1], rtol=1e-6)
+
+
+class SwappingVenues:
+    """A venue snapshot which swaps the ranker of the micro-batcher while a request reads the features."""
+
+    def __init__(self, batcher: MicroBatcher, ranker: ConstantRanker) -> None:
+        self.batcher = batcher
+        self.ranker = ranker
+
+    def __len__(self) -> int:
+        return len(venues)
+
+    def get(self, venue_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        self.batcher.ranker = self.ranker
+        return venues.get(venue_ids)
+
+
+def test_batched_request_keeps_its_model():
+    # `swap_ranker` replaces the ranker inside the micro-batcher after the request checked the score table
+    batcher = MicroBatcher(ConstantRanker("old", 0.1), max_wait=0.001, max_rows=100)
+    try:
+        snapshot = SwappingVenues(batcher, ConstantRanker("new", 0.5))
+        scores = score_venues(
+            None, batcher, VenueCache(100), snapshot, None, None, score_table, venue_ids, False, flags, Budget()
+        )[0]
+        np.testing.assert_allclose(scores, [0.9, 0.1], rtol=1e-6)
+        # the next requests get the new model, without the table of the old one
+        np.testing.assert_allclose(score(batcher), [0.5, 0.5], rtol=1e-6)
+    finally:
+        batcher.close()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Parse the database and the benchmark sizes from the command line
+parser = argparse.ArgumentParser(description="Benchmark the queries of the venue features against each other")
+parser.add_argument("--url", help="URL of a database with the `info` table, a SQLite stand-in is generated if not set")
+parser.add_argument("--venues", type=int, default=50_000, help="number of venues in the generated `info` table")
+parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="number of venue ids per request")
+parser.add_argument("--repeats", type=int, default=200, help="number of timed calls per query and size")
+parser.add_argument("--seed", type=int, default=21, help="seed of the random generator")
+args = parser.parse_args()
+rng = np.random.default_rng(args.seed)
+
+# Point the service to the database before it is imported
+url = args.url or f"sqlite:///{Path(tempfile.mkdtemp(prefix='venues-benchmark-')).joinpath('venues.db')}"
+os.environ.update({"MYSQL_URL": url, "APP_FOLDER": "unused", "APP_WEIGHTS": "unused"})
+for name in ["ACCESS_KEY", "SECRET_KEY", "BUCKET", "URL", "FOLDER", "WEIGHTS"]:
+    os.environ.setdefault(f"MINIO_{name}", "unused")
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
+
+from src import models  # noqa: E402
+from src.features import FEATURES, VenueTable  # noqa: E402
+from src.helpers import SessionLocal, columns, engine, get_venues  # noqa: E402
+
+# Generate the venues of the `info` table, with missing ratings like in `cache/venues.csv`
+if not args.url:
+    models.Base.metadata.create_all(bind=engine)
+    venue_ids = rng.choice(np.iinfo(np.int64).max, size=args.venues, replace=False) - np.iinfo(np.int64).max // 2
+    with engine.begin() as connection:
+        connection.execute(
+            models.Venue.__table__.insert(),
+            [
+                dict(
+                    venue_id=venue_id,
+                    conversions_per_impression=float(rng.beta(2, 6)),
+                    price_range=int(rng.integers(1, 5)),
+                    rating=None if rng.random() < 0.1 else float(rng.uniform(7.0, 10.0)),
+                    popularity=float(rng.exponential(5.0)),
+                    retention_rate=float(rng.beta(3, 6)),
+                )
+                for venue_id in venue_ids.tolist()
+            ],
+        )
+db = SessionLocal()
+all_ids = np.array([venue_id for venue_id, in db.query(models.Venue.venue_id).all()], dtype=np.int64)
+
+
+def orm_entities(venue_ids: list[int]) -> VenueTable:
+    # hydrate the ORM objects of the venues, then read their attributes
+    venues = db.query(models.Venue).filter(models.Venue.venue_id.in_(venue_ids)).all()
+    return VenueTable.from_rows(
+        [[venue.venue_id] + [getattr(venue, feature) for feature in FEATURES] for venue in venues]
+    )
+
+
+def orm_columns(venue_ids: list[int]) -> VenueTable:
+    # select the columns with the ORM query, which is compiled on every call
+    return VenueTable.from_rows(db.query(*columns).filter(models.Venue.venue_id.in_(venue_ids)).all())
+
+
+def core_text(venue_ids: list[int]) -> VenueTable:
+    # the plain SQL statement of the service, see `get_venues`
+    return get_venues(db, venue_ids)
+
+
+queries = {"orm entities": orm_entities, "orm columns": orm_columns, "core text": core_text}
+print(f"{len(all_ids)} venues in {engine.url.get_backend_name()}, pool {engine.pool.status()}")
+for size in args.sizes:
+    print(f"\n{size} venue ids per request")
+    reference = None
+    for name, query in queries.items():
+        # Check the venues against the ORM objects
+        venue_ids = rng.choice(all_ids, size=min(size, len(all_ids)), replace=False).tolist()
+        venues = query(venue_ids)
+        expected = orm_entities(venue_ids)
+        same = np.array_equal(venues.venue_ids, expected.venue_ids) and np.array_equal(
+            venues.features, expected.features, equal_nan=True
+        )
+
+        # Time the calls of the query, each one with other venue ids
+        timings = np.empty(args.repeats)
+        for i in range(args.repeats):
+            venue_ids = rng.choice(all_ids, size=min(size, len(all_ids)), replace=False).tolist()
+            started = time.perf_counter()
+            query(venue_ids)
+            timings[i] = time.perf_counter() - started
+        p50, p99 = np.percentile(timings, [50, 99]) * 1e3
+        reference = reference or p50
+        print(f"{name:>14}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, x{reference / p50:.2f} vs orm entities, same {same}")
+db.close()
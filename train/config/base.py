@@ -1,6 +1,6 @@
 import os
-from typing import Optional
-from pydantic import BaseSettings
+from typing import Dict, Literal, Optional
+from pydantic import BaseSettings, confloat
 
 RANDOM_STATE = os.environ.get("RANDOM_STATE", 21)
 
@@ -45,10 +45,36 @@ class TrainingPipelineSettings(BaseSettings):
     Attributes:
     -----------
     weights (str): The path of the weights file.
+    workers (Optional[int]): The number of cross-validation folds trained in parallel processes, the cores being split
+        between them. Optional, if not provided will train as many folds at a time as there are folds and cores.
+    search (Optional[str]): The strategy of the hyperparameter search, 'grid', 'random' or 'halving'.
+        Optional, if not provided will train the ranker with its default parameters.
+    space (Dict[str, list]): The values the hyperparameter search tries for each parameter of the ranker, as JSON.
+    trials (int): The number of parameter sets sampled from the space by the random search and the halving.
+        Default is 20.
+    warm_start (Optional[str]): The path of the new sessions data file, to continue training the deployed model
+        on it only. Optional, if not provided will train a new model on all the sessions.
+    warm_iterations (int): The number of boosting iterations the warm start adds to the deployed model at most.
+        Default is 500.
+    holdout (float): The part of the new sessions held out to check that the warm start does not regress,
+        and the same part to stop it early, above 0 and below 0.5 to leave sessions to train on. Default is 0.2.
 
     """
 
     weights: str
+    workers: Optional[int]
+    search: Optional[Literal["grid", "random", "halving"]]
+    space: Dict[str, list] = {
+        "depth": [4, 6, 8],
+        "learning_rate": [0.03, 0.1, 0.3],
+        "l2_leaf_reg": [1, 3, 10],
+        "bagging_temperature": [0.0, 1.0, 2.0],
+        "random_strength": [0.5, 1.0, 2.0],
+    }
+    trials: int = 20
+    warm_start: Optional[str]
+    warm_iterations: int = 500
+    holdout: confloat(gt=0.0, lt=0.5) = 0.2
 
     class Config:
         # The configuration settings for the TrainingPipelineSettings class.
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+import logging
+import os
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.ipc
+from pandas import DataFrame
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("train.ingest")
+
+# The compact types of the columns of the sessions data, the unnamed index column of the CSV file is skipped:
+SESSIONS_SCHEMA = pa.schema(
+    [
+        ("purchased", pa.bool_()),
+        ("session_id", pa.string()),
+        # the longest sessions have a few thousands venues, too many for int8 or int16:
+        ("position_in_list", pa.int32()),
+        ("venue_id", pa.int64()),
+        ("has_seen_venue_in_this_session", pa.bool_()),
+        ("is_new_user", pa.bool_()),
+        ("is_from_order_again", pa.bool_()),
+        ("is_recommended", pa.bool_()),
+    ]
+)
+# The compact types of the columns of the venues data, the unnamed index column of the CSV file is skipped:
+VENUES_SCHEMA = pa.schema(
+    [
+        ("venue_id", pa.int64()),
+        ("conversions_per_impression", pa.float32()),
+        ("price_range", pa.int8()),
+        ("rating", pa.float32()),
+        ("popularity", pa.float32()),
+        ("retention_rate", pa.float32()),
+    ]
+)
+# The size in bytes of the CSV blocks parsed at a time, which bounds the memory used by the conversion:
+BLOCK_SIZE = 16 << 20
+
+
+def csv_to_arrow(csv_path: Path, arrow_path: Path, schema: pa.Schema, block_size: int = BLOCK_SIZE) -> int:
+    """Convert a CSV file into an Arrow IPC file with the given column types, one block of the CSV file at a time.
+
+    The Arrow file is written next to its final path and then renamed, so a reader never sees a partial file.
+
+    Arguments:
+        csv_path -- the path of the CSV file with a header line.
+        arrow_path -- the path of the Arrow IPC file to write.
+        schema -- the columns to keep and their types, the other columns of the CSV file are skipped.
+
+    Keyword Arguments:
+        block_size -- the size in bytes of the CSV blocks parsed at a time. (default: {BLOCK_SIZE})
+
+    Raises:
+        pyarrow.ArrowInvalid: if a value of the CSV file does not fit the type of its column.
+
+    Returns:
+        The number of rows written.
+    """
+    # Stream the CSV file in blocks, parsing each column straight into its type:
+    reader = pa.csv.open_csv(
+        csv_path,
+        read_options=pa.csv.ReadOptions(block_size=block_size),
+        convert_options=pa.csv.ConvertOptions(
+            column_types=schema, include_columns=schema.names, true_values=["True"], false_values=["False"]
+        ),
+    )
+    # Write the blocks one by one into a temporary file next to the final one:
+    rows = 0
+    temporary = Path(f"{arrow_path}.tmp")
+    with pa.OSFile(str(temporary), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    # Replace the final file at once:
+    os.replace(temporary, arrow_path)
+    log.info(f"{rows} rows of '{csv_path}' converted to '{arrow_path}'.")
+    return rows
+
+
+def read_arrow(arrow_path: Path) -> DataFrame:
+    """Read an Arrow IPC file into a pandas DataFrame.
+
+    The file is memory-mapped, so its columns are read from the page cache without parsing or an extra copy
+    of the file, and the DataFrame keeps the compact types of the columns.
+
+    Arguments:
+        arrow_path -- the path of the Arrow IPC file.
+
+    Returns:
+        A pandas DataFrame with the columns of the file.
+    """
+    with pa.memory_map(str(arrow_path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
@@ -1,17 +1,22 @@
 #!/usr/bin/env python
 # coding: utf-8
+import json
 import logging
 from pathlib import Path
 from typing import NoReturn
 
 import boto3
 import botocore.exceptions
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from catboost import CatBoostRanker
 from sklearn.model_selection import KFold
 
 from train.config import RANDOM_STATE, settings
-from train.src.utils import prepare_datasets, show_results, train_and_evaluate
+from train.src.ingest import SESSIONS_SCHEMA, VENUES_SCHEMA, csv_to_arrow, read_arrow
+from train.src.search import cross_validate, search
+from train.src.utils import group_offsets, group_rows, prepare_datasets, save_quantized_pool, show_results
 
 logging.basicConfig(level=logging.INFO)
 
@@ -33,8 +38,8 @@ class training_pipeline:
         self._venues = venues
         # Create a logger object for logging messages:
         self._log = logging.getLogger("training_pipeline")
-        # Assign the number of folds to an instance attribute:
-        self._num_folds = num_folds
+        # Assign the number of folds to an instance attribute, it may come as a string from the environment:
+        self._num_folds = int(num_folds)
 
         # Get the S3 settings from the settings module:
         self._s3_settings = settings.s3
@@ -54,8 +59,11 @@ class training_pipeline:
         self._check_data(sessions)
         # Check if the venues data file exists and is valid:
         self._check_data(venues)
+        # Check if the new sessions data file of the warm start exists and is valid, if the warm start mode is on:
+        if self._train_settings.warm_start:
+            self._check_data(self._train_settings.warm_start)
 
-        # Create a CatBoostRanker object with the specified parameters:
+        # Create a CatBoostRanker object with the specified parameters, each fold trains a copy of it:
         self._ranker = CatBoostRanker(
             loss_function="YetiRank",
             iterations=4000,
@@ -75,6 +83,8 @@ class training_pipeline:
             bagging_temperature=2.0,
             depth=None,
         )
+        # The report of the hyperparameter search, if the search mode is on:
+        self._search_report = None
 
     def _check_data(self, s3_path) -> bool:
         """Check if the object exists in the S3 bucket.
@@ -97,18 +107,30 @@ class training_pipeline:
             self._log.info(f"The object '{s3_path}' exists.")
             return True
 
-    def _load_data(self, s3_path: str, local_folder: str) -> Path:
-        """Download the object from the S3 bucket to a local folder.
+    def _load_data(self, s3_path: str, local_folder: str, schema: pa.Schema) -> Path:
+        """Download the CSV object from the S3 bucket to a local folder and convert it into a typed Arrow file.
+
+        The Arrow file is a cache keyed on the ETag of the object, in a cache folder of its own: while the object
+        does not change, the next runs read the cached file instead of downloading and parsing the CSV object again.
 
         Arguments:
             s3_path -- The path of the object in the S3 bucket.
             local_folder -- The path of the local folder where to save the object.
+            schema -- The columns of the object to keep and their types, see `train.src.ingest`.
 
         Returns:
-            The path of the downloaded object in the local folder.
+            The path of the Arrow file in the local folder.
         """
         # Get the name of the object from the s3 path:
         name = str(Path(s3_path).name)
+        # Get the ETag of the object, which changes with its content:
+        etag = self._s3_client.head_object(Bucket=self._s3_settings.bucket, Key=s3_path)["ETag"].strip('"')
+        # Construct the path of the cache by joining the local folder, the cache folder of the object and the ETag:
+        cache_path = Path(f"{local_folder}/{name}.cache/{etag}.arrow")
+        # Return the cache if the object was already converted:
+        if cache_path.exists():
+            self._log.info(f"Data of '{s3_path}' found in the cache '{cache_path}'.")
+            return cache_path
         # Construct the local path by joining the local folder and the name:
         local_path = Path(f"{local_folder}/{name}")
         # Create the parent directories of the local path if they do not exist:
@@ -125,23 +147,30 @@ class training_pipeline:
         )
         # Log that the data loading is finished:
         self._log.info("Data loaded.")
-        # Return the local path of the downloaded object:
-        return local_path
+        # Convert the downloaded object into the cache, and delete the caches of its previous versions only:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        for previous in cache_path.parent.glob("*.arrow"):
+            previous.unlink(missing_ok=True)
+        csv_to_arrow(local_path, cache_path, schema)
+        # Delete the downloaded object:
+        local_path.unlink(missing_ok=True)
+        # Return the path of the cache:
+        return cache_path
 
-    def _train(self) -> NoReturn:
-        """Train a model to estimate the Mean Average Precision (MAP) metric on a dataset.
+    def _prepare_data(self) -> pd.DataFrame:
+        """Merge the sessions and venues data into the training data, sorted by session.
 
         Raises:
             ValueError: If the venues dataframe does not have unique IDs.
             ValueError: If the merge of the session and venues dataframes is unsuccessful.
 
         Returns:
-            None
+            The dataframe of the labels, the session IDs and the features of the venues of each session.
         """
 
-        # Load session and venue data from CSV files
-        df_sessions = pd.read_csv(self._sessions_local, low_memory=False, index_col=0)
-        df_venues = pd.read_csv(self._venues_local, low_memory=False, index_col=0)
+        # Load session and venue data from the typed Arrow files
+        df_sessions = read_arrow(self._sessions_local)
+        df_venues = read_arrow(self._venues_local)
 
         # Check if venue IDs are unique and raise error if not
         if df_venues["venue_id"].nunique() == df_venues.shape[0]:
@@ -165,22 +194,59 @@ class training_pipeline:
         del df_all["position_in_list"]
         del df_all["venue_id"]
         del df_all["has_seen_venue_in_this_session"]
+        return df_all
 
-        # Split sessions into training and validation sets using K-fold cross-validation
-        sessions = df_all["session_id"].unique()
-        cols_reduced = list(df_all.columns)
-        kf = KFold(n_splits=self._num_folds, shuffle=True, random_state=RANDOM_STATE)
+    def _train(self) -> NoReturn:
+        """Train a model to estimate the Mean Average Precision (MAP) metric on a dataset.
 
-        # Train and evaluate model on each fold of the cross-validation
-        results = []
-        for train, test in kf.split(sessions):
-            sessions_train = set(sessions[train])
-            sessions_test = set(sessions[test])
-            df_train = df_all[df_all["session_id"].isin(sessions_train)][cols_reduced]
-            df_test = df_all[df_all["session_id"].isin(sessions_test)][cols_reduced]
-            train_set, eval_set, names = prepare_datasets(df_train, df_test)
-            res = train_and_evaluate(train_set, eval_set, names, ranker=self._ranker)
-            results.append(res)
+        Raises:
+            ValueError: If the venues dataframe does not have unique IDs.
+            ValueError: If the merge of the session and venues dataframes is unsuccessful.
+
+        Returns:
+            None
+        """
+        # Load the training data
+        df_all = self._prepare_data()
+
+        # Quantize the whole data once for all the folds, or reuse the quantized data of a previous run on the same data,
+        # saved in a folder of its own for each pair of sessions and venues objects and keyed on their ETags
+        sessions_cache, venues_cache = self._sessions_local.parent, self._venues_local.parent
+        pool_folder = sessions_cache.parent.joinpath(f"{sessions_cache.stem}+{venues_cache.stem}.pool")
+        pool_path = pool_folder.joinpath(f"{self._sessions_local.stem}-{self._venues_local.stem}.bin")
+        if pool_path.exists():
+            self._log.info(f"Quantized data found in '{pool_path}'.")
+        else:
+            # Delete the quantized data of the previous versions of the same pair of objects only
+            pool_folder.mkdir(parents=True, exist_ok=True)
+            for previous in pool_folder.glob("*.bin"):
+                previous.unlink(missing_ok=True)
+            save_quantized_pool(df_all, pool_path)
+
+        # Index the range of rows of each session once, as the data is sorted by session
+        sessions, starts, ends = group_offsets(df_all["session_id"])
+
+        # Split sessions into training and validation sets using K-fold cross-validation, as the rows of the sessions
+        # of each set, which the folds slice from the quantized data
+        kf = KFold(n_splits=self._num_folds, shuffle=True, random_state=RANDOM_STATE)
+        folds = [(group_rows(starts, ends, train), group_rows(starts, ends, test)) for train, test in kf.split(sessions)]
+
+        # Train and evaluate a model of its own on each fold of the cross-validation, in parallel processes,
+        # with the parameters of the ranker or with the best ones of the hyperparameter search
+        params = self._ranker.get_params()
+        if self._train_settings.search:
+            self._search_report, results = search(
+                pool_path,
+                folds,
+                params,
+                self._train_settings.space,
+                self._train_settings.search,
+                self._train_settings.trials,
+                self._train_settings.workers,
+                seed=RANDOM_STATE,
+            )
+        else:
+            results = cross_validate(pool_path, folds, params, self._train_settings.workers)
 
         # Print the results of each fold and store the best model in the _best_ranker attribute
         show_results(results)
@@ -223,6 +289,76 @@ class training_pipeline:
         local_path.unlink(missing_ok=True)
         self._log.info("Local model deleted.")
 
+        # Save the report of the hyperparameter search next to the model, if the search mode is on.
+        if self._search_report is not None:
+            report_path = local_path.with_name(f"{local_path.stem}.search.json")
+            report_path.write_text(json.dumps(self._search_report, indent=2))
+            s3_path = f"{self._s3_settings.folder}/{Path(self._s3_settings.weights).stem}.search.json"
+            self._s3_client.upload_file(str(report_path), bucket_name, s3_path)
+            self._log.info(f"Search report saved to s3 path {s3_path}")
+            report_path.unlink(missing_ok=True)
+
+    def _warm_start(self, local_folder: str) -> bool:
+        """Continue boosting the deployed model on the new sessions only, and keep it if it does not regress.
+
+        The new sessions are split into train, eval and holdout sessions: the boosting continues on the train
+        sessions with early stopping on the eval ones, then the deployed and the continued models are compared
+        on the holdout sessions, which neither of them was trained or stopped on.
+
+        Args:
+            local_folder (str): The path to the local folder where the deployed model will be downloaded.
+
+        Raises:
+            ValueError: If the venues dataframe does not have unique IDs.
+            ValueError: If the merge of the session and venues dataframes is unsuccessful.
+
+        Returns:
+            True if the continued model hits at least the MAP@10 of the deployed model on the holdout sessions,
+            False otherwise or if there are too few new sessions to split them.
+        """
+        # Load the new sessions, merged with the venues.
+        df_all = self._prepare_data()
+
+        # Check that each of the holdout, the eval and the train parts gets at least one of the new sessions.
+        sessions, starts, ends = group_offsets(df_all["session_id"])
+        size = max(int(len(sessions) * self._train_settings.holdout), 1)
+        if len(sessions) < 2 * size + 1:
+            self._log.warning(f"Only {len(sessions)} new sessions, too few to split them, the warm start is skipped.")
+            return False
+
+        # Download the deployed model from the S3 path the models are saved to.
+        s3_path = f"{self._s3_settings.folder}/{self._s3_settings.weights}"
+        deployed_path = Path(local_folder).joinpath(f"deployed-{Path(self._s3_settings.weights).name}")
+        self._s3_client.download_file(self._s3_settings.bucket, s3_path, str(deployed_path))
+        deployed = CatBoostRanker()
+        deployed.load_model(str(deployed_path))
+        deployed_path.unlink(missing_ok=True)
+        self._log.info(f"Deployed model loaded from s3 path {s3_path}")
+
+        # Split the new sessions at random into the holdout, the eval and the train sessions.
+        order = np.random.default_rng(int(RANDOM_STATE)).permutation(len(sessions))
+        holdout, evaluation, train = (np.sort(part) for part in np.split(order, [size, 2 * size]))
+        df_train, df_eval, df_holdout = (
+            df_all.iloc[group_rows(starts, ends, part)] for part in [train, evaluation, holdout]
+        )
+        train_set, eval_set, _ = prepare_datasets(df_train, df_eval)
+        holdout_set, _, _ = prepare_datasets(df_holdout)
+        self._log.info(f"Warm start on {len(train)} new sessions, {len(evaluation)} eval and {len(holdout)} holdout.")
+
+        # Continue boosting the deployed model with the parameters of the ranker.
+        ranker = CatBoostRanker(**{**self._ranker.get_params(), "iterations": self._train_settings.warm_iterations})
+        ranker.fit(train_set, eval_set=eval_set, init_model=deployed)
+
+        # Compare the deployed and the continued models on the holdout sessions.
+        before = deployed.eval_metrics(holdout_set, ["MAP:top=10"])["MAP:top=10"][-1]
+        after = ranker.eval_metrics(holdout_set, ["MAP:top=10"])["MAP:top=10"][-1]
+        self._log.info(f"Holdout MAP@10 {before:.3f} for the deployed model, {after:.3f} for the continued model.")
+        if after < before:
+            self._log.warning("The continued model regresses on the holdout sessions, the deployed model is kept.")
+            return False
+        self._best_ranker = ranker
+        return True
+
     def run(self, local_folder: str = "/opt"):
         """Runs the full training and saving process.
 
@@ -235,9 +371,19 @@ class training_pipeline:
         Returns:
             None
         """
+        # Continue training the deployed model on the new sessions only, and save it unless it regresses.
+        if self._train_settings.warm_start:
+            self._sessions_local = self._load_data(
+                s3_path=self._train_settings.warm_start, local_folder=local_folder, schema=SESSIONS_SCHEMA
+            )
+            self._venues_local = self._load_data(s3_path=self._venues, local_folder=local_folder, schema=VENUES_SCHEMA)
+            if self._warm_start(local_folder):
+                self._save()
+            return
+
         # Load the sessions and venues data.
-        self._sessions_local = self._load_data(s3_path=self._sessions, local_folder=local_folder)
-        self._venues_local = self._load_data(s3_path=self._venues, local_folder=local_folder)
+        self._sessions_local = self._load_data(s3_path=self._sessions, local_folder=local_folder, schema=SESSIONS_SCHEMA)
+        self._venues_local = self._load_data(s3_path=self._venues, local_folder=local_folder, schema=VENUES_SCHEMA)
 
         # Train the model.
         self._train()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# coding: utf-8
+import itertools
+import logging
+import math
+import random
+import statistics
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from train.src.utils import calculate_params, fold_budget, train_fold
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("train.search")
+
+# The strategies of the hyperparameter search:
+STRATEGIES = ("grid", "random", "halving")
+# The number of other trials which must have reached a fold before a trial is compared to them there:
+MIN_PEERS = 3
+# The part of the parameter sets kept by each rung of the successive halving, and the factor of their iterations:
+ETA = 3
+
+
+def cross_validate(
+    pool_path: Path,
+    folds: list,
+    params: dict,
+    workers: Optional[int] = None,
+) -> list:
+    """Train and evaluate a model of its own on each fold of the cross-validation, in parallel processes.
+
+    Arguments:
+        pool_path -- the path of the quantized Pool object of the whole dataset, see `save_quantized_pool`.
+        folds -- a list of tuples of the train and test rows of each fold, see `train_fold`.
+        params -- a dictionary of the parameters of the CatBoostRanker model, as returned by `get_params`.
+
+    Keyword Arguments:
+        workers -- the number of folds trained at the same time, as many as the folds and the cores allow if None. (default: {None})
+
+    Returns:
+        a list of the results of each fold, in the order of the folds, see `train_and_evaluate`.
+    """
+    return _evaluate(pool_path, folds, [{}], params, workers, prune=False)[0]["results"]
+
+
+def search(
+    pool_path: Path,
+    folds: list,
+    params: dict,
+    space: dict,
+    strategy: str,
+    trials: int = 20,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> Tuple[dict, list]:
+    """Search the parameters of the CatBoostRanker model with the best mean MAP@10 over the folds of the cross-validation.
+
+    The trials run concurrently, each fold of a trial in a process of its own. A trial is pruned after a fold when
+    its mean MAP@10 over the folds so far is below the median of the other trials which reached that fold.
+
+    Arguments:
+        pool_path -- the path of the quantized Pool object of the whole dataset, see `save_quantized_pool`.
+        folds -- a list of tuples of the train and test rows of each fold, see `train_fold`.
+        params -- a dictionary of the base parameters of the CatBoostRanker model, as returned by `get_params`.
+        space -- a dictionary of the values tried for each parameter, overriding the base parameters.
+        strategy -- 'grid' to try all the parameter sets of the space, 'random' to try `trials` of them,
+            'halving' to try `trials` of them with growing iterations, keeping the best third at each rung.
+
+    Keyword Arguments:
+        trials -- the number of parameter sets sampled from the space by the random search and the halving. (default: {20})
+        workers -- the number of folds trained at the same time, as many as the trials and the cores allow if None. (default: {None})
+        seed -- the seed of the sampling of the parameter sets. (default: {None})
+
+    Raises:
+        ValueError: if the strategy is unknown or the space is empty.
+
+    Returns:
+        a tuple of (report, results), where report is a dictionary of the best parameters, their MAP@10 statistics
+        and all the trials, and results is the list of the results of each fold of the best parameters.
+    """
+    # Check the strategy and the space:
+    if strategy not in STRATEGIES:
+        raise ValueError(f"The search strategy should be one of {STRATEGIES}, but it is '{strategy}'!")
+    if not space:
+        raise ValueError("The search space should have at least one parameter, but it is empty!")
+
+    # List all the parameter sets of the space, and sample some of them unless all are tried:
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    configs = grid if strategy == "grid" else random.Random(seed).sample(grid, min(trials, len(grid)))
+    log.info(f"Searching {len(configs)} of {len(grid)} parameter sets with the {strategy} strategy.")
+
+    # Evaluate the parameter sets, with growing iterations for the successive halving:
+    if strategy == "halving":
+        records = []
+        rungs = max(math.floor(math.log(len(configs), ETA)), 0)
+        for rung in range(rungs + 1):
+            # Give each rung a share of the iterations, the last one all of them:
+            iterations = max(params["iterations"] // ETA ** (rungs - rung), 1)
+            evaluated = _evaluate(pool_path, folds, configs, {**params, "iterations": iterations}, workers, prune=True)
+            records += evaluated
+            # Keep the best parameter sets for the next rung:
+            completed = sorted(_completed(evaluated), key=lambda record: _mean_score(record["results"]), reverse=True)
+            configs = [record["params"] for record in completed[: max(math.ceil(len(configs) / ETA), 1)]]
+            log.info(f"Rung {rung + 1} of {rungs + 1} with {iterations} iterations kept {len(configs)} parameter sets.")
+        final = evaluated
+    else:
+        records = final = _evaluate(pool_path, folds, configs, params, workers, prune=True)
+
+    # Select the best parameter set among the ones evaluated on all the folds at the end:
+    best = max(_completed(final), key=lambda record: _mean_score(record["results"]))
+    scores = [_map_10(result) for result in best["results"]]
+    mean, std_dev = calculate_params(scores)
+    log.info(f"Best parameter set {best['params']} hit MAP@10 mean = {mean:.3f}, std_dev = {std_dev:.3f}")
+    # Keep the trained models of the best parameter set only:
+    for record in records:
+        if record is not best:
+            for result in record["results"]:
+                result.pop("model", None)
+
+    # Report the best parameter set and all the trials:
+    report = {
+        "strategy": strategy,
+        "best": {"params": best["params"], "mean": mean, "std_dev": std_dev, "scores": scores},
+        "trials": [
+            {
+                "params": record["params"],
+                "iterations": record["iterations"],
+                "scores": [_map_10(result) for result in record["results"]],
+                "pruned": record["pruned"],
+            }
+            for record in records
+        ],
+    }
+    return report, best["results"]
+
+
+def _evaluate(pool_path: Path, folds: list, configs: list, params: dict, workers: Optional[int], prune: bool) -> list:
+    # train the folds of all the parameter sets in parallel processes, and prune the weak trials if there are enough
+    # trials to compare, which trains the folds of a trial one after the other instead of all at the same time
+    prune = prune and len(configs) > MIN_PEERS
+    workers, thread_count = fold_budget(len(configs) if prune else len(configs) * len(folds), workers)
+    log.info(f"Training {len(configs)} x {len(folds)} folds, {workers} at a time with {thread_count} threads each.")
+    records = [
+        {"params": config, "iterations": params["iterations"], "results": [None] * len(folds), "pruned": False}
+        for config in configs
+    ]
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def submit(record: dict, fold: int) -> None:
+            # train a fold of the trial, with the parameters of the trial overriding the base ones
+            train_rows, test_rows = folds[fold]
+            future = executor.submit(
+                train_fold, pool_path, train_rows, test_rows, {**params, **record["params"]}, thread_count
+            )
+            pending[future] = record, fold
+
+        # Start with the first fold of every trial, so the trials are compared on the same folds, or with all of them:
+        for record in records:
+            for fold in range(1 if prune else len(folds)):
+                submit(record, fold)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record, fold = pending.pop(future)
+                record["results"][fold] = future.result()
+                if not prune or fold + 1 == len(folds):
+                    continue
+                if _is_weak(record, records):
+                    record["pruned"] = True
+                    record["results"] = record["results"][: fold + 1]
+                    log.info(f"Parameter set {record['params']} pruned after {fold + 1} folds.")
+                    continue
+                submit(record, fold + 1)
+    return records
+
+
+def _is_weak(record: dict, records: list) -> bool:
+    # whether the trial scores below the median of the other trials over the same folds
+    reached = _reached(record)
+    peers = [
+        _mean_score(other["results"][:reached])
+        for other in records
+        if other is not record and _reached(other) >= reached
+    ]
+    return len(peers) >= MIN_PEERS and _mean_score(record["results"][:reached]) < statistics.median(peers)
+
+
+def _reached(record: dict) -> int:
+    # the number of folds the trial was evaluated on, one after the other
+    return next((fold for fold, result in enumerate(record["results"]) if result is None), len(record["results"]))
+
+
+def _completed(records: list) -> list:
+    # the trials which were evaluated on all the folds
+    return [record for record in records if not record["pruned"]]
+
+
+def _mean_score(results: list) -> float:
+    # the mean MAP@10 of a trial over its folds so far
+    return float(np.mean([_map_10(result) for result in results]))
+
+
+def _map_10(result: dict) -> float:
+    # the best MAP@10 of a fold on its validation set
+    return result["best_score"]["validation"]["MAP:top=10"]
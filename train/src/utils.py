@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # coding: utf-8
 import logging
+import os
+from pathlib import Path
 from typing import NoReturn, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from catboost import CatBoostRanker, Pool
 from pandas import DataFrame
@@ -128,6 +131,115 @@ def train_and_evaluate(
     return results
 
 
+def fold_budget(num_folds: int, workers: Optional[int] = None) -> Tuple[int, int]:
+    """Split the CPU cores of the machine between the folds of the cross-validation trained in parallel.
+
+    Arguments:
+        num_folds -- the number of folds of the cross-validation.
+
+    Keyword Arguments:
+        workers -- the number of folds trained at the same time, as many as the folds and the cores allow if None. (default: {None})
+
+    Returns:
+        a tuple of two integers: the number of processes training the folds and the number of threads of each one.
+    """
+    # Count the cores the process may run on, which is less than the machine has in a container limited to some of them:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # Train at most one fold per core, and never more folds at the same time than there are:
+    workers = max(min(workers or cores, num_folds, cores), 1)
+    # Give each fold an equal share of the cores, so that folds x threads matches the cores:
+    return workers, max(cores // workers, 1)
+
+
+def group_offsets(group_ids: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Index the groups of rows sorted by group id, each group being a contiguous range of rows.
+
+    Arguments:
+        group_ids -- a pandas Series of the group id of each row, sorted so that the rows of a group are next to each other.
+
+    Returns:
+        a tuple of three arrays: the group ids in the order of the rows, and the first and past the last row of each group.
+    """
+    # A group starts at the first row and at every row with another group id than the previous row:
+    starts = np.flatnonzero(group_ids.ne(group_ids.shift()).to_numpy())
+    # A group ends where the next one starts, the last one at the last row:
+    ends = np.append(starts[1:], len(group_ids))
+    return group_ids.iloc[starts].to_numpy(), starts, ends
+
+
+def group_rows(starts: np.ndarray, ends: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Gather the rows of some groups from their ranges of rows, see `group_offsets`.
+
+    Arguments:
+        starts -- an array of the first row of each group.
+        ends -- an array of past the last row of each group.
+        groups -- an array of the positions of the groups to gather, in ascending order.
+
+    Returns:
+        a sorted array of the rows of the groups.
+    """
+    # Number the gathered rows from 0, then shift each group's numbers to the first row of the group:
+    lengths = ends[groups] - starts[groups]
+    shifts = starts[groups] - (np.cumsum(lengths) - lengths)
+    return np.arange(lengths.sum()) + np.repeat(shifts, lengths)
+
+
+def save_quantized_pool(dataset: DataFrame, pool_path: Path) -> NoReturn:
+    """Quantize the whole dataset into one Pool object and save it to disk.
+
+    The borders of the feature values are computed once for all the folds, which slice their train and eval sets
+    from the saved Pool instead of quantizing the same values again. The Pool is written next to its final path
+    and then renamed, so a reader never sees a partial file.
+
+    Arguments:
+        dataset -- a pandas DataFrame containing all the data with features, labels and group ids, sorted by group id.
+        pool_path -- the path of the file to save the quantized Pool object to.
+
+    Returns:
+        None
+    """
+    # Create a Pool object from the whole dataset and compute the borders of its features:
+    pool, _, _ = prepare_datasets(dataset)
+    pool.quantize()
+    # Save the quantized Pool object into a temporary file and replace the final file at once:
+    temporary = Path(f"{pool_path}.tmp")
+    pool.save(str(temporary))
+    os.replace(temporary, pool_path)
+    log.info(f"{pool.num_row()} rows quantized and saved to '{pool_path}'.")
+
+
+def train_fold(
+    pool_path: Path,
+    train_rows: np.ndarray,
+    test_rows: np.ndarray,
+    params: dict,
+    thread_count: int = -1,
+) -> dict:
+    """Train and evaluate a new CatBoostRanker model on one fold of the cross-validation.
+
+    The function is defined at the top level of the module, so that a process pool can run it for each fold in parallel.
+
+    Arguments:
+        pool_path -- the path of the quantized Pool object of the whole dataset, see `save_quantized_pool`.
+        train_rows -- a sorted array of the rows of the train data of the fold, which hold whole groups.
+        test_rows -- a sorted array of the rows of the test data of the fold, which hold whole groups.
+        params -- a dictionary of the parameters of the CatBoostRanker model, as returned by `get_params`.
+
+    Keyword Arguments:
+        thread_count -- the number of threads the model is trained with, all the cores if -1. (default: {-1})
+
+    Returns:
+        A dictionary containing the best score, the feature importances and the trained model, see `train_and_evaluate`.
+    """
+    # Load the quantized Pool object in the process training the fold and slice the sets of the fold from it:
+    pool = Pool(f"quantized://{pool_path}")
+    train_set, eval_set, names = pool.slice(train_rows), pool.slice(test_rows), pool.get_feature_names()
+    # Create a CatBoostRanker object of its own for the fold, limited to its share of the cores:
+    ranker = CatBoostRanker(**{**params, "thread_count": thread_count})
+    # Train and evaluate the model of the fold:
+    return train_and_evaluate(train_set, eval_set, names, ranker=ranker)
+
+
 def show_results(results: list[dict]) -> NoReturn:
     """Show the results of the cross-validation experiment.
 
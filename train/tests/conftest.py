@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# Point the pipeline to dummy object storage settings before it is imported, the tests stub the S3 client
+for name in ["ACCESS_KEY", "SECRET_KEY", "BUCKET", "URL", "FOLDER", "WEIGHTS"]:
+    os.environ.setdefault(f"MINIO_{name}", "unused")
+os.environ.setdefault("TRAIN_WEIGHTS", "weights.cbm")
+sys.path.insert(0, str(Path(__file__).absolute().parents[2]))
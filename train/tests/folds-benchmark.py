@@ -0,0 +1,72 @@
+import argparse
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+
+sys.path.insert(0, str(Path(__file__).absolute().parents[2]))
+
+from train.src.utils import group_offsets, group_rows  # noqa: E402
+
+# Parse the size of the synthetic data from the command line
+parser = argparse.ArgumentParser(description="Measure the splitting of the sessions data into cross-validation folds")
+parser.add_argument("--sessions", type=int, default=4_415, help="number of sessions, like in the current data")
+parser.add_argument("--rows", type=int, default=1_369_807, help="number of rows, like in the current data")
+parser.add_argument("--folds", type=int, default=5, help="number of cross-validation folds")
+parser.add_argument("--seed", type=int, default=21, help="seed of the random generator")
+args = parser.parse_args()
+rng = np.random.default_rng(args.seed)
+
+# Generate the merged data sorted by session, with the columns of the training data
+sizes = rng.multinomial(args.rows - args.sessions, np.full(args.sessions, 1 / args.sessions)) + 1
+session_ids = sorted(str(uuid.UUID(int=int(bits))) for bits in rng.integers(0, 2**63, args.sessions))
+df_all = pd.DataFrame({"session_id": np.repeat(np.array(session_ids, dtype=object), sizes)})
+df_all["purchased"] = (rng.random(args.rows) < 0.05).astype(int)
+for column in ["is_new_user", "is_from_order_again", "is_recommended"]:
+    df_all[column] = rng.random(args.rows) < 0.3
+for column in ["conversions_per_impression", "price_range", "rating", "popularity", "retention_rate"]:
+    df_all[column] = rng.random(args.rows).astype(np.float32)
+cols_reduced = list(df_all.columns)
+kf = KFold(n_splits=args.folds, shuffle=True, random_state=args.seed)
+
+
+def isin_folds() -> list:
+    # the previous way: hash the sessions of each set of each fold and copy their rows
+    sessions = df_all["session_id"].unique()
+    folds = []
+    for train, test in kf.split(sessions):
+        df_train = df_all[df_all["session_id"].isin(set(sessions[train]))][cols_reduced]
+        df_test = df_all[df_all["session_id"].isin(set(sessions[test]))][cols_reduced]
+        folds.append((df_train.index.to_numpy(), df_test.index.to_numpy()))
+    return folds
+
+
+def offset_folds() -> list:
+    # the current way: index the ranges of rows of the sessions once and gather the rows of each fold
+    sessions, starts, ends = group_offsets(df_all["session_id"])
+    return [(group_rows(starts, ends, train), group_rows(starts, ends, test)) for train, test in kf.split(sessions)]
+
+
+print(f"{args.rows} rows of {args.sessions} sessions, {args.folds} folds")
+folds = {}
+for name, split in {"isin": isin_folds, "offsets": offset_folds}.items():
+    # time the split, then trace its allocations in another call, as the tracing slows it down
+    started = time.perf_counter()
+    folds[name] = split()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    split()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    print(f"{name:>8}: {elapsed:.3f} s, peak allocations {peak:.0f} MiB")
+same = all(
+    np.array_equal(isin_rows, offset_rows)
+    for isin_fold, offset_fold in zip(folds["isin"], folds["offsets"])
+    for isin_rows, offset_rows in zip(isin_fold, offset_fold)
+)
+print(f"same rows: {same}")
@@ -0,0 +1,67 @@
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).absolute().parents[2]))
+
+from train.src.ingest import SESSIONS_SCHEMA, csv_to_arrow, read_arrow  # noqa: E402
+
+# Parse the sessions data and the synthetic scale from the command line
+parser = argparse.ArgumentParser(description="Measure the load time and the peak RSS of the sessions data")
+parser.add_argument("sessions", type=Path, help="path of the sessions CSV file")
+parser.add_argument("--scale", type=int, default=10, help="number of copies of the sessions in the synthetic data")
+parser.add_argument("--measure", choices=["csv", "convert", "arrow"], help=argparse.SUPPRESS)
+parser.add_argument("--arrow", type=Path, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def measure(load) -> None:
+    # run one way of loading in this process and print its time, its peak RSS and the size of the DataFrame
+    started = time.perf_counter()
+    df = load()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    size = df.memory_usage(deep=True).sum() / 2**20
+    print(f"{elapsed:.2f} s, peak RSS {peak:.0f} MiB, DataFrame {size:.0f} MiB, {len(df)} rows")
+
+
+# Measure one way of loading when called by the parent process below
+arrow_path = args.arrow
+if args.measure == "csv":
+    # the previous way: infer the types while parsing the whole text at once
+    measure(lambda: pd.read_csv(args.sessions, low_memory=False, index_col=0))
+    sys.exit()
+if args.measure == "convert":
+    # the first run: convert the CSV file block by block, then read the Arrow file
+    measure(lambda: (csv_to_arrow(args.sessions, arrow_path, SESSIONS_SCHEMA), read_arrow(arrow_path))[1])
+    sys.exit()
+if args.measure == "arrow":
+    # the next runs: read the cached Arrow file
+    measure(lambda: read_arrow(arrow_path))
+    sys.exit()
+
+# Generate the synthetic data, with the sessions copied under new session ids
+folder = Path(tempfile.mkdtemp(prefix="ingest-benchmark-"))
+synthetic = folder.joinpath("sessions.csv")
+for copy in range(args.scale):
+    for chunk in pd.read_csv(args.sessions, index_col=0, chunksize=1_000_000):
+        chunk["session_id"] = chunk["session_id"] + f"-{copy}"
+        chunk.to_csv(synthetic, mode="a", header=not synthetic.exists())
+
+# Measure each way of loading in a process of its own, so the peak RSS of one does not hide the others
+for name, path in [("current", args.sessions), (f"{args.scale}x synthetic", synthetic)]:
+    print(f"\n{name} sessions data, {path.stat().st_size / 2**20:.0f} MiB of CSV")
+    for way in ["csv", "convert", "arrow"]:
+        output = subprocess.run(
+            [sys.executable, __file__, str(path), "--measure", way, "--arrow", str(folder.joinpath(f"{name}.arrow"))],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        print(f"{way:>8}: {output.strip()}")
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import KFold
+
+from train.src.utils import group_offsets, group_rows
+
+
+@pytest.fixture
+def session_ids():
+    # sorted sessions of 1 to 20 rows, as the training data is sorted by session
+    sizes = np.random.default_rng(21).integers(1, 21, size=200)
+    return pd.Series(np.repeat([f"session-{session:03d}" for session in range(len(sizes))], sizes))
+
+
+def test_group_offsets(session_ids):
+    sessions, starts, ends = group_offsets(session_ids)
+    assert sessions.tolist() == session_ids.unique().tolist()
+    assert starts[0] == 0 and ends[-1] == len(session_ids) and (starts[1:] == ends[:-1]).all()
+    for session, start, end in zip(sessions, starts, ends):
+        assert (session_ids.iloc[start:end] == session).all()
+
+
+def test_group_rows_match_isin_split(session_ids):
+    sessions, starts, ends = group_offsets(session_ids)
+    for train, test in KFold(n_splits=5, shuffle=True, random_state=21).split(sessions):
+        for groups in (train, test):
+            expected = np.flatnonzero(session_ids.isin(sessions[groups]).to_numpy())
+            np.testing.assert_array_equal(group_rows(starts, ends, groups), expected)
+
+
+def test_group_rows_of_no_group(session_ids):
+    _, starts, ends = group_offsets(session_ids)
+    assert len(group_rows(starts, ends, np.array([], dtype=np.int64))) == 0
+
+
+def test_single_group():
+    sessions, starts, ends = group_offsets(pd.Series(["a"] * 3))
+    assert sessions.tolist() == ["a"] and starts.tolist() == [0] and ends.tolist() == [3]
+    assert group_rows(starts, ends, np.array([0])).tolist() == [0, 1, 2]
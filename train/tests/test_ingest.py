@@ -0,0 +1,70 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from train.src.ingest import SESSIONS_SCHEMA, VENUES_SCHEMA, csv_to_arrow, read_arrow
+
+
+@pytest.fixture
+def sessions_csv(tmp_path):
+    # the sessions data as exported, with an unnamed index column and the bools written by pandas
+    path = tmp_path.joinpath("sessions.csv")
+    pd.DataFrame(
+        {
+            "purchased": [True, False, False] * 200,
+            "session_id": [f"session-{row // 3}" for row in range(600)],
+            "position_in_list": list(range(3)) * 200,
+            "venue_id": [2**40 + row for row in range(600)],
+            "has_seen_venue_in_this_session": [False, True, False] * 200,
+            "is_new_user": [True] * 600,
+            "is_from_order_again": [False] * 600,
+            "is_recommended": [True, False] * 300,
+        }
+    ).to_csv(path)
+    return path
+
+
+def test_round_trip(sessions_csv, tmp_path):
+    arrow_path = tmp_path.joinpath("sessions.arrow")
+    # small blocks, so the file is converted in several batches
+    assert csv_to_arrow(sessions_csv, arrow_path, SESSIONS_SCHEMA, block_size=4096) == 600
+    df = read_arrow(arrow_path)
+    expected = pd.read_csv(sessions_csv, index_col=0)
+    assert list(df.columns) == SESSIONS_SCHEMA.names
+    assert df.dtypes.astype(str).to_dict() == {
+        "purchased": "bool",
+        "session_id": "object",
+        "position_in_list": "int32",
+        "venue_id": "int64",
+        "has_seen_venue_in_this_session": "bool",
+        "is_new_user": "bool",
+        "is_from_order_again": "bool",
+        "is_recommended": "bool",
+    }
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    # the temporary file is renamed over the final one
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["sessions.arrow", "sessions.csv"]
+
+
+def test_round_trip_of_missing_values(tmp_path):
+    csv_path, arrow_path = tmp_path.joinpath("venues.csv"), tmp_path.joinpath("venues.arrow")
+    csv_path.write_text(
+        ",venue_id,conversions_per_impression,price_range,rating,popularity,retention_rate\n"
+        "0,1,0.5,2,,0.25,0.75\n"
+        "1,2,0.125,1,8.5,0.5,\n"
+    )
+    csv_to_arrow(csv_path, arrow_path, VENUES_SCHEMA)
+    df = read_arrow(arrow_path)
+    assert df["price_range"].dtype == "int8" and df["rating"].dtype == "float32"
+    assert df["rating"].isna().tolist() == [True, False] and df["retention_rate"].isna().tolist() == [False, True]
+    assert df["conversions_per_impression"].tolist() == [0.5, 0.125]
+
+
+def test_value_out_of_its_type(tmp_path):
+    csv_path, arrow_path = tmp_path.joinpath("venues.csv"), tmp_path.joinpath("venues.arrow")
+    csv_path.write_text(
+        ",venue_id,conversions_per_impression,price_range,rating,popularity,retention_rate\n0,1,0.5,1000,8.5,0.25,0.75\n"
+    )
+    with pytest.raises(pa.ArrowInvalid):
+        csv_to_arrow(csv_path, arrow_path, VENUES_SCHEMA)
+    assert not arrow_path.exists()
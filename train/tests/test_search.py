@@ -0,0 +1,45 @@
+from train.src.search import MIN_PEERS, _is_weak, _reached
+
+
+def record(*scores: float, folds: int = 3) -> dict:
+    # a trial evaluated on its first folds, the other folds not trained yet
+    results = [{"best_score": {"validation": {"MAP:top=10": score}}} for score in scores]
+    return {"params": {}, "results": results + [None] * (folds - len(scores)), "pruned": False}
+
+
+def test_reached():
+    assert [_reached(record(*[0.5] * folds)) for folds in range(4)] == [0, 1, 2, 3]
+
+
+def test_below_the_median_is_weak():
+    trial = record(0.2)
+    records = [trial] + [record(score) for score in (0.3, 0.4, 0.5)]
+    assert _is_weak(trial, records)
+
+
+def test_above_the_median_is_not_weak():
+    trial = record(0.45)
+    records = [trial] + [record(score) for score in (0.3, 0.4, 0.5)]
+    assert not _is_weak(trial, records)
+
+
+def test_too_few_peers_is_not_weak():
+    trial = record(0.1)
+    records = [trial] + [record(0.9) for _ in range(MIN_PEERS - 1)]
+    assert not _is_weak(trial, records)
+
+
+def test_peers_behind_are_not_compared():
+    # the peers which did not reach the second fold yet do not count
+    trial = record(0.2, 0.2)
+    records = [trial] + [record(0.9) for _ in range(MIN_PEERS)]
+    assert not _is_weak(trial, records)
+    records += [record(0.3, 0.3) for _ in range(MIN_PEERS)]
+    assert _is_weak(trial, records)
+
+
+def test_peers_ahead_are_compared_on_the_same_folds():
+    # the peers are compared on the folds the trial reached, not on their later folds
+    trial = record(0.5)
+    records = [trial] + [record(0.4, 0.9, 0.9) for _ in range(MIN_PEERS)]
+    assert not _is_weak(trial, records)
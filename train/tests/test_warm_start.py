@@ -0,0 +1,113 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRanker
+
+from train.src import ranker as ranker_module
+from train.src.ingest import SESSIONS_SCHEMA, VENUES_SCHEMA, csv_to_arrow
+from train.src.utils import prepare_datasets
+
+
+class StubS3Client:
+    """An S3 client serving the deployed model and counting its downloads."""
+
+    def __init__(self) -> None:
+        self.deployed = None
+        self.downloads = 0
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {"ETag": '"etag"'}
+
+    def download_file(self, bucket: str, key: str, path: str) -> None:
+        self.downloads += 1
+        shutil.copyfile(self.deployed, path)
+
+
+def write_data(folder, sessions: int) -> tuple:
+    # the new sessions of 10 venues each, and the venues, as typed Arrow files
+    rng = np.random.default_rng(21)
+    venues = pd.DataFrame(
+        {
+            "venue_id": np.arange(50),
+            "conversions_per_impression": rng.random(50),
+            "price_range": rng.integers(1, 4, 50),
+            "rating": rng.random(50) * 10,
+            "popularity": rng.random(50),
+            "retention_rate": rng.random(50),
+        }
+    )
+    venue_ids = rng.integers(0, 50, sessions * 10)
+    df_sessions = pd.DataFrame(
+        {
+            "purchased": venues["conversions_per_impression"].to_numpy()[venue_ids] > 0.8,
+            "session_id": np.repeat([f"session-{session}" for session in range(sessions)], 10),
+            "position_in_list": np.tile(np.arange(10), sessions),
+            "venue_id": venue_ids,
+            "has_seen_venue_in_this_session": False,
+            "is_new_user": np.repeat(rng.random(sessions) > 0.5, 10),
+            "is_from_order_again": rng.random(sessions * 10) > 0.9,
+            "is_recommended": rng.random(sessions * 10) > 0.7,
+        }
+    )
+    paths = []
+    for name, df, schema in [("sessions", df_sessions, SESSIONS_SCHEMA), ("venues", venues, VENUES_SCHEMA)]:
+        df.to_csv(folder.joinpath(f"{name}.csv"))
+        paths.append(folder.joinpath(f"{name}.arrow"))
+        csv_to_arrow(folder.joinpath(f"{name}.csv"), paths[-1], schema)
+    return paths
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = StubS3Client()
+    monkeypatch.setattr(ranker_module.boto3, "client", lambda *args, **kwargs: client)
+    return client
+
+
+def pipeline(tmp_path, client, monkeypatch, sessions: int):
+    monkeypatch.setattr(ranker_module.settings.train, "warm_iterations", 20)
+    # the continued model writes its training logs in the working folder
+    monkeypatch.chdir(tmp_path)
+    pipeline = ranker_module.training_pipeline("data/sessions.csv", "data/venues.csv")
+    pipeline._sessions_local, pipeline._venues_local = write_data(tmp_path, sessions)
+    # the deployed model, trained on the same features
+    train_set, _, _ = prepare_datasets(pipeline._prepare_data())
+    deployed = CatBoostRanker(iterations=10, random_state=21, logging_level="Silent", allow_writing_files=False)
+    deployed.fit(train_set)
+    client.deployed = tmp_path.joinpath("deployed.cbm")
+    deployed.save_model(str(client.deployed))
+    return pipeline
+
+
+def holdout_maps(monkeypatch, deployed: float, continued: float) -> None:
+    # the MAP@10 on the holdout sessions of the deployed model, of 10 trees, and of the continued model
+    def eval_metrics(self, data, metrics, *args, **kwargs):
+        return {"MAP:top=10": [deployed if self.tree_count_ == 10 else continued]}
+
+    monkeypatch.setattr(CatBoostRanker, "eval_metrics", eval_metrics)
+
+
+def test_too_few_sessions_skip_the_warm_start(tmp_path, client, monkeypatch):
+    # 2 sessions cannot give each of the train, eval and holdout parts one session
+    assert not pipeline(tmp_path, client, monkeypatch, sessions=2)._warm_start(str(tmp_path))
+    assert client.downloads == 0
+
+
+@pytest.mark.parametrize("continued", [0.5, 0.6])
+def test_continued_model_is_kept(tmp_path, client, monkeypatch, continued):
+    holdout_maps(monkeypatch, deployed=0.5, continued=continued)
+    warm = pipeline(tmp_path, client, monkeypatch, sessions=40)
+    assert warm._warm_start(str(tmp_path))
+    assert client.downloads == 1
+    # the boosting continued from the trees of the deployed model
+    assert warm._best_ranker.tree_count_ > 10
+    assert list(tmp_path.glob("deployed-*")) == []
+
+
+def test_regressing_model_is_rejected(tmp_path, client, monkeypatch):
+    holdout_maps(monkeypatch, deployed=0.5, continued=0.4)
+    warm = pipeline(tmp_path, client, monkeypatch, sessions=40)
+    assert not warm._warm_start(str(tmp_path))
+    assert not hasattr(warm, "_best_ranker")